@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+from ingest import HERE, RESULTS_DIR, load_results
+from ht_cont_comparison import compute_likert_stats, paired_t_test
+from scores_stats import significance_between_modes
+from plots import figure_jobs, render_figures
+from resampling import print_report, study_resampling
+
+# Full, non-interactive analysis of the user study: loads every participant file into the results
+# table, writes it as CSV, computes all statistics from it (t-tests and the resampling based
+# alternatives) into stats.json and renders every figure to the output directory.
+
+
+def compute_statistics(results, alpha=0.05):
+    stats = {"scores": {}, "likert": {}, "paired": {}}
+    for round_name in results.measures(kind="score"):
+        hand_tracking = results.values(round_name, "hand_tracking")[1]
+        controllers = results.values(round_name, "controllers")[1]
+        max_score = float(results["max_score"][results.mask(measure=round_name)][0])
+        t, p, significant = significance_between_modes(hand_tracking, max_score, controllers, max_score, alpha)
+        print(f"{round_name.capitalize()} modes comparison: t = {t:.3f}, p = {p:.3f}, significant? {significant}")
+        stats["scores"][round_name] = {
+            "max_score": max_score,
+            "hand_tracking_mean_pct": float(hand_tracking.mean() / max_score * 100),
+            "controllers_mean_pct": float(controllers.mean() / max_score * 100),
+            "welch_t": float(t), "p": float(p), "significant": bool(significant)
+        }
+
+    for measure in results.measures(kind="likert"):
+        conditions = results.conditions(measure)
+        stats["likert"][measure] = {}
+        for condition in conditions:
+            mean, half_width = compute_likert_stats(results.values(measure, condition)[1], f"{measure} ({condition})")
+            stats["likert"][measure][condition] = {"mean": float(mean), "ci95": float(half_width)}
+        if len(conditions) == 2:
+            t, p = paired_t_test(*results.paired(measure, *conditions), conditions[0], conditions[1], alpha)
+            stats["paired"][measure] = {"t": float(t), "p": float(p), "significant": bool(p < alpha)}
+
+    stats["choices"] = {question: results.choice_counts(question)
+                        for question in dict.fromkeys(results.choices["question"])}
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full user study analysis")
+    parser.add_argument("--results", default=RESULTS_DIR, help="Folder of participant files and study.json")
+    parser.add_argument("--output", default=os.path.join(HERE, ".logs", "analysis"))
+    parser.add_argument("--workers", type=int, default=None, help="Processes rendering figures")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--resamples", type=int, default=100_000, help="Bootstrap / Monte Carlo permutation resamples")
+    parser.add_argument("--no-figures", action="store_true")
+    args = parser.parse_args()
+
+    results = load_results(args.results)
+    os.makedirs(args.output, exist_ok=True)
+    results.to_csv(os.path.join(args.output, "results.csv"))
+    statistics = compute_statistics(results, args.alpha)
+    statistics["resampling"] = study_resampling(results, resamples=args.resamples)
+    print_report(statistics["resampling"])
+    with open(os.path.join(args.output, "stats.json"), 'w') as f:
+        json.dump(statistics, f, indent=2)
+    if not args.no_figures:
+        figures_dir = os.path.join(args.output, "figures")
+        os.makedirs(figures_dir, exist_ok=True)
+        paths = render_figures(figure_jobs(results, figures_dir), args.workers)
+        print(f"{len(paths)} figures written to {figures_dir}")
+    print(f"Analysis written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,6 @@
 from scipy import stats
 import numpy as np
-
-false_negatives_hand_tracking = np.array([0, -1, 1, 1, 1, -1, 1, 2, -1])
-false_negatives_controllers   = np.array([-2, -2, -2, -2, -2, -2, -2, -2, -2])
-presence_hand_tracking        = np.array([2, 2, 2, 1, 0, 2, 2, 1, 2])
-presence_controllers          = np.array([-1, 2, 0, 0, 2, -1, 0, 0, 2])
+from ingest import load_results
 
 def paired_t_test(a, b, label_a, label_b, alpha=0.05):
     """
@@ -32,14 +28,13 @@ def compute_likert_stats(data, label, ci=0.95):
     return mean, h
 
 if __name__ == "__main__":
-    compute_likert_stats(false_negatives_hand_tracking, "False Neg. Hand Tracking")
-    compute_likert_stats(false_negatives_controllers,   "False Neg. Controllers")
-    compute_likert_stats(presence_hand_tracking,        "Presence Hand Tracking")
-    compute_likert_stats(presence_controllers,          "Presence Controllers")
+    results = load_results()
+    labels = {"hand_tracking": "Hand Tracking", "controllers": "Controllers"}
+    for measure, name in (("false_negatives", "False Neg."), ("presence", "Presence")):
+        for condition, label in labels.items():
+            compute_likert_stats(results.values(measure, condition)[1], f"{name} {label}")
 
     # Paired t-tests
-    paired_t_test(false_negatives_hand_tracking, false_negatives_controllers,
-                  "False Neg. Hand Tracking", "False Neg. Controllers")
-    paired_t_test(presence_hand_tracking, presence_controllers,
-                  "Presence Hand Tracking", "Presence Controllers")
-    
\ No newline at end of file
+    for measure, name in (("false_negatives", "False Neg."), ("presence", "Presence")):
+        paired_t_test(*results.paired(measure, "hand_tracking", "controllers"),
+                      f"{name} Hand Tracking", f"{name} Controllers")
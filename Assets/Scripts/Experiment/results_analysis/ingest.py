@@ -0,0 +1,140 @@
+import glob
+import json
+import os
+import numpy as np
+
+# Loading of the user study results into one columnar table
+#
+# Every participant has a JSON file in results/ (P01.json, ...) holding their round scores and
+# Likert answers per condition and their easiest / most engaging gesture choices. study.json in
+# the same folder points at the rounds.json the game was played with, whose block counts give the
+# maximum score of each round, and lists the scale of every Likert statement. All answers are
+# stored centred on 0 (-2..2) so statements asked on different scales can be compared.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "results")
+
+
+def round_max_scores(rounds_path: str) -> dict:
+    """
+    Maximum score of each round: one point per block in its sequence.
+    """
+    with open(rounds_path, 'r') as f:
+        rounds = json.load(f)
+    return {name.lower(): len(level["sequence"]) for name, level in rounds.items()}
+
+
+def load_study(results_dir: str = RESULTS_DIR) -> dict:
+    path = os.path.join(results_dir, "study.json")
+    study = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            study = json.load(f)
+    rounds_path = os.path.normpath(os.path.join(results_dir, study.get("rounds", os.path.join("..", "..", "rounds.json"))))
+    max_scores = round_max_scores(rounds_path)
+    max_scores.update(study.get("max_scores", {}))
+    scales = {"default": [-2, 2]}
+    scales.update(study.get("likert_scales", {}))
+    return {"max_scores": max_scores, "likert_scales": scales}
+
+
+class ResultsTable:
+    """
+    Long-format table of numpy columns with one row per (participant, condition, measure):
+    participant, condition, measure, kind ("score" or "likert"), value, max_score and percentage
+    (NaN for Likert rows). Gesture choices are kept in a second table with the columns
+    participant, question, rank and choice.
+    """
+    def __init__(self, columns: dict, choices: dict):
+        self.columns = columns
+        self.choices = choices
+
+    def __len__(self):
+        return self.columns["value"].shape[0]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def mask(self, **filters) -> np.ndarray:
+        selected = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            selected &= self.columns[name] == value
+        return selected
+
+    def measures(self, kind: str = None) -> list:
+        measures = self.columns["measure"] if kind is None else self.columns["measure"][self.mask(kind=kind)]
+        return list(dict.fromkeys(measures))
+
+    def conditions(self, measure: str) -> list:
+        return list(dict.fromkeys(self.columns["condition"][self.mask(measure=measure)]))
+
+    def values(self, measure: str, condition: str, column: str = "value") -> (np.ndarray, np.ndarray):
+        """
+        (participants, values) of one measure under one condition, ordered by participant.
+        """
+        selected = self.mask(measure=measure, condition=condition)
+        participants = self.columns["participant"][selected]
+        order = np.argsort(participants, kind='stable')
+        return participants[order], self.columns[column][selected][order]
+
+    def paired(self, measure: str, condition_a: str, condition_b: str, column: str = "value") -> (np.ndarray, np.ndarray):
+        """
+        Values of a measure under two conditions for the participants who have both, aligned by participant.
+        """
+        participants_a, values_a = self.values(measure, condition_a, column)
+        participants_b, values_b = self.values(measure, condition_b, column)
+        _, index_a, index_b = np.intersect1d(participants_a, participants_b, return_indices=True)
+        return values_a[index_a], values_b[index_b]
+
+    def choice_counts(self, question: str) -> dict:
+        choices = self.choices["choice"][self.choices["question"] == question]
+        names, counts = np.unique(choices, return_counts=True)
+        return dict(zip(names.tolist(), counts.tolist()))
+
+    def to_csv(self, path: str):
+        names = list(self.columns)
+        with open(path, 'w') as f:
+            f.write(",".join(names) + "\n")
+            for row in zip(*(self.columns[name] for name in names)):
+                f.write(",".join("" if isinstance(v, float) and np.isnan(v) else str(v) for v in row) + "\n")
+
+
+def load_results(results_dir: str = RESULTS_DIR) -> ResultsTable:
+    """
+    Reads every participant file of results_dir into a ResultsTable.
+    """
+    study = load_study(results_dir)
+    max_scores, scales = study["max_scores"], study["likert_scales"]
+    rows = {name: [] for name in ("participant", "condition", "measure", "kind", "value", "max_score")}
+    choices = {name: [] for name in ("participant", "question", "rank", "choice")}
+
+    def add(participant, condition, measure, kind, value, max_score):
+        for name, item in zip(rows, (participant, condition, measure, kind, value, max_score)):
+            rows[name].append(item)
+
+    paths = sorted(glob.glob(os.path.join(results_dir, "*.json")))
+    for path in paths:
+        if os.path.basename(path) == "study.json":
+            continue
+        with open(path, 'r') as f:
+            result = json.load(f)
+        participant = result.get("participant", os.path.splitext(os.path.basename(path))[0])
+        for condition, scores in result.get("scores", {}).items():
+            for round_name, score in scores.items():
+                if round_name not in max_scores:
+                    raise ValueError(f"{path}: round {round_name!r} is not defined in rounds.json or study.json")
+                add(participant, condition, round_name, "score", score, max_scores[round_name])
+        for condition, answers in result.get("likert", {}).items():
+            for measure, answer in answers.items():
+                low, high = scales.get(measure, scales["default"])
+                add(participant, condition, measure, "likert", answer - (low + high) / 2, np.nan)
+        for question, selected in result.get("choices", {}).items():
+            for rank, choice in enumerate(selected):
+                for name, item in zip(choices, (participant, question, rank, choice)):
+                    choices[name].append(item)
+
+    columns = {name: np.array(rows[name], dtype=object if name in ("participant", "condition", "measure", "kind")
+                              else np.float64) for name in rows}
+    columns["percentage"] = columns["value"] / columns["max_score"] * 100
+    choice_columns = {name: np.array(choices[name], dtype=np.int64 if name == "rank" else object) for name in choices}
+    return ResultsTable(columns, choice_columns)
@@ -1,6 +1,25 @@
+import argparse
+import itertools
+import multiprocessing
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from ingest import HERE, load_results
+
+# Figures are drawn with the Agg backend in worker processes and saved to files, each worker
+# receiving only the arrays of its figure.
+
+CONDITION_LABELS = {"hand_tracking": "Hand\nTracking", "controllers": "Controller"}
+MEASURE_LABELS = {
+    "false_negatives": "Unrecognized Inputs (False Negatives)",
+    "presence": "Presence",
+    "false_positives": "Phantom Inputs",
+    "naturalness": "Naturalness",
+    "learnability": "Learnability",
+    "engagement": "Engagement",
+    "ease_of_use": "Ease of Use"
+}
+QUESTION_LABELS = {"easiest": "Easiest", "most_engaging": "Most Engaging"}
 
 # -----------------------
 # Helpers
@@ -26,156 +45,137 @@ def parse_gestures(data_list):
         all_g.extend(g.strip() for g in entry.split(','))
     return all_g
 
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
 # -----------------------
 # Plotting functions
 # -----------------------
-def plot_boxplot(data, labels, title, xlabel="Percentage Score", xlim=(0,100)):
+def plot_boxplot(path, data, labels, title, xlabel="Percentage Score", xlim=(0,100)):
+    plt = _pyplot()
     plt.figure(figsize=(8, 6))
-    plt.boxplot(data, labels=labels, vert=False)
+    try:
+        plt.boxplot(data, orientation='horizontal')
+    except TypeError:
+        # Matplotlib < 3.10
+        plt.boxplot(data, vert=False)
+    plt.yticks(np.arange(1, len(labels) + 1), labels)
     plt.xlabel(xlabel)
     plt.title(title)
     plt.xlim(*xlim)
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
-
-def plot_easy_medium_modes():
-    # ...existing code for easy and medium scores, using calculate_percentages & plot_boxplot...
-    easy_ht_scores = [34,34,33,31,33,35,28,32,27]
-    easy_cont_scores = [37,37,36,37,37,36,37,35,37]
-    easy_max = 37
-    e_ht_pct = calculate_percentages(easy_ht_scores, easy_max)
-    e_ct_pct = calculate_percentages(easy_cont_scores, easy_max)
-    plot_boxplot([e_ht_pct, e_ct_pct],
-                 labels=['Hand\nTracking','Controller'],
-                 title='Percentage Score for Easy Mode')
-
-    # medium
-    medium_ht_scores = [33,46,39,41,45,46,34,41,39]
-    medium_cont_scores = [42,54,51,50,49,52,53,43,48]
-    medium_max = 56
-    m_ht_pct = calculate_percentages(medium_ht_scores, medium_max)
-    m_ct_pct = calculate_percentages(medium_cont_scores, medium_max)
-    plot_boxplot([m_ht_pct, m_ct_pct],
-                 labels=['Hand\nTracking','Controller'],
-                 title='Percentage Score for Medium Mode')
-
-def plot_engagement_and_ease():
-    engagement = np.array([5,5,5,4,2,4,4,3,2]) - 3
-    ease      = np.array([4,2,2,1,1,1,2,1,1]) - 3
-    plot_boxplot([engagement], ['Engagement'], 
-                 title='Normalized Mean Likert Scores for Engagement',
-                 xlabel='Normalized Score', xlim=(-2,2))
-    plot_boxplot([ease], ['Ease of Use'], 
-                 title='Normalized Mean Likert Scores for Ease of Use',
-                 xlabel='Normalized Score', xlim=(-2,2))
-
-def plot_two_condition_metrics(show_error_bars=True):
-    fn_ht = np.array([0,-1,1,1,1,-1,1,2,-1])
-    fn_ct = np.array([-2,-2,-2,-2,-2,-2,-2,-2,-2])
-    pr_ht = np.array([2,2,2,1,0,2,2,1,2])
-    pr_ct = np.array([-1,2,0,0,2,-1,0,0,2])
-    labels = ['Hand Tracking','Controllers']
-
-    means_fn = [*mean_and_std(fn_ht)[:1], *mean_and_std(fn_ct)[:1]]
-    stds_fn  = [*mean_and_std(fn_ht)[1:], *mean_and_std(fn_ct)[1:]]
-    means_pr = [*mean_and_std(pr_ht)[:1], *mean_and_std(pr_ct)[:1]]
-    stds_pr  = [*mean_and_std(pr_ht)[1:], *mean_and_std(pr_ct)[1:]]
-
-    if show_error_bars:
-        lf, uf = clip_errors(means_fn, stds_fn)
-        yerr_fn = [lf, uf]
-        lp, up = clip_errors(means_pr, stds_pr)
-        yerr_pr = [lp, up]
-    else:
-        yerr_fn = yerr_pr = None
-
-    # chart 1
-    fig, ax = plt.subplots(figsize=(6,4))
-    x = np.arange(len(labels))
-    ax.bar(x, means_fn, yerr=yerr_fn, capsize=5 if show_error_bars else 0, color='#1f77b4')
-    ax.set(xticks=x, xticklabels=labels, ylabel='Mean Likert (-2,2)',
-           title='Unrecognized Inputs (False Negatives)')
-    ax.axhline(0, color='k'); ax.set_ylim(-2.2,2.2)
-    plt.tight_layout(); plt.show()
-
-    # chart 2
-    fig, ax = plt.subplots(figsize=(6,4))
-    ax.bar(x, means_pr, yerr=yerr_pr, capsize=5 if show_error_bars else 0, color='#ff7f0e')
-    ax.set(xticks=x, xticklabels=labels, ylabel='Mean Likert (-2,2)', title='Presence')
-    ax.axhline(0, color='k'); ax.set_ylim(-2.2,2.2)
-    plt.tight_layout(); plt.show()
-
-def plot_single_condition_metrics(show_error_bars=True):
-    fp_ht = np.array([-2,-2,-1,0,-2,-1,-2,1,1])
-    nat_ht = np.array([1,2,1,1,2,0,2,2,2])
-    learn = np.array([2,2,1,-1,1,2,2,1,-2])
-
-    labels = ['Phantom Inputs','Naturalness','Learnability']
-    means = [*mean_and_std(fp_ht)[:1], *mean_and_std(nat_ht)[:1], *mean_and_std(learn)[:1]]
-    stds  = [*mean_and_std(fp_ht)[1:], *mean_and_std(nat_ht)[1:], *mean_and_std(learn)[1:]]
+    plt.savefig(path)
+    plt.close()
 
-    if show_error_bars:
-        lo, up = clip_errors(means, stds)
-        yerr = [lo, up]
-    else:
-        yerr = None
+def plot_likert_bars(path, groups, labels, title, color, show_error_bars=True, figsize=(6,4)):
+    """Mean Likert score of each group with sample-std error bars clipped to the scale."""
+    plt = _pyplot()
+    means = [mean_and_std(g)[0] for g in groups]
+    stds  = [mean_and_std(g)[1] for g in groups]
+    yerr = list(clip_errors(means, stds)) if show_error_bars else None
 
-    fig, ax = plt.subplots(figsize=(8,6))
+    fig, ax = plt.subplots(figsize=figsize)
     x = np.arange(len(labels))
-    ax.bar(x, means, yerr=yerr, capsize=5 if show_error_bars else 0, color='#2ca02c')
-    ax.set(xticks=x, xticklabels=labels, ylabel='Mean Likert (-2,2)',
-           title='Analysis of Phantom Inputs, Naturalness, and Learnability')
+    ax.bar(x, means, yerr=yerr, capsize=5 if show_error_bars else 0, color=color)
+    ax.set(xticks=x, xticklabels=labels, ylabel='Mean Likert (-2,2)', title=title)
     ax.axhline(0, color='k'); ax.set_ylim(-2.2,2.2)
-    plt.tight_layout(); plt.show()
-
-def plot_pose_gesture_comparison():
-    easiest_data = [
-        "Fist pose, Thumbs Up pose, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-        "Right swipe, Punch, Gun pose",
-        "Up swipe, Punch, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-        "Down swipe, Fist pose, Gun pose",
-        "Fist pose, Thumbs Up pose, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-    ]
-
-    engaging_data = [
-        "Punch, Thumbs Up pose, Gun pose",
-        "Fist pose, Thumbs Up pose, Gun pose",
-        "Right swipe, Punch, Gun pose",
-        "Left swipe, Punch, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-        "Fist pose, Thumbs Up pose, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-        "Punch, Thumbs Up pose, Gun pose",
-    ]
-    parsed_e = parse_gestures(easiest_data)
-    parsed_en= parse_gestures(engaging_data)
-    cnt_e  = Counter(parsed_e)
-    cnt_en = Counter(parsed_en)
-    all_gs = sorted(set(cnt_e)|set(cnt_en))
-    freq_e  = [cnt_e[g] for g in all_gs]
-    freq_en = [cnt_en[g] for g in all_gs]
+    plt.tight_layout(); fig.savefig(path); plt.close(fig)
 
+def plot_choice_frequencies(path, counts_by_question, title='Easiest vs Engaging Gestures'):
+    plt = _pyplot()
+    all_gs = sorted(set().union(*counts_by_question.values()))
     x = np.arange(len(all_gs))
-    w = 0.4
+    w = 0.8 / len(counts_by_question)
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
     fig, ax = plt.subplots(figsize=(10,6))
-    ax.bar(x - w/2, freq_e, width=w, label='Easiest', color='#1f77b4')
-    ax.bar(x + w/2, freq_en, width=w, label='Most Engaging', color='#ff7f0e')
-    ax.set(xticks=x, xticklabels=all_gs, xlabel='Gestures/Poses',
-           ylabel='Frequency', title='Easiest vs Engaging Gestures')
+    for i, (question, counts) in enumerate(counts_by_question.items()):
+        offset = (i - (len(counts_by_question) - 1) / 2) * w
+        ax.bar(x + offset, [counts.get(g, 0) for g in all_gs], width=w,
+               label=QUESTION_LABELS.get(question, question), color=colors[i % len(colors)])
+    ax.set(xticks=x, xticklabels=all_gs, xlabel='Gestures/Poses', ylabel='Frequency', title=title)
     ax.legend(); plt.xticks(rotation=45, ha='right')
-    plt.tight_layout(); plt.show()
+    plt.tight_layout(); fig.savefig(path); plt.close(fig)
+
+_FIGURES = {
+    "boxplot": plot_boxplot,
+    "likert_bars": plot_likert_bars,
+    "choice_frequencies": plot_choice_frequencies
+}
+
+def _render(kind, path, args, kwargs):
+    _FIGURES[kind](path, *args, **kwargs)
+    return path
+
+# -----------------------
+# Figures of the study
+# -----------------------
+def figure_jobs(results, output_dir, show_error_bars=True):
+    """(kind, path, args, kwargs) of every figure, built from the results table."""
+    jobs = []
+    # Percentage score of each round per condition
+    for round_name in results.measures(kind="score"):
+        conditions = results.conditions(round_name)
+        jobs.append(("boxplot", os.path.join(output_dir, f"score_{round_name}.png"),
+                     ([results.values(round_name, c, "percentage")[1] for c in conditions],
+                      [CONDITION_LABELS.get(c, c) for c in conditions],
+                      f'Percentage Score for {round_name.capitalize()} Mode'), {}))
+
+    # Likert statements asked for both conditions get one bar chart each, those asked for hand
+    # tracking only are summarised in one chart
+    single, colors = [], itertools.cycle(['#1f77b4', '#ff7f0e'])
+    for measure in results.measures(kind="likert"):
+        conditions = results.conditions(measure)
+        label = MEASURE_LABELS.get(measure, measure)
+        if len(conditions) > 1:
+            jobs.append(("likert_bars", os.path.join(output_dir, f"likert_{measure}.png"),
+                         ([results.values(measure, c)[1] for c in conditions],
+                          [CONDITION_LABELS.get(c, c).replace("\n", " ") for c in conditions], label,
+                          next(colors), show_error_bars), {}))
+        elif measure in ("engagement", "ease_of_use"):
+            jobs.append(("boxplot", os.path.join(output_dir, f"likert_{measure}.png"),
+                         ([results.values(measure, conditions[0])[1]], [label],
+                          f'Normalized Mean Likert Scores for {label}'),
+                         {"xlabel": 'Normalized Score', "xlim": (-2, 2)}))
+        else:
+            single.append(measure)
+    if single:
+        jobs.append(("likert_bars", os.path.join(output_dir, "likert_hand_tracking.png"),
+                     ([results.values(m, "hand_tracking")[1] for m in single],
+                      [MEASURE_LABELS.get(m, m) for m in single],
+                      'Analysis of ' + ', '.join(MEASURE_LABELS.get(m, m) for m in single),
+                      '#2ca02c', show_error_bars), {"figsize": (8, 6)}))
+
+    questions = list(dict.fromkeys(results.choices["question"]))
+    if questions:
+        jobs.append(("choice_frequencies", os.path.join(output_dir, "gesture_choices.png"),
+                     ({q: results.choice_counts(q) for q in questions},), {}))
+    return jobs
+
+def render_figures(jobs, max_workers=None):
+    """Renders the jobs in a process pool and returns the written paths."""
+    num_workers = max(1, min(len(jobs), max_workers or os.cpu_count() or 1))
+    if num_workers == 1:
+        return [_render(*job) for job in jobs]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as pool:
+        return list(pool.map(_render, *zip(*jobs)))
 
 
 def main():
-    plot_easy_medium_modes()
-    plot_engagement_and_ease()
-    plot_two_condition_metrics(show_error_bars=True)
-    plot_single_condition_metrics(show_error_bars=True)
-    plot_pose_gesture_comparison()
+    parser = argparse.ArgumentParser(description="Render the user study figures to image files")
+    parser.add_argument("--results", default=os.path.join(HERE, "results"))
+    parser.add_argument("--output", default=os.path.join(HERE, ".logs", "figures"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-error-bars", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    paths = render_figures(figure_jobs(load_results(args.results), args.output, not args.no_error_bars), args.workers)
+    print(f"{len(paths)} figures written to {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
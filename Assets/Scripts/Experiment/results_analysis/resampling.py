@@ -0,0 +1,270 @@
+import numpy as np
+from scipy import special, stats
+
+# Resampling alternatives to the t-tests and t-intervals of the study statistics
+#
+# With nine participants answering on a 5 point scale the normality assumptions of the t-test
+# don't hold, so these use the data's own distribution instead: bootstrap confidence intervals
+# of the mean, sign-flip permutation tests and Wilcoxon signed-rank tests of paired differences,
+# with exact p-values (every sign pattern enumerated) when the sample is small enough.
+# Every function takes a list of metrics (samples may differ in length) and works on all of
+# them at once with batched NumPy operations.
+
+
+def pad(groups) -> (np.ndarray, np.ndarray):
+    """
+    Stacks samples of different lengths into a NaN-padded [M, W] array.
+    Returns (values, lengths).
+    """
+    groups = [np.asarray(g, dtype=np.float64) for g in groups]
+    lengths = np.array([g.shape[0] for g in groups], dtype=np.int64)
+    values = np.full((len(groups), max(lengths.max(initial=0), 1)), np.nan)
+    for i, g in enumerate(groups):
+        values[i, :g.shape[0]] = g
+    return values, lengths
+
+
+def _sign_patterns(n: int) -> np.ndarray:
+    """
+    All 2^n vectors of +-1, one per row.
+    """
+    bits = (np.arange(2 ** n, dtype=np.int64)[:, None] >> np.arange(n)) & 1
+    return (bits * 2 - 1).astype(np.float64)
+
+
+def _by_length(lengths: np.ndarray):
+    """
+    Yields (n, metric indices) for each distinct sample size.
+    """
+    for n in np.unique(lengths):
+        yield int(n), np.flatnonzero(lengths == n)
+
+
+# =============================================================================
+# Bootstrap Confidence Intervals
+# =============================================================================
+def bootstrap_means(values: np.ndarray, lengths: np.ndarray, resamples: int = 100_000, seed: int = 0,
+                    chunk: int = 20_000) -> np.ndarray:
+    """
+    [M, resamples] means of bootstrap resamples of every metric. One set of uniform draws is
+    scaled to each metric's length, so all metrics are resampled in the same array operation.
+    """
+    rng = np.random.default_rng(seed)
+    num_metrics, width = values.shape
+    flat = np.nan_to_num(values).ravel()
+    offsets = (np.arange(num_metrics) * width)[:, None, None]
+    valid = np.arange(width)[None, None, :] < lengths[:, None, None]
+    divisor = np.maximum(lengths, 1)[:, None]
+    means = np.empty((num_metrics, resamples))
+    for start in range(0, resamples, chunk):
+        count = min(chunk, resamples - start)
+        draws = rng.random((count, width))
+        index = (draws[None] * lengths[:, None, None]).astype(np.int64) + offsets
+        means[:, start:start + count] = np.where(valid, flat[index], 0.0).sum(axis=2) / divisor
+    return means
+
+
+def _jackknife_acceleration(values: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    sums = np.nansum(values, axis=1, keepdims=True)
+    leave_one_out = (sums - np.nan_to_num(values)) / np.maximum(lengths - 1, 1)[:, None]
+    centred = np.where(valid, leave_one_out.sum(axis=1, keepdims=True) / np.maximum(lengths, 1)[:, None]
+                       - leave_one_out, 0.0)
+    numerator = (centred ** 3).sum(axis=1)
+    denominator = 6.0 * (centred ** 2).sum(axis=1) ** 1.5
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def bootstrap_ci(groups, confidence: float = 0.95, resamples: int = 100_000, method: str = "bca",
+                 seed: int = 0) -> dict:
+    """
+    Bootstrap confidence interval of the mean of every sample in groups.
+    method is "percentile" or "bca" (bias-corrected and accelerated, better for small skewed
+    samples such as Likert answers). Returns arrays mean, low and high, one entry per group.
+    """
+    values, lengths = pad(groups)
+    means = bootstrap_means(values, lengths, resamples, seed)
+    estimate = np.nansum(values, axis=1) / np.maximum(lengths, 1)
+    tail = (1 - confidence) / 2
+    quantiles = np.tile([tail, 1 - tail], (values.shape[0], 1))
+
+    if method == "bca":
+        # Resampled means equal to the estimate up to rounding count as ties, Likert means are discrete
+        tolerance = 1e-9 * np.maximum(1.0, np.abs(estimate))[:, None]
+        ties = np.abs(means - estimate[:, None]) <= tolerance
+        below = (means < estimate[:, None] - tolerance).mean(axis=1) + 0.5 * ties.mean(axis=1)
+        bias = special.ndtri(np.clip(below, 1.0 / resamples, 1 - 1.0 / resamples))
+        acceleration = _jackknife_acceleration(values, lengths)[:, None]
+        z = bias[:, None] + special.ndtri(quantiles)
+        quantiles = special.ndtr(bias[:, None] + z / (1 - acceleration * z))
+    elif method != "percentile":
+        raise ValueError(f"Unknown bootstrap method {method!r}, expected 'percentile' or 'bca'")
+
+    ordered = np.sort(means, axis=1)
+    index = np.clip(np.round(quantiles * (resamples - 1)).astype(np.int64), 0, resamples - 1)
+    low, high = np.take_along_axis(ordered, index, axis=1).T
+    # Constant samples have no spread to resample
+    constant = ordered[:, 0] == ordered[:, -1]
+    low, high = np.where(constant, estimate, low), np.where(constant, estimate, high)
+    return {"mean": estimate, "low": low, "high": high}
+
+
+# =============================================================================
+# Paired Tests
+# =============================================================================
+def paired_differences(pairs) -> list:
+    """
+    b - a of every (a, b) pair of aligned samples.
+    """
+    return [np.asarray(b, dtype=np.float64) - np.asarray(a, dtype=np.float64) for a, b in pairs]
+
+
+def permutation_test(differences, resamples: int = 100_000, max_exact: int = 2 ** 16, seed: int = 0) -> dict:
+    """
+    Two-sided sign-flip permutation test of a zero mean paired difference for every sample of
+    differences. Exact (all 2^n sign patterns) when 2^n <= max_exact, otherwise Monte Carlo with
+    resamples random patterns. Returns arrays mean_difference, p and exact.
+    """
+    values, lengths = pad(differences)
+    observed = np.nansum(values, axis=1) / np.maximum(lengths, 1)
+    p = np.ones(len(lengths))
+    exact = np.zeros(len(lengths), dtype=bool)
+    rng = np.random.default_rng(seed)
+    for n, metrics in _by_length(lengths):
+        if n == 0:
+            continue
+        sample = values[metrics, :n]
+        threshold = np.abs(observed[metrics])[:, None] * (1 - 1e-12)
+        if 2 ** n <= max_exact:
+            null = np.abs(sample @ _sign_patterns(n).T) / n
+            p[metrics] = (null >= threshold).mean(axis=1)
+            exact[metrics] = True
+        else:
+            extreme = np.zeros(len(metrics))
+            for start in range(0, resamples, 20_000):
+                signs = rng.integers(0, 2, (min(20_000, resamples - start), n)) * 2.0 - 1.0
+                extreme += (np.abs(sample @ signs.T) / n >= threshold).sum(axis=1)
+            p[metrics] = (extreme + 1) / (resamples + 1)
+    return {"mean_difference": observed, "p": p, "exact": exact}
+
+
+def wilcoxon_test(differences, max_exact: int = 2 ** 16) -> dict:
+    """
+    Two-sided Wilcoxon signed-rank test for every sample of differences. Zero differences are
+    dropped and tied magnitudes get average ranks. The null distribution is enumerated over all
+    sign patterns of the actual ranks, so p-values stay exact with ties, when 2^n <= max_exact;
+    larger samples use the normal approximation with tie correction.
+    Returns arrays w_plus (sum of positive ranks), n (non-zero differences), p and exact.
+    """
+    nonzero = [d[d != 0] for d in (np.asarray(d, dtype=np.float64) for d in differences)]
+    ranks, lengths = pad([stats.rankdata(np.abs(d)) for d in nonzero])
+    signs, _ = pad([np.sign(d) for d in nonzero])
+    w_plus = np.nansum(np.where(signs > 0, ranks, 0.0), axis=1)
+    centre = np.nansum(ranks, axis=1) / 2
+    p = np.ones(len(lengths))
+    exact = np.zeros(len(lengths), dtype=bool)
+    for n, metrics in _by_length(lengths):
+        if n == 0:
+            continue
+        sample = ranks[metrics, :n]
+        deviation = np.abs(w_plus[metrics] - centre[metrics])[:, None] * (1 - 1e-12)
+        if 2 ** n <= max_exact:
+            # W+ of each sign pattern is half the signed rank sum plus the centre
+            null = np.abs(sample @ _sign_patterns(n).T) / 2
+            p[metrics] = (null >= deviation).mean(axis=1)
+            exact[metrics] = True
+        else:
+            std = np.sqrt((sample ** 2).sum(axis=1) / 4)
+            p[metrics] = np.minimum(1.0, 2 * special.ndtr(-deviation[:, 0] / std))
+    return {"w_plus": w_plus, "n": lengths, "p": p, "exact": exact}
+
+
+# =============================================================================
+# Multiple Comparisons
+# =============================================================================
+def holm(p_values) -> np.ndarray:
+    """
+    Holm-Bonferroni adjusted p-values (family-wise error rate).
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p_values)
+    scaled = p_values[order] * (p_values.shape[0] - np.arange(p_values.shape[0]))
+    adjusted = np.empty_like(p_values)
+    adjusted[order] = np.minimum(1.0, np.maximum.accumulate(scaled))
+    return adjusted
+
+
+def benjamini_hochberg(p_values) -> np.ndarray:
+    """
+    Benjamini-Hochberg adjusted p-values (false discovery rate).
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    m = p_values.shape[0]
+    order = np.argsort(p_values)
+    scaled = p_values[order] * m / np.arange(1, m + 1)
+    adjusted = np.empty_like(p_values)
+    adjusted[order] = np.minimum(1.0, np.minimum.accumulate(scaled[::-1])[::-1])
+    return adjusted
+
+
+# =============================================================================
+# Study Metrics
+# =============================================================================
+def study_resampling(results, confidence: float = 0.95, resamples: int = 100_000, seed: int = 0) -> dict:
+    """
+    Bootstrap intervals of every (measure, condition) of the results table (percentages for round
+    scores) and paired permutation and Wilcoxon tests of every measure answered under both
+    conditions, with Holm and Benjamini-Hochberg corrections across those comparisons.
+    """
+    def column(measure):
+        return "percentage" if measure in results.measures(kind="score") else "value"
+
+    cells = [(measure, condition) for measure in results.measures() for condition in results.conditions(measure)]
+    intervals = bootstrap_ci([results.values(m, c, column(m))[1] for m, c in cells], confidence, resamples, seed=seed)
+
+    compared = [m for m in results.measures() if len(results.conditions(m)) == 2]
+    differences = paired_differences([results.paired(m, *results.conditions(m), column(m)) for m in compared])
+    permutation = permutation_test(differences, resamples, seed=seed)
+    wilcoxon = wilcoxon_test(differences)
+
+    report = {"intervals": {}, "comparisons": {}}
+    for i, (measure, condition) in enumerate(cells):
+        report["intervals"].setdefault(measure, {})[condition] = {
+            "mean": float(intervals["mean"][i]), "low": float(intervals["low"][i]), "high": float(intervals["high"][i])}
+    if compared:
+        corrected = {name: (holm(test["p"]), benjamini_hochberg(test["p"]))
+                     for name, test in (("permutation", permutation), ("wilcoxon", wilcoxon))}
+        for i, measure in enumerate(compared):
+            report["comparisons"][measure] = {
+                "conditions": results.conditions(measure),
+                "mean_difference": float(permutation["mean_difference"][i]),
+                "permutation_p": float(permutation["p"][i]),
+                "permutation_p_holm": float(corrected["permutation"][0][i]),
+                "permutation_p_bh": float(corrected["permutation"][1][i]),
+                "permutation_exact": bool(permutation["exact"][i]),
+                "wilcoxon_w_plus": float(wilcoxon["w_plus"][i]),
+                "wilcoxon_n": int(wilcoxon["n"][i]),
+                "wilcoxon_p": float(wilcoxon["p"][i]),
+                "wilcoxon_p_holm": float(corrected["wilcoxon"][0][i]),
+                "wilcoxon_p_bh": float(corrected["wilcoxon"][1][i]),
+                "wilcoxon_exact": bool(wilcoxon["exact"][i])
+            }
+    return report
+
+
+def print_report(report: dict, confidence: float = 0.95):
+    for measure, conditions in report["intervals"].items():
+        for condition, interval in conditions.items():
+            print(f"{measure} ({condition}) → Mean: {interval['mean']:.2f}, "
+                  f"[{interval['low']:.2f}, {interval['high']:.2f}] ({int(confidence * 100)}% bootstrap CI)")
+    for measure, comparison in report["comparisons"].items():
+        a, b = comparison["conditions"]
+        print(f"{measure}: {b} - {a} = {comparison['mean_difference']:.2f} → "
+              f"permutation p = {comparison['permutation_p']:.4f} (Holm {comparison['permutation_p_holm']:.4f}), "
+              f"Wilcoxon p = {comparison['wilcoxon_p']:.4f} (Holm {comparison['wilcoxon_p_holm']:.4f})"
+              + ("" if comparison["wilcoxon_exact"] else " approx."))
+
+
+if __name__ == "__main__":
+    from ingest import load_results
+    print_report(study_resampling(load_results()))
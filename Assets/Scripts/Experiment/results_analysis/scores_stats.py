@@ -1,6 +1,7 @@
 import numpy as np
 from scipy import stats
 from plots import calculate_percentages
+from ingest import load_results
 
 def significance_between_modes(scores1, max1, scores2, max2, alpha=0.05):
     """
@@ -14,28 +15,15 @@ def significance_between_modes(scores1, max1, scores2, max2, alpha=0.05):
     return t_stat, p_value, significant
 
 if __name__ == "__main__":
-    # Easy mode data
-    easy_ht_scores = [34, 34, 33, 31, 33, 35, 28, 32, 27]
-    # mean = 31.88  -> 86.16
-    easy_cont_scores = [37, 37, 36, 37, 37, 36, 37, 35, 37]
-    # mean = 36.556 -> 98.8
-    easy_max = 37
+    results = load_results()
+    for round_name in results.measures(kind="score"):
+        hand_tracking = results.values(round_name, "hand_tracking")[1]
+        controllers = results.values(round_name, "controllers")[1]
+        max_score = results["max_score"][results.mask(measure=round_name)][0]
+        print(f"{round_name.capitalize()} mode: hand tracking mean = {hand_tracking.mean():.2f} "
+              f"-> {hand_tracking.mean() / max_score * 100:.2f}%, controllers mean = {controllers.mean():.2f} "
+              f"-> {controllers.mean() / max_score * 100:.2f}% (max {max_score:.0f})")
 
-    # Medium mode data
-    medium_ht_scores = [33, 46, 39, 41, 45, 46, 34, 41, 39]
-    # mean = 40.44 -> 72.22
-    medium_cont_scores = [42, 54, 51, 50, 49, 52, 53, 43, 48]
-    # mean = 49.11 -> 87.70
-    medium_max = 56
-
-    # Run tests
-    easy_t, easy_p, easy_sig = significance_between_modes(
-        easy_ht_scores, easy_max, easy_cont_scores, easy_max
-    )
-    medium_t, medium_p, medium_sig = significance_between_modes(
-        medium_ht_scores, medium_max, medium_cont_scores, medium_max
-    )
-
-    # Print results
-    print(f"Easy modes comparison: t = {easy_t:.3f}, p = {easy_p:.3f}, significant? {easy_sig}")
-    print(f"Medium modes comparison: t = {medium_t:.3f}, p = {medium_p:.3f}, significant? {medium_sig}")
+        # Run test and print results
+        t, p, sig = significance_between_modes(hand_tracking, max_score, controllers, max_score)
+        print(f"{round_name.capitalize()} modes comparison: t = {t:.3f}, p = {p:.3f}, significant? {sig}")
@@ -0,0 +1,160 @@
+import math
+import threading
+import torch
+
+# On-the-fly augmentation of flattened gesture vectors
+#
+# Gesture samples are trajectories of T points flattened to [T * 3] after the on-device
+# normalisation (translated to the first point, rotated into head space, scaled into the
+# bounding cube). Augmentations are applied to a whole epoch at once with batched torch ops:
+#   - random yaw (about y, Unity's up axis) and pitch (about x) rotations
+#   - time warping: the trajectory is resampled along a random monotonic time curve
+#   - scale jitter: the sample is rescaled so its bounding width is a random fraction of the cube
+#   - small gaussian noise on the flattened vector
+# AugmentedStream prepares upcoming epochs on background threads so training never waits on it.
+
+
+class GestureAugmenter:
+    """
+    Batched augmentation of flattened [N, T * 3] gesture vectors.
+    """
+    def __init__(self, max_yaw_degrees: float = 15.0, max_pitch_degrees: float = 10.0, max_time_warp: float = 0.2,
+                 min_scale: float = 0.8, bounding_cube_size: float = 1.0, noise_std: float = 0.01,
+                 probability: float = 0.8):
+        self.max_yaw = math.radians(max_yaw_degrees)
+        self.max_pitch = math.radians(max_pitch_degrees)
+        self.max_time_warp = max_time_warp
+        self.min_scale = min_scale
+        self.bounding_cube_size = bounding_cube_size
+        self.noise_std = noise_std
+        self.probability = probability
+
+    def _uniform(self, n: int, low: float, high: float, generator) -> torch.Tensor:
+        return torch.rand(n, generator=generator) * (high - low) + low
+
+    def rotate(self, points: torch.Tensor, generator) -> torch.Tensor:
+        n = points.shape[0]
+        yaw = self._uniform(n, -self.max_yaw, self.max_yaw, generator)
+        pitch = self._uniform(n, -self.max_pitch, self.max_pitch, generator)
+        cy, sy, cp, sp = yaw.cos(), yaw.sin(), pitch.cos(), pitch.sin()
+        zeros, ones = torch.zeros(n), torch.ones(n)
+        yaw_matrix = torch.stack([
+            torch.stack([cy, zeros, sy], dim=-1),
+            torch.stack([zeros, ones, zeros], dim=-1),
+            torch.stack([-sy, zeros, cy], dim=-1)
+        ], dim=1)
+        pitch_matrix = torch.stack([
+            torch.stack([ones, zeros, zeros], dim=-1),
+            torch.stack([zeros, cp, -sp], dim=-1),
+            torch.stack([zeros, sp, cp], dim=-1)
+        ], dim=1)
+        return points @ (yaw_matrix @ pitch_matrix).transpose(1, 2)
+
+    def time_warp(self, points: torch.Tensor, generator) -> torch.Tensor:
+        """
+        Resamples each trajectory at t' = t^gamma, which keeps both end points but speeds up
+        the start and slows down the end (or the reverse) by a random amount.
+        """
+        n, steps, _ = points.shape
+        if steps < 2 or self.max_time_warp <= 0:
+            return points
+        log_gamma = self._uniform(n, -self.max_time_warp, self.max_time_warp, generator)
+        t = torch.linspace(0, 1, steps)
+        position = t[None, :].pow(log_gamma.exp()[:, None]) * (steps - 1)
+        index0 = position.floor().long().clamp(max=steps - 2)
+        weight = (position - index0)[..., None]
+        point0 = points.gather(1, index0[..., None].expand(-1, -1, 3))
+        point1 = points.gather(1, (index0 + 1)[..., None].expand(-1, -1, 3))
+        return point0 + (point1 - point0) * weight
+
+    def rescale(self, points: torch.Tensor, generator) -> torch.Tensor:
+        """
+        Re-applies the bounding cube normalisation with a random target width, so rotated and
+        warped samples stay inside the cube.
+        """
+        widths = (points.amax(dim=1) - points.amin(dim=1)).amax(dim=1)
+        scale = self._uniform(points.shape[0], self.min_scale, 1.0, generator) * self.bounding_cube_size
+        return points * (scale / widths.clamp(min=1e-6))[:, None, None]
+
+    def __call__(self, inputs: torch.Tensor, generator: torch.Generator = None) -> torch.Tensor:
+        n = inputs.shape[0]
+        points = inputs.reshape(n, -1, 3)
+        augmented = self.rotate(points, generator)
+        augmented = self.time_warp(augmented, generator)
+        augmented = augmented - augmented[:, :1, :]
+        augmented = self.rescale(augmented, generator).reshape(n, -1)
+        if self.noise_std > 0:
+            augmented = augmented + torch.randn(augmented.shape, generator=generator) * self.noise_std
+
+        # Leave a share of the samples untouched so the recorded distribution is still seen
+        keep = torch.rand(n, generator=generator) >= self.probability
+        return torch.where(keep[:, None], inputs, augmented)
+
+
+class AugmentedStream:
+    """
+    Produces augmented copies of the training inputs one epoch at a time, computed ahead of
+    use by background threads. Rows stay aligned with the original labels. An exception in a
+    worker is raised from next_epoch.
+    """
+    def __init__(self, inputs: torch.Tensor, augmenter, prefetch: int = 2, num_workers: int = 1, seed: int = 0):
+        self.inputs = inputs.detach().cpu()
+        self.augmenter = augmenter
+        self.seed = seed
+        self.prefetch = max(1, prefetch)
+        self._next_epoch = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._results = {}
+        self._delivered = 0
+        self._error = None
+        self._condition = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, num_workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def _claim_epoch(self) -> int:
+        with self._lock:
+            epoch = self._next_epoch
+            self._next_epoch += 1
+            return epoch
+
+    def _work(self):
+        while not self._stopped.is_set():
+            epoch = self._claim_epoch()
+            generator = torch.Generator().manual_seed(self.seed + epoch)
+            try:
+                with torch.no_grad():
+                    augmented = self.augmenter(self.inputs, generator)
+            except Exception as error:
+                # Handed to next_epoch, which would otherwise wait for this epoch forever
+                with self._condition:
+                    if self._error is None:
+                        self._error = error
+                    self._stopped.set()
+                    self._condition.notify_all()
+                return
+            with self._condition:
+                # Bound the number of prepared epochs and hand them out in order
+                self._condition.wait_for(lambda: self._stopped.is_set() or
+                                         epoch - self._delivered < self.prefetch)
+                self._results[epoch] = augmented
+                self._condition.notify_all()
+
+    def next_epoch(self) -> torch.Tensor:
+        with self._condition:
+            self._condition.wait_for(lambda: self._delivered in self._results or self._error is not None)
+            if self._delivered not in self._results:
+                raise self._error
+            augmented = self._results.pop(self._delivered)
+            self._delivered += 1
+            self._condition.notify_all()
+        return augmented
+
+    def close(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        # A worker still inside torch when the interpreter exits aborts the process
+        for worker in self._workers:
+            worker.join()
@@ -0,0 +1,189 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+import onnxruntime as ort
+from data_cache import load_section
+from onnx_export import model_size
+from instrumentation import resident_memory_bytes
+
+# CPU inference benchmark for the exported ONNX models
+#
+# Replays real samples from PoseGestureData.json one at a time (batch size 1), the way
+# MLClassifier runs each model once per detection tick, and records load time, latency
+# percentiles, throughput and resident memory as JSON lines so runs can be compared
+# across commits and thread settings.
+
+# Model file prefix -> data section it consumes, or the sections of its inputs in order
+MODEL_SECTIONS = {
+    "model_poses": "poses",
+    "model_gestures": "gestures",
+    "model_multitask": ("poses", "gestures")
+}
+
+# The pair of models one multi-task call replaces (Net and LowNet, its training baselines)
+MULTITASK_PAIR = ("model_poses.onnx", "model_gestures_low.onnx")
+
+
+# =============================================================================
+# Environment Helpers
+# =============================================================================
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def section_for_model(onnx_path: str):
+    name = os.path.basename(onnx_path)
+    for prefix, section in MODEL_SECTIONS.items():
+        if name.startswith(prefix):
+            return section
+    return None
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+def benchmark_model(onnx_path: str, samples: np.ndarray, intra_op_threads: int = 1, warmup: int = 50,
+                    runs: int = 1000) -> dict:
+    """
+    Benchmarks a single model with batch size 1 inference on the given samples. Graphs with several
+    inputs (the multi-task model) take a tuple of sample arrays, one per input, and get one row of
+    each per call. Stateful streaming graphs (inputs "frame" and "state", see temporal_model) are fed
+    one frame of the samples per call with the returned state carried over, starting from a zero state.
+    """
+    rss_before = resident_memory_bytes()
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    start = time.perf_counter()
+    session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    load_seconds = time.perf_counter() - start
+    model_inputs = session.get_inputs()
+    state = None
+    if len(model_inputs) > 1 and model_inputs[1].name == "state":
+        samples = samples.reshape(-1, model_inputs[0].shape[1])
+        state = np.zeros(model_inputs[1].shape, dtype=np.float32)
+    if not isinstance(samples, tuple):
+        samples = (samples,)
+
+    # Pre-slice [1, F] views so the timed loop only measures inference
+    feeds = [{model_input.name: rows[i % rows.shape[0]][None, :] for model_input, rows in zip(model_inputs, samples)}
+             for i in range(warmup + runs)]
+    for feed in feeds[:warmup]:
+        if state is None:
+            session.run(None, feed)
+        else:
+            state = session.run(None, {**feed, "state": state})[1]
+
+    latencies = np.empty(runs, dtype=np.float64)
+    for i, feed in enumerate(feeds[warmup:]):
+        start = time.perf_counter()
+        if state is None:
+            session.run(None, feed)
+        else:
+            state = session.run(None, {**feed, "state": state})[1]
+        latencies[i] = time.perf_counter() - start
+    rss_after = resident_memory_bytes()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e6
+    return {
+        "model": os.path.basename(onnx_path),
+        "size_bytes": model_size(onnx_path),
+        "intra_op_threads": intra_op_threads,
+        "runs": runs,
+        "load_ms": load_seconds * 1e3,
+        "p50_us": p50,
+        "p95_us": p95,
+        "p99_us": p99,
+        "mean_us": latencies.mean() * 1e6,
+        "throughput_per_s": runs / latencies.sum(),
+        "rss_bytes": rss_after,
+        "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    }
+
+
+def run_benchmarks(models_dir: str, json_path: str, output_path: str, threads=(1,), warmup: int = 50,
+                   runs: int = 1000, pattern: str = "*.onnx") -> list:
+    """
+    Benchmarks every matching model in models_dir for each thread setting and appends
+    the results to output_path as JSON lines. The multi-task model is compared with the
+    pose + gesture pair it replaces.
+    """
+    context = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "onnxruntime": ort.__version__
+    }
+    sections = {}
+    results = []
+    for onnx_path in sorted(glob.glob(os.path.join(models_dir, pattern))):
+        section = section_for_model(onnx_path)
+        if section is None:
+            print(f"Skipping {os.path.basename(onnx_path)}: no data section for this model")
+            continue
+        for name in (section if isinstance(section, tuple) else (section,)):
+            if name not in sections:
+                sections[name] = np.ascontiguousarray(load_section(json_path, name)[0])
+        samples = tuple(sections[name] for name in section) if isinstance(section, tuple) else sections[section]
+        for num_threads in threads:
+            result = benchmark_model(onnx_path, samples, num_threads, warmup, runs)
+            result.update(context)
+            results.append(result)
+            print(f"{result['model']:<36} threads={num_threads} load={result['load_ms']:.1f}ms "
+                  f"p50={result['p50_us']:.1f}us p95={result['p95_us']:.1f}us p99={result['p99_us']:.1f}us "
+                  f"{result['throughput_per_s']:.0f}/s")
+    print_multitask_comparison(results)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    print(f"Results appended to {output_path}")
+    return results
+
+
+def print_multitask_comparison(results: list):
+    """
+    Latency of each multi-task call next to the two calls it replaces at the same thread setting.
+    """
+    by_model = {(result["model"], result["intra_op_threads"]): result for result in results}
+    for result in results:
+        if not result["model"].startswith("model_multitask"):
+            continue
+        pair = [by_model.get((name, result["intra_op_threads"])) for name in MULTITASK_PAIR]
+        if None in pair:
+            print(f"{result['model']}: {' and '.join(MULTITASK_PAIR)} not benchmarked, no comparison")
+            continue
+        print(f"{result['model']} threads={result['intra_op_threads']}: p50 {result['p50_us']:.1f}us per call vs "
+              f"{sum(r['p50_us'] for r in pair):.1f}us for {' + '.join(MULTITASK_PAIR)}")
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ONNX model inference latency at batch size 1")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--data", default="PoseGestureData.json")
+    parser.add_argument("--output", default=os.path.join(".logs", "onnx_bench.jsonl"))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--pattern", default="*.onnx", help="Glob for model files inside --models-dir")
+    args = parser.parse_args()
+
+    run_benchmarks(args.models_dir, args.data, args.output, args.threads, args.warmup, args.runs, args.pattern)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import sys
+
+# Single entry point for the ModelTraining scripts
+#
+#   python cli.py sync --pull
+#   python cli.py cv --archs low medium --folds 5
+#   python cli.py curate --drop-mislabelled --write curated.json
+#   python cli.py train-gestures --epochs 50 --complexities low high
+#   python cli.py --config training.json train-poses
+#
+# Only argparse and json are imported up front. Each subcommand imports the modules it needs
+# (torch, onnxruntime, matplotlib) when it runs, so --help and quick tasks such as sync start
+# immediately. Settings are resolved as: the script's default_config(), then the subcommand's
+# section of the JSON config file, then the command line flags.
+#
+# Config file example:
+#   {"data": "PoseGestureData.json",
+#    "train-gestures": {"num_epochs": 100, "augment_options": {"noise_std": 0.01}, "parallel": false},
+#    "sync": {"link": false}}
+
+
+def load_config(path: str) -> dict:
+    if path is None:
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def resolve(defaults: dict, file_config: dict, command: str, args: argparse.Namespace) -> dict:
+    """
+    Defaults updated with the config file (global "data" and the command's section) and then with
+    every flag given on the command line whose name matches a setting.
+    """
+    config = dict(defaults)
+    section = file_config.get(command, {})
+    unknown = set(section) - set(config)
+    if unknown:
+        raise SystemExit(f"Unknown settings for {command} in the config file: {sorted(unknown)}")
+    if "data" in file_config and "json_file" in config:
+        config["json_file"] = file_config["data"]
+    config.update(section)
+    if getattr(args, "data", None) is not None and "json_file" in config:
+        config["json_file"] = args.data
+    for key, value in vars(args).items():
+        if key in config and key != "json_file" and value is not None:
+            config[key] = value
+    return config
+
+
+def _apply_switches(config: dict, args: argparse.Namespace):
+    # Flags that switch off a whole group of options
+    for flag, key in (("no_sync", "sync"), ("sequential", "parallel"), ("no_variants", "export_variants")):
+        if getattr(args, flag, False) and key in config:
+            config[key] = False
+    for flag, key in (("from_scratch", "warm_start_options"), ("no_augment", "augment_options"),
+                      ("no_distill", "distill_options")):
+        if getattr(args, flag, False):
+            config[key] = None
+    if getattr(args, "adb", False):
+        config["link"] = False
+    if getattr(args, "instrument", False) and config.get("monitor_options") is None:
+        config["monitor_options"] = {}
+    if getattr(args, "profile_epochs", None):
+        config["monitor_options"] = dict(config.get("monitor_options") or {}, profile_epochs=args.profile_epochs)
+    return config
+
+
+# =============================================================================
+# Subcommands
+# =============================================================================
+def sync_defaults() -> dict:
+    import pull_push_data
+    return {
+        "pull": False,
+        "push": False,
+        "link": True,
+        "link_location": pull_push_data.link_location,
+        "adb_location": pull_push_data.adb_location,
+        "json_file": pull_push_data.local_file
+    }
+
+
+def run_sync(args, file_config: dict):
+    import pull_push_data
+    config = _apply_switches(resolve(sync_defaults(), file_config, "sync", args), args)
+    if not (config["pull"] or config["push"]):
+        raise SystemExit("Nothing to do, pass --pull and/or --push")
+    pull_push_data.sync_data(config["pull"], config["push"], config["link"], config["link_location"],
+                             config["adb_location"], local_path=config["json_file"])
+
+
+def run_train_poses(args, file_config: dict):
+    import pose_training
+    config = _apply_switches(resolve(pose_training.default_config(), file_config, "train-poses", args), args)
+    pose_training.run(config)
+
+
+def run_train_gestures(args, file_config: dict):
+    import gesture_training
+    config = _apply_switches(resolve(gesture_training.default_config(), file_config, "train-gestures", args), args)
+    gesture_training.run(config)
+
+
+def run_train_multitask(args, file_config: dict):
+    import multitask_training
+    config = _apply_switches(resolve(multitask_training.default_config(), file_config, "train-multitask", args), args)
+    if args.no_baselines:
+        config["baselines"] = False
+    multitask_training.run(config)
+
+
+def run_export(args, file_config: dict):
+    import gesture_training
+    import pose_training
+    from trainer import select_device
+    gestures = resolve(gesture_training.default_config(), file_config, "train-gestures", args)
+    poses = _apply_switches(resolve(pose_training.default_config(), file_config, "train-poses", args), args)
+    device = select_device(args.device)
+    if args.no_variants:
+        gestures["export_options"] = dict(gestures["export_options"], variants=False)
+    if args.section in ("poses", "all"):
+        pose_training.export_checkpoint(poses["json_file"], poses["onnx_path"], poses["dynamic_batch"],
+                                        poses["export_variants"], device)
+    if args.section in ("gestures", "all"):
+        gesture_training.export_checkpoints(gestures["json_file"], gestures["models_dir"], gestures["base_model_name"],
+                                            gestures["complexities"], gestures["export_options"], device)
+
+
+def report_defaults() -> dict:
+    return {"json_file": "PoseGestureData.json", "output": os.path.join(".logs", "report"), "workers": None,
+            "samples": 10, "figures": True}
+
+
+def run_report(args, file_config: dict):
+    import misc
+    config = resolve(report_defaults(), file_config, "report", args)
+    if args.no_figures:
+        config["figures"] = False
+    misc.write_report(config["json_file"], config["output"], config["figures"], config["workers"], config["samples"])
+
+
+def bench_defaults() -> dict:
+    return {"json_file": "PoseGestureData.json", "models_dir": "models",
+            "output": os.path.join(".logs", "onnx_bench.jsonl"), "threads": [1], "warmup": 50, "runs": 1000,
+            "pattern": "*.onnx"}
+
+
+def run_bench(args, file_config: dict):
+    import bench_onnx
+    config = resolve(bench_defaults(), file_config, "bench", args)
+    bench_onnx.run_benchmarks(config["models_dir"], config["json_file"], config["output"], config["threads"],
+                              config["warmup"], config["runs"], config["pattern"])
+
+
+def cv_defaults() -> dict:
+    return {"json_file": "PoseGestureData.json", "archs": ["pose", "low", "medium", "high"], "num_folds": 5,
+            "num_epochs": 100, "batch_size": 32, "optimizer": "sgd", "lr": 1e-3, "patience": 20,
+            "val_fraction": 0.1, "seed": 0, "workers": None,
+            "output": os.path.join(".logs", "cross_validation.jsonl")}
+
+
+def run_cv(args, file_config: dict):
+    import cross_validation
+    config = resolve(cv_defaults(), file_config, "cv", args)
+    cross_validation.cross_validate(config["json_file"], config["archs"], config["num_folds"], config["num_epochs"],
+                                    config["batch_size"], config["optimizer"], config["lr"], config["patience"],
+                                    config["val_fraction"], config["seed"], config["workers"], config["output"])
+
+
+def curate_defaults() -> dict:
+    return {"json_file": "PoseGestureData.json", "output": os.path.join(".logs", "curation"),
+            "sections": ["poses", "gestures"], "radius": 0.02, "neighbours": 16, "margin": 0.0,
+            "drop_mislabelled": False, "balance": False, "per_class": None, "write": None}
+
+
+def run_curate(args, file_config: dict):
+    import curation
+    config = resolve(curate_defaults(), file_config, "curate", args)
+    curation.curate(config["json_file"], config["output"], config["sections"], config["radius"], config["neighbours"],
+                    config["margin"], config["drop_mislabelled"], config["balance"], config["per_class"],
+                    config["write"])
+
+
+
+def check_streaming_defaults() -> dict:
+    return {"json_file": "PoseGestureData.json", "model": os.path.join("models", "model_gestures_temporal.onnx"),
+            "streams": 4, "windows": 8, "tolerance": 1e-4, "head_turn": 0.0}
+
+
+def run_check_streaming(args, file_config: dict):
+    import temporal_model
+    config = resolve(check_streaming_defaults(), file_config, "check-streaming", args)
+    try:
+        report = temporal_model.check_checkpoint(config["json_file"], config["model"], config["streams"],
+                                                 config["windows"], config["tolerance"], config["head_turn"])
+    except (FileNotFoundError, ValueError) as error:
+        raise SystemExit(str(error))
+    if not report["passed"]:
+        raise SystemExit(1)
+
+
+# =============================================================================
+# Argument Parsing
+# =============================================================================
+def _add_training_flags(parser: argparse.ArgumentParser, warm_start: bool = True):
+    parser.add_argument("--batch-size", dest="batch_size", type=int)
+    parser.add_argument("--val-fraction", dest="val_fraction", type=float)
+    parser.add_argument("--patience", type=int)
+    parser.add_argument("--log-path", dest="log_path")
+    parser.add_argument("--device", help="e.g. cpu or cuda:0 (default: CUDA when available)")
+    parser.add_argument("--no-sync", action="store_true", help="Train on the local data file without pulling")
+    parser.add_argument("--adb", action="store_true", help="Sync over adb instead of Quest Link")
+    if warm_start:
+        parser.add_argument("--from-scratch", action="store_true", help="Ignore existing checkpoints")
+    parser.add_argument("--instrument", action="store_true", help="Record per-epoch timings to .logs/instrumentation")
+    parser.add_argument("--profile-epochs", dest="profile_epochs", type=int, nargs="+",
+                        help="Epochs (1-based) recorded with torch.profiler, implies --instrument")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    # Accepted before or after the subcommand, SUPPRESS keeps a subcommand from resetting them to None
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", default=argparse.SUPPRESS, help="JSON file with settings per subcommand")
+    common.add_argument("--data", default=argparse.SUPPRESS, help="Data file (overrides the config file)")
+
+    parser = argparse.ArgumentParser(description="Data sync, training, export and analysis of the pose and gesture models",
+                                     parents=[common])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name: str, summary: str) -> argparse.ArgumentParser:
+        return subparsers.add_parser(name, help=summary, parents=[common])
+
+    sync = add_command("sync", "Copy the data file from/to the HMD")
+    sync.add_argument("--pull", action="store_true", default=None)
+    sync.add_argument("--push", action="store_true", default=None)
+    sync.add_argument("--adb", action="store_true", help="Use adb instead of Quest Link")
+    sync.add_argument("--link-location", dest="link_location")
+    sync.add_argument("--adb-location", dest="adb_location")
+    sync.set_defaults(handler=run_sync)
+
+    poses = add_command("train-poses", "Train and export the pose model")
+    poses.add_argument("--epochs", type=int)
+    poses.add_argument("--onnx-path", dest="onnx_path")
+    poses.add_argument("--no-variants", action="store_true", help="Skip the optimized/int8 variants")
+    _add_training_flags(poses)
+    poses.set_defaults(handler=run_train_poses)
+
+    gestures = add_command("train-gestures", "Train and export the gesture models")
+    gestures.add_argument("--epochs", dest="num_epochs", type=int)
+    gestures.add_argument("--complexities", nargs="+", choices=["low", "medium", "high", "temporal"])
+    gestures.add_argument("--models-dir", dest="models_dir")
+    gestures.add_argument("--sequential", action="store_true", help="Train one model at a time")
+    gestures.add_argument("--no-augment", action="store_true", help="Ignore augment_options from the config file")
+    gestures.add_argument("--no-distill", action="store_true", help="Ignore distill_options from the config file")
+    _add_training_flags(gestures)
+    gestures.set_defaults(handler=run_train_gestures)
+
+    multitask = add_command("train-multitask", "Train one model with pose and gesture heads and export it")
+    multitask.add_argument("--epochs", dest="num_epochs", type=int)
+    multitask.add_argument("--lr", type=float)
+    multitask.add_argument("--pose-weight", dest="pose_weight", type=float, help="Weight of the pose loss")
+    multitask.add_argument("--gesture-weight", dest="gesture_weight", type=float, help="Weight of the gesture loss")
+    multitask.add_argument("--onnx-path", dest="onnx_path")
+    multitask.add_argument("--no-baselines", action="store_true", help="Skip training the standalone models")
+    # The multi-task model always trains from scratch
+    _add_training_flags(multitask, warm_start=False)
+    multitask.set_defaults(handler=run_train_multitask)
+
+    export = add_command("export", "Re-export ONNX models from their checkpoints without training")
+    export.add_argument("section", nargs="?", choices=["poses", "gestures", "all"], default="all")
+    export.add_argument("--complexities", nargs="+", choices=["low", "medium", "high", "temporal"])
+    export.add_argument("--models-dir", dest="models_dir")
+    export.add_argument("--onnx-path", dest="onnx_path", help="Pose model path")
+    export.add_argument("--no-variants", action="store_true")
+    export.add_argument("--device")
+    export.set_defaults(handler=run_export)
+
+    report = add_command("report", "Per-class dataset statistics and figures")
+    report.add_argument("--output")
+    report.add_argument("--workers", type=int)
+    report.add_argument("--samples", type=int, help="Recorded samples drawn in each gesture figure")
+    report.add_argument("--no-figures", action="store_true")
+    report.set_defaults(handler=run_report)
+
+    bench = add_command("bench", "Benchmark ONNX inference latency at batch size 1")
+    bench.add_argument("--models-dir", dest="models_dir")
+    bench.add_argument("--output")
+    bench.add_argument("--threads", type=int, nargs="+")
+    bench.add_argument("--warmup", type=int)
+    bench.add_argument("--runs", type=int)
+    bench.add_argument("--pattern")
+    bench.set_defaults(handler=run_bench)
+
+    cv = add_command("cv", "Stratified k-fold cross-validation of the architectures")
+    cv.add_argument("--archs", nargs="+", choices=["pose", "low", "medium", "high", "temporal"])
+    cv.add_argument("--folds", dest="num_folds", type=int)
+    cv.add_argument("--epochs", dest="num_epochs", type=int)
+    cv.add_argument("--batch-size", dest="batch_size", type=int)
+    cv.add_argument("--optimizer", choices=["sgd", "momentum", "adam", "adamw"])
+    cv.add_argument("--lr", type=float)
+    cv.add_argument("--patience", type=int)
+    cv.add_argument("--seed", type=int)
+    cv.add_argument("--workers", type=int)
+    cv.add_argument("--output")
+    cv.set_defaults(handler=run_cv)
+
+    curate = add_command("curate", "Find near-duplicate and likely mislabelled samples, write balanced data")
+    curate.add_argument("--output", help="Report and sampling weights folder")
+    curate.add_argument("--sections", nargs="+", choices=["poses", "gestures"])
+    curate.add_argument("--radius", type=float, help="RMS z-score distance of near-duplicates")
+    curate.add_argument("--neighbours", type=int)
+    curate.add_argument("--margin", type=float, help="Relative margin before a sample counts as mislabelled")
+    curate.add_argument("--drop-mislabelled", dest="drop_mislabelled", action="store_true", default=None)
+    curate.add_argument("--balance", action="store_true", default=None, help="Undersample to equal class sizes")
+    curate.add_argument("--per-class", dest="per_class", type=int)
+    curate.add_argument("--write", help="Write the curated data to this .json file or recording store")
+    curate.set_defaults(handler=run_curate)
+
+    check = add_command("check-streaming", "Compare the temporal model's streaming step with full windows")
+    check.add_argument("--model", help="Full-window ONNX path of the temporal model")
+    check.add_argument("--streams", type=int)
+    check.add_argument("--windows", type=int, help="Recorded windows chained per stream")
+    check.add_argument("--tolerance", type=float, help="Largest allowed logit difference")
+    check.add_argument("--head-turn", dest="head_turn", type=float, help="Largest head turn per frame in degrees")
+    check.set_defaults(handler=run_check_streaming)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args, load_config(getattr(args, "config", None)))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,212 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+import torch.nn as nn
+from data_cache import ensure_cache, load_section, stratified_folds
+from trainer import evaluate, fit, split_tensors
+from sweep import build_optimizer
+import gesture_training
+import pose_training
+
+# Stratified k-fold cross-validation of the pose and gesture architectures
+#
+# Every sample is assigned to one of k folds with each class (poseGestureIndex) spread evenly over
+# them. Each fold is held out once while the model trains on the others, so every sample is
+# predicted by a model that never saw it. Folds run in parallel worker processes, which all
+# memory-map the same binary data cache instead of parsing the JSON again. Per architecture the
+# fold accuracies, the summed confusion matrix and the timings are reported.
+
+# Architecture name -> (data section, model class)
+MODELS = {
+    "pose": ("poses", pose_training.Net),
+    "low": ("gestures", gesture_training.LowNet),
+    "medium": ("gestures", gesture_training.MediumNet),
+    "high": ("gestures", gesture_training.HighNet),
+    "temporal": ("gestures", gesture_training.TemporalNet)
+}
+
+
+def confusion_matrix(labels: np.ndarray, predictions: np.ndarray, num_classes: int) -> np.ndarray:
+    """
+    [true class, predicted class] counts.
+    """
+    return np.bincount(labels * num_classes + predictions, minlength=num_classes * num_classes) \
+        .reshape(num_classes, num_classes)
+
+
+# =============================================================================
+# Fold Execution (runs in worker processes)
+# =============================================================================
+def _run_fold(arch: str, fold: int, json_path: str, num_folds: int, num_classes: int, options: dict) -> dict:
+    """
+    Trains the architecture on every fold but one and evaluates it on the held out fold.
+    With patience set a stratified part of the training folds is used for early stopping.
+    """
+    start = time.perf_counter()
+    section, model_class = MODELS[arch]
+    inputs, labels, _ = load_section(json_path, section)
+    folds = stratified_folds(labels, num_folds, options["seed"])
+    train_idx, test_idx = torch.from_numpy(np.flatnonzero(folds != fold)), torch.from_numpy(np.flatnonzero(folds == fold))
+    inputs, labels = torch.from_numpy(inputs), torch.from_numpy(labels)
+    train_data, test_data = (inputs[train_idx], labels[train_idx]), (inputs[test_idx], labels[test_idx])
+
+    val_data = None
+    if options["patience"] is not None:
+        train_data, val_data = split_tensors(*train_data, options["val_fraction"], options["seed"])
+
+    torch.manual_seed(options["seed"] + fold)
+    model = model_class(inputs.shape[1], num_classes)
+    optimizer = build_optimizer(options["optimizer"], model.parameters(), options["lr"])
+    criterion = nn.CrossEntropyLoss()
+    model, summary = fit(model, *train_data, criterion, optimizer, torch.device('cpu'), options["num_epochs"],
+                         options["batch_size"], log_every=0, val_data=val_data, patience=options["patience"],
+                         run_name=f"cv_{arch}_fold{fold}")
+
+    predict_start = time.perf_counter()
+    model.eval()
+    with torch.no_grad():
+        predictions = model(test_data[0]).argmax(dim=1).numpy()
+    test_loss, _ = evaluate(model, *test_data, criterion)
+    matrix = confusion_matrix(test_data[1].numpy(), predictions, num_classes)
+    return {
+        "arch": arch,
+        "fold": fold,
+        "train_samples": int(train_data[1].shape[0]),
+        "test_samples": int(test_data[1].shape[0]),
+        "accuracy": float(np.trace(matrix) / max(matrix.sum(), 1)),
+        "test_loss": test_loss.item(),
+        "epochs_run": summary["epochs_run"],
+        "train_seconds": summary["seconds"],
+        "predict_seconds": time.perf_counter() - predict_start,
+        "seconds": time.perf_counter() - start,
+        "confusion": matrix.tolist()
+    }
+
+
+# =============================================================================
+# Aggregation
+# =============================================================================
+def aggregate(arch: str, folds: list, class_names: list, wall_seconds: float) -> dict:
+    """
+    Mean/std of the fold accuracies, the confusion matrix summed over the folds with per-class
+    recall and precision, and the timings of one architecture.
+    """
+    folds = sorted(folds, key=lambda f: f["fold"])
+    accuracies = np.array([f["accuracy"] for f in folds])
+    matrix = np.sum([f["confusion"] for f in folds], axis=0)
+    true_counts, predicted_counts = matrix.sum(axis=1), matrix.sum(axis=0)
+    diagonal = np.diag(matrix).astype(np.float64)
+    return {
+        "arch": arch,
+        "folds": len(folds),
+        "accuracy_mean": float(accuracies.mean()),
+        "accuracy_std": float(accuracies.std(ddof=1)) if len(folds) > 1 else 0.0,
+        "fold_accuracies": accuracies.tolist(),
+        "classes": class_names,
+        "confusion": matrix.tolist(),
+        "recall": np.divide(diagonal, true_counts, out=np.zeros_like(diagonal), where=true_counts > 0).tolist(),
+        "precision": np.divide(diagonal, predicted_counts, out=np.zeros_like(diagonal),
+                               where=predicted_counts > 0).tolist(),
+        "train_seconds_mean": float(np.mean([f["train_seconds"] for f in folds])),
+        "fold_seconds_total": float(np.sum([f["seconds"] for f in folds])),
+        "wall_seconds": wall_seconds
+    }
+
+
+def print_summary(result: dict):
+    print(f"{result['arch']}: accuracy {100 * result['accuracy_mean']:.2f}% ± {100 * result['accuracy_std']:.2f}% "
+          f"over {result['folds']} folds, {result['train_seconds_mean']:.1f}s training per fold, "
+          f"{result['wall_seconds']:.1f}s wall time")
+    names = result["classes"]
+    width = max(8, max(len(name) for name in names) + 1)
+    print(" " * width + "".join(f"{name[:width - 1]:>{width}}" for name in names) + f"{'recall':>{width}}")
+    for name, row, recall in zip(names, result["confusion"], result["recall"]):
+        print(f"{name:<{width}}" + "".join(f"{count:>{width}}" for count in row) + f"{100 * recall:>{width - 1}.1f}%")
+
+
+# =============================================================================
+# Cross-Validation Runner
+# =============================================================================
+def cross_validate(json_path: str, archs=("pose", "low", "medium", "high"), num_folds: int = 5,
+                   num_epochs: int = 100, batch_size: int = 32, optimizer: str = "sgd", lr: float = 1e-3,
+                   patience: int = 20, val_fraction: float = 0.1, seed: int = 0, max_workers: int = None,
+                   output_path: str = None) -> dict:
+    """
+    Runs stratified k-fold cross-validation of each architecture with every (architecture, fold)
+    pair as a job in a process pool. The defaults follow the training scripts (SGD, lr 1e-3,
+    early stopping). Returns {arch: aggregated result} and appends the results to output_path.
+    """
+    for arch in archs:
+        if arch not in MODELS:
+            raise ValueError(f"Unknown architecture {arch!r}, expected one of {list(MODELS)}")
+    # Build the cache once up front so workers only ever memory-map it
+    ensure_cache(json_path)
+    options = {"num_epochs": num_epochs, "batch_size": batch_size, "optimizer": optimizer, "lr": lr,
+               "patience": patience, "val_fraction": val_fraction, "seed": seed}
+    sections = {}
+    for arch in archs:
+        section = MODELS[arch][0]
+        if section not in sections:
+            labels, section_meta = load_section(json_path, section)[1:]
+            names = [str(index) for index in range(int(labels.max()) + 1)]
+            for info in section_meta["classes"]:
+                names[info["index"]] = info["name"]
+            sections[section] = (len(names), names)
+
+    jobs = [(arch, fold) for arch in archs for fold in range(num_folds)]
+    cpu_count = os.cpu_count() or 1
+    num_workers = max(1, min(len(jobs), max_workers or cpu_count, cpu_count))
+    threads_per_worker = max(1, cpu_count // num_workers)
+    print(f"Cross-validating {list(archs)} with {num_folds} folds on {num_workers} workers")
+
+    start = time.perf_counter()
+    fold_results = {arch: [] for arch in archs}
+    finished_at = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=gesture_training._init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = [pool.submit(_run_fold, arch, fold, json_path, num_folds, sections[MODELS[arch][0]][0], options)
+                   for arch, fold in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            fold_results[result["arch"]].append(result)
+            finished_at[result["arch"]] = time.perf_counter() - start
+            print(f"{result['arch']} fold {result['fold'] + 1}/{num_folds}: accuracy {100 * result['accuracy']:.2f}% "
+                  f"({result['epochs_run']} epochs, {result['seconds']:.1f}s)")
+
+    results = {}
+    for arch in archs:
+        results[arch] = aggregate(arch, fold_results[arch], sections[MODELS[arch][0]][1], finished_at[arch])
+        results[arch].update(options, data=json_path)
+        print_summary(results[arch])
+    print(f"Cross-validation finished in {time.perf_counter() - start:.1f}s")
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, 'a') as f:
+            for result in results.values():
+                f.write(json.dumps(result) + "\n")
+        print(f"Results appended to {output_path}")
+    return results
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    # Configurations
+    json_file = "PoseGestureData.json"
+    archs = ["pose", "low", "medium", "high"]
+    num_folds = 5
+    num_epochs = 100  # Upper bound per fold, early stopping usually ends training sooner
+    patience = 20
+    output_path = os.path.join(".logs", "cross_validation.jsonl")
+
+    cross_validate(json_file, archs, num_folds, num_epochs, patience=patience, output_path=output_path)
+
+if __name__ == "__main__":
+    main()
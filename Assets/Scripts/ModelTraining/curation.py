@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+from data_cache import SECTIONS, load_section
+from recording_store import RecordingStore, json_to_store, write_sections
+
+# Curation of the recorded training data: near-duplicates, likely mislabels and class balance
+#
+# Features are standardised per section (z-scores) and distances are RMS over the features, so
+# one radius means the same for poses (angles and distances) and gestures. Near-duplicates are
+# found per class with a KD-tree: each sample's k nearest neighbours within the radius form a
+# bounded-size graph, and samples are kept greedily in recording order, dropping those next to an
+# already kept one. Passes repeat on the kept samples until no two of them are closer than the
+# radius. Likely mislabels are samples closer to another class' centroid than to their own,
+# found with blocked matrix distances. The result is either a curated (deduplicated, optionally
+# balanced) data file or per-sample weights for trainer.fit's weighted sampling.
+
+_CHUNK_ROWS = 1 << 16
+
+_UNDECIDED, _KEPT, _DROPPED = 0, 1, 2
+
+
+def standardise(inputs: np.ndarray) -> np.ndarray:
+    """
+    Z-scores every feature and divides by sqrt(num_features), so Euclidean distances are RMS
+    distances in units of standard deviations. Constant features are left at 0. Works a chunk of
+    rows at a time, so only the float32 output is held in memory besides the (memory-mapped) inputs.
+    """
+    mean = np.zeros(inputs.shape[1])
+    square = np.zeros(inputs.shape[1])
+    for start in range(0, inputs.shape[0], _CHUNK_ROWS):
+        rows = np.asarray(inputs[start:start + _CHUNK_ROWS], dtype=np.float64)
+        mean += rows.sum(axis=0)
+        square += (rows * rows).sum(axis=0)
+    mean /= max(inputs.shape[0], 1)
+    std = np.sqrt(np.maximum(square / max(inputs.shape[0], 1) - mean * mean, 0.0))
+    scale = np.divide(1.0, std * np.sqrt(inputs.shape[1]), out=np.zeros_like(std), where=std > 0)
+    points = np.empty(inputs.shape, dtype=np.float32)
+    for start in range(0, inputs.shape[0], _CHUNK_ROWS):
+        rows = np.asarray(inputs[start:start + _CHUNK_ROWS], dtype=np.float64)
+        points[start:start + rows.shape[0]] = (rows - mean) * scale
+    return points
+
+# =============================================================================
+# Near-Duplicates
+# =============================================================================
+def _greedy_keep(neighbours: np.ndarray) -> np.ndarray:
+    """
+    neighbours [m, k] holds each sample's earlier neighbours within the radius (m where there is
+    none). Keeps a sample when all its earlier neighbours are dropped and drops it as soon as one
+    is kept, resolving whole waves of samples at once. Returns the kept mask.
+    """
+    m = neighbours.shape[0]
+    state = np.full(m + 1, _UNDECIDED, dtype=np.int8)
+    state[m] = _DROPPED
+    undecided = np.arange(m)
+    while undecided.shape[0]:
+        states = state[neighbours[undecided]]
+        drop = (states == _KEPT).any(axis=1)
+        keep = ~drop & (states == _DROPPED).all(axis=1)
+        state[undecided[drop]] = _DROPPED
+        state[undecided[keep]] = _KEPT
+        undecided = undecided[~(drop | keep)]
+    return state[:m] == _KEPT
+
+
+def near_duplicates(points: np.ndarray, radius: float, k: int = 16, max_passes: int = 10) -> (np.ndarray, int):
+    """
+    Returns (kept mask, passes) for one class' standardised points in recording order. Exact copies
+    are removed up front; the kept samples are at least radius apart and every dropped sample is
+    near a kept one.
+    """
+    keep = np.zeros(points.shape[0], dtype=bool)
+    if points.shape[0] == 0:
+        return keep, 0
+    _, first = np.unique(points, axis=0, return_index=True)
+    candidates = np.sort(first)
+    passes = 0
+    while passes < max_passes and candidates.shape[0] > 1:
+        passes += 1
+        subset = points[candidates]
+        count = min(k + 1, subset.shape[0])
+        distances, neighbours = cKDTree(subset).query(subset, k=count, distance_upper_bound=radius, workers=-1)
+        distances, neighbours = distances.reshape(-1, count), neighbours.reshape(-1, count)
+        # Only earlier samples within the radius matter, missing neighbours come back as len(subset)
+        earlier = (neighbours < np.arange(subset.shape[0])[:, None]) & (distances <= radius)
+        kept = _greedy_keep(np.where(earlier, neighbours, subset.shape[0]))
+        if kept.all():
+            break
+        candidates = candidates[kept]
+    keep[candidates] = True
+    return keep, passes
+
+# =============================================================================
+# Mislabels
+# =============================================================================
+def centroid_distances(points: np.ndarray, labels: np.ndarray, classes: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Class centroids [C, F] and the distance of every point to every centroid [N, C], a block of
+    rows at a time.
+    """
+    positions = np.searchsorted(classes, labels)
+    counts = np.bincount(positions, minlength=classes.shape[0])
+    centroids = np.zeros((classes.shape[0], points.shape[1]))
+    np.add.at(centroids, positions, points)
+    centroids /= np.maximum(counts, 1)[:, None]
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    distances = np.empty((points.shape[0], classes.shape[0]), dtype=np.float32)
+    for start in range(0, points.shape[0], _CHUNK_ROWS):
+        rows = points[start:start + _CHUNK_ROWS].astype(np.float64)
+        squared = (rows * rows).sum(axis=1)[:, None] - 2 * rows @ centroids.T + centroid_norms
+        distances[start:start + rows.shape[0]] = np.sqrt(np.maximum(squared, 0.0))
+    return centroids, distances
+
+
+def mislabelled(distances: np.ndarray, labels: np.ndarray, classes: np.ndarray, margin: float = 0.0):
+    """
+    Samples whose own class centroid is more than (1 + margin) times as far as the nearest other
+    centroid. Returns (mask, nearest other class index per sample).
+    """
+    own = np.searchsorted(classes, labels)
+    own_distance = distances[np.arange(labels.shape[0]), own]
+    others = distances.copy()
+    others[np.arange(labels.shape[0]), own] = np.inf
+    nearest = others.argmin(axis=1)
+    return own_distance > (1.0 + margin) * others[np.arange(labels.shape[0]), nearest], classes[nearest]
+
+# =============================================================================
+# Curation
+# =============================================================================
+def analyse_section(inputs: np.ndarray, labels: np.ndarray, section_meta: dict, radius: float = 0.02,
+                    k: int = 16, margin: float = 0.0) -> dict:
+    """
+    Near-duplicates and likely mislabels of one section. Returns the masks over the rows
+    ("duplicate", "mislabelled"), the nearest other class of each row and a per-class summary.
+    """
+    names = {info["index"]: info["name"] for info in section_meta["classes"]}
+    labels = np.asarray(labels)
+    classes = np.unique(labels)
+    points = standardise(inputs)
+
+    duplicate = np.zeros(labels.shape[0], dtype=bool)
+    summary = []
+    _, distances = centroid_distances(points, labels, classes)
+    wrong, nearest = mislabelled(distances, labels, classes, margin)
+    for index in classes:
+        rows = np.flatnonzero(labels == index)
+        keep, passes = near_duplicates(points[rows], radius, k)
+        duplicate[rows[~keep]] = True
+        confused = np.unique(nearest[rows[wrong[rows]]], return_counts=True)
+        summary.append({
+            "index": int(index),
+            "name": names.get(int(index), str(index)),
+            "samples": int(rows.shape[0]),
+            "duplicates": int((~keep).sum()),
+            "mislabelled": int(wrong[rows].sum()),
+            "passes": passes,
+            "closer_to": {names.get(int(c), str(c)): int(n) for c, n in zip(*confused)}
+        })
+    return {"duplicate": duplicate, "mislabelled": wrong, "nearest_class": nearest, "classes": summary}
+
+
+def keep_mask(analysis: dict, drop_duplicates: bool = True, drop_mislabelled: bool = False) -> np.ndarray:
+    keep = np.ones(analysis["duplicate"].shape[0], dtype=bool)
+    if drop_duplicates:
+        keep &= ~analysis["duplicate"]
+    if drop_mislabelled:
+        keep &= ~analysis["mislabelled"]
+    return keep
+
+
+def balance(labels: np.ndarray, keep: np.ndarray, per_class: int = None, seed: int = 0) -> np.ndarray:
+    """
+    Undersamples the kept rows to per_class rows per class (default: the smallest class).
+    Returns the new keep mask, rows stay in recording order.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    classes, counts = np.unique(labels[keep], return_counts=True)
+    target = counts.min() if per_class is None else per_class
+    balanced = np.zeros_like(keep)
+    for index in classes:
+        rows = np.flatnonzero(keep & (labels == index))
+        balanced[rng.choice(rows, min(target, rows.shape[0]), replace=False) if rows.shape[0] > target else rows] = True
+    return balanced
+
+
+def balanced_weights(labels: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """
+    Per-row weights for trainer.fit's sampler: 0 for dropped rows, and 1 / (kept rows of the class)
+    otherwise so every class is drawn equally often. Scaled to a mean of 1 over the kept rows.
+    """
+    labels = np.asarray(labels)
+    classes, positions = np.unique(labels, return_inverse=True)
+    counts = np.bincount(positions, weights=keep.astype(np.float64), minlength=classes.shape[0])
+    weights = np.where(keep, 1.0 / np.maximum(counts[positions], 1.0), 0.0)
+    return (weights * keep.sum() / max(weights.sum(), 1e-12)).astype(np.float32)
+
+
+def sample_weights(json_path: str, section: str, radius: float = 0.02, k: int = 16, drop_duplicates: bool = True,
+                   drop_mislabelled: bool = False, margin: float = 0.0) -> np.ndarray:
+    """
+    Balanced sampling weights for every row of a section, with near-duplicates (and optionally
+    likely mislabels) weighted 0. Rows are in the order of data_cache.load_section.
+    """
+    inputs, labels, section_meta = load_section(json_path, section)
+    analysis = analyse_section(inputs, labels, section_meta, radius, k, margin)
+    return balanced_weights(labels, keep_mask(analysis, drop_duplicates, drop_mislabelled))
+
+
+def print_summary(section: str, analysis: dict):
+    print(f"{section}:")
+    print(f"  {'class':<16}{'samples':>9}{'dupes':>8}{'mislab.':>9}{'kept':>8}  closer to")
+    for entry in analysis["classes"]:
+        closer = ", ".join(f"{name} ({count})" for name, count in entry["closer_to"].items())
+        print(f"  {entry['name']:<16}{entry['samples']:>9}{entry['duplicates']:>8}{entry['mislabelled']:>9}"
+              f"{entry['kept']:>8}  {closer}")
+
+
+def curate(json_path: str, output_dir: str, sections=SECTIONS, radius: float = 0.02, k: int = 16,
+           margin: float = 0.0, drop_mislabelled: bool = False, balance_classes: bool = False,
+           per_class: int = None, output_data: str = None, seed: int = 0) -> dict:
+    """
+    Analyses the sections and writes report.json plus <section>_weights.npy (sampling weights for
+    trainer.fit) to output_dir. With output_data (a .json file or recording store) the curated
+    rows are written there: deduplicated, without likely mislabels if drop_mislabelled, and
+    undersampled to equal class sizes if balance_classes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report = {"data": json_path, "radius": radius, "k": k, "margin": margin, "sections": {}}
+    kept_rows, class_order = {}, {}
+    for section in sections:
+        start = time.perf_counter()
+        inputs, labels, section_meta = load_section(json_path, section)
+        analysis = analyse_section(inputs, labels, section_meta, radius, k, margin)
+        keep = keep_mask(analysis, True, drop_mislabelled)
+        np.save(os.path.join(output_dir, f"{section}_weights.npy"), balanced_weights(labels, keep))
+        if balance_classes:
+            keep = balance(labels, keep, per_class, seed)
+        kept_rows[section] = keep
+        class_order[section] = section_meta["classes"]
+        # Per class counts of the rows actually written, after the chosen drops and balancing
+        for entry in analysis["classes"]:
+            entry["kept"] = int(keep[labels == entry["index"]].sum())
+        report["sections"][section] = {
+            "samples": int(labels.shape[0]),
+            "duplicates": int(analysis["duplicate"].sum()),
+            "mislabelled": int(analysis["mislabelled"].sum()),
+            "kept": int(keep.sum()),
+            "seconds": time.perf_counter() - start,
+            "classes": analysis["classes"],
+            "mislabelled_rows": np.flatnonzero(analysis["mislabelled"]).tolist()
+        }
+        print_summary(section, analysis)
+
+    if output_data is not None:
+        _write_curated(json_path, output_data, class_order, kept_rows)
+        report["output_data"] = output_data
+        print(f"Curated data written to {output_data}")
+    with open(os.path.join(output_dir, "report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Curation report written to {output_dir}")
+    return report
+
+
+def _write_curated(json_path: str, output_path: str, class_order: dict, kept_rows: dict):
+    # Read the rows back at the source precision, in the same class and row order as the cache
+    scratch = tempfile.mkdtemp() if json_path.endswith(".json") else None
+    try:
+        source = json_to_store(json_path, os.path.join(scratch, "store"), "float64") if scratch is not None \
+            else RecordingStore(json_path)
+        sections = {}
+        for section, classes in class_order.items():
+            keep = kept_rows[section]
+            sections[section] = {}
+            for info in classes:
+                rows = np.asarray(source.class_rows(section, info["name"]))
+                sections[section][info["name"]] = (info["index"], rows[keep[info["start"]:info["start"] + info["count"]]])
+        write_sections(sections, output_path, json_path)
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate and likely mislabelled samples and balance classes")
+    parser.add_argument("--data", default="PoseGestureData.json")
+    parser.add_argument("--output", default=os.path.join(".logs", "curation"), help="Report and weights folder")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--radius", type=float, default=0.02, help="RMS z-score distance of near-duplicates")
+    parser.add_argument("--neighbours", type=int, default=16)
+    parser.add_argument("--margin", type=float, default=0.0, help="Relative margin before a sample counts as mislabelled")
+    parser.add_argument("--drop-mislabelled", action="store_true")
+    parser.add_argument("--balance", action="store_true", help="Undersample the curated data to equal class sizes")
+    parser.add_argument("--per-class", type=int, default=None)
+    parser.add_argument("--write", default=None, help="Write the curated data to this .json file or store")
+    args = parser.parse_args()
+    curate(args.data, args.output, args.sections, args.radius, args.neighbours, args.margin, args.drop_mislabelled,
+           args.balance, args.per_class, args.write)
+
+if __name__ == "__main__":
+    main()
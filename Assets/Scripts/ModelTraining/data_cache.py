@@ -0,0 +1,384 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+
+# Binary, memory-mapped cache of PoseGestureData.json
+#
+# The JSON file is converted once into columnar .npy files (float32 inputs, int64 labels)
+# stored in a hidden ".cache" directory next to it. Later runs memory-map those files
+# instead of reparsing the JSON. The cache is rebuilt whenever the source file's hash changes.
+
+SECTIONS = ("poses", "gestures")
+CACHE_VERSION = 1
+
+_CHUNK_SIZE = 1 << 20
+_LOOKAHEAD = 1 << 16
+
+_TOKEN = re.compile(
+    r'\s*(?:([{}\[\],:])|"((?:[^"\\]|\\.)*)"|(-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|(true|false|null))'
+)
+_ROW = re.compile(r'\s*\[([^\[\]]*)\]')
+
+
+# =============================================================================
+# Cache Location and Validation
+# =============================================================================
+def cache_dir(json_path: str) -> str:
+    """
+    Returns the directory holding the binary cache for the given JSON file.
+    The directory starts with a dot so Unity does not import it as an asset.
+    """
+    json_path = os.path.abspath(json_path)
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    return os.path.join(os.path.dirname(json_path), ".cache", stem)
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hashes a file in fixed size chunks so large datasets are never fully held in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(directory: str):
+    try:
+        with open(os.path.join(directory, "meta.json"), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(directory: str, meta: dict):
+    tmp_path = os.path.join(directory, "meta.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+
+def ensure_cache(json_path: str, force: bool = False) -> dict:
+    """
+    Makes sure an up to date cache exists for the JSON file and returns its metadata.
+    Size and modification time are checked first, the content hash is only computed
+    when they differ from the cached values.
+    """
+    directory = cache_dir(json_path)
+    stat = os.stat(json_path)
+    meta = None if force else _read_meta(directory)
+
+    if meta is not None and meta.get("version") == CACHE_VERSION:
+        if meta["source_size"] == stat.st_size and meta["source_mtime_ns"] == stat.st_mtime_ns:
+            return meta
+        sha = file_sha256(json_path)
+        if meta["source_sha256"] == sha:
+            # Same content with a new timestamp (e.g. re-copied from the HMD), keep the cache
+            meta["source_size"] = stat.st_size
+            meta["source_mtime_ns"] = stat.st_mtime_ns
+            _write_meta(directory, meta)
+            return meta
+    else:
+        sha = file_sha256(json_path)
+
+    print(f"Building data cache for {json_path}")
+    return build_cache(json_path, sha)
+
+
+# =============================================================================
+# Streaming Conversion
+# =============================================================================
+class _RowBuffer:
+    """
+    Preallocated row storage that grows geometrically when the estimate is exceeded.
+    """
+    def __init__(self, size_hint: int, dtype=np.float32):
+        self.size_hint = size_hint
+        self.dtype = dtype
+        self.rows = None
+        self.count = 0
+
+    def append(self, row: np.ndarray):
+        if self.rows is None:
+            capacity = max(64, self.size_hint // (row.size * 16))
+            self.rows = np.empty((capacity, row.size), dtype=self.dtype)
+        elif row.size != self.rows.shape[1]:
+            raise ValueError(f"Inconsistent feature size: expected {self.rows.shape[1]}, got {row.size}")
+        if self.count == self.rows.shape[0]:
+            grown = np.empty((self.count * 2, self.rows.shape[1]), dtype=self.dtype)
+            grown[:self.count] = self.rows
+            self.rows = grown
+        self.rows[self.count] = row
+        self.count += 1
+
+    def finish(self) -> np.ndarray:
+        if self.rows is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self.rows[:self.count]
+
+
+class _JsonStream:
+    """
+    Minimal pull tokenizer over a file read in chunks.
+    Only the structure of PoseGestureData.json is interpreted, everything else is skipped.
+    """
+    def __init__(self, f, dtype=np.float32):
+        self.f = f
+        self.dtype = dtype
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof or len(self.buf) - self.pos >= _LOOKAHEAD:
+            return
+        chunk = self.f.read(_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def next(self):
+        self._fill()
+        match = _TOKEN.match(self.buf, self.pos)
+        if match is None:
+            raise ValueError(f"Malformed JSON near: {self.buf[self.pos:self.pos + 40]!r}")
+        self.pos = match.end()
+        punct, string, number, literal = match.groups()
+        if punct is not None:
+            return punct
+        if string is not None:
+            return ("str", json.loads(f'"{string}"') if "\\" in string else string)
+        if number is not None:
+            return ("num", float(number) if any(c in number for c in ".eE") else int(number))
+        return ("lit", literal)
+
+    def expect(self, punct: str):
+        token = self.next()
+        if token != punct:
+            raise ValueError(f"Expected {punct!r} but found {token!r}")
+
+    def peek_char(self) -> str:
+        self._fill()
+        while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+            self.pos += 1
+            if self.pos == len(self.buf):
+                self._fill()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def next_row(self) -> np.ndarray:
+        """
+        Reads a flat array of numbers and parses it in one vectorised call.
+        """
+        self._fill()
+        match = _ROW.match(self.buf, self.pos)
+        while match is None and not self.eof:
+            # Row larger than the lookahead window, read more before retrying
+            chunk = self.f.read(_CHUNK_SIZE)
+            self.eof = not chunk
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+            match = _ROW.match(self.buf, self.pos)
+        if match is None:
+            raise ValueError("Unterminated data row")
+        self.pos = match.end()
+        body = match.group(1)
+        if not body.strip():
+            return np.empty(0, dtype=self.dtype)
+        return np.array(body.split(','), dtype=self.dtype)
+
+    def skip_value(self, token=None):
+        token = self.next() if token is None else token
+        if token in ("{", "["):
+            depth = 1
+            while depth:
+                token = self.next()
+                if token in ("{", "["):
+                    depth += 1
+                elif token in ("}", "]"):
+                    depth -= 1
+
+    def members(self):
+        """
+        Iterates over the keys of the object whose opening brace was just consumed.
+        """
+        if self.peek_char() == "}":
+            self.next()
+            return
+        while True:
+            kind, key = self.next()
+            if kind != "str":
+                raise ValueError(f"Expected object key but found {key!r}")
+            self.expect(":")
+            yield key
+            token = self.next()
+            if token == "}":
+                return
+            if token != ",":
+                raise ValueError(f"Expected ',' or '}}' but found {token!r}")
+
+
+def _parse_class(stream: _JsonStream, rows: _RowBuffer, section: str, name: str) -> dict:
+    entry = {"index": None, "start": rows.count, "count": 0}
+    stream.expect("{")
+    for key in stream.members():
+        if key == "poseGestureIndex":
+            entry["index"] = stream.next()[1]
+        elif key == "poseGestureData" and stream.peek_char() == "[":
+            stream.next()
+            while stream.peek_char() != "]":
+                row = stream.next_row()
+                if row.size == 0:
+                    raise ValueError(f"Empty poseGestureData row in class {name!r} of section {section!r}")
+                rows.append(row)
+                if stream.peek_char() == ",":
+                    stream.next()
+            stream.next()
+        else:
+            stream.skip_value()
+    entry["count"] = rows.count - entry["start"]
+    return entry
+
+
+def _parse_section(stream: _JsonStream, rows: _RowBuffer, section: str) -> list:
+    classes = []
+    token = stream.next()
+    if token == ("lit", "null"):
+        return classes
+    if token != "{":
+        raise ValueError(f"Expected section object but found {token!r}")
+    for name in stream.members():
+        entry = _parse_class(stream, rows, section, name)
+        entry["name"] = name
+        classes.append(entry)
+    return classes
+
+
+def stream_parse(json_path: str, dtype=np.float32) -> dict:
+    """
+    Stream-parses the JSON file straight into per-section row arrays (float32 unless dtype is given).
+    Returns {section: (inputs, labels, classes)} without building Python lists of samples.
+    """
+    size_hint = os.path.getsize(json_path)
+    buffers = {section: _RowBuffer(size_hint, dtype) for section in SECTIONS}
+    classes = {section: [] for section in SECTIONS}
+
+    with open(json_path, 'r', encoding='utf-8-sig') as f:
+        stream = _JsonStream(f, dtype)
+        stream.expect("{")
+        for key in stream.members():
+            if key in SECTIONS:
+                classes[key] = _parse_section(stream, buffers[key], key)
+            else:
+                stream.skip_value()
+
+    parsed = {}
+    for section in SECTIONS:
+        inputs = buffers[section].finish()
+        labels = np.empty(inputs.shape[0], dtype=np.int64)
+        for entry in classes[section]:
+            labels[entry["start"]:entry["start"] + entry["count"]] = entry["index"]
+        parsed[section] = (inputs, labels, classes[section])
+    return parsed
+
+
+def build_cache(json_path: str, sha: str = None) -> dict:
+    """
+    Converts the JSON file into the binary cache, replacing any previous cache.
+    Files are written to a staging directory and swapped in so readers never see a partial cache.
+    """
+    directory = cache_dir(json_path)
+    staging = directory + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    stat = os.stat(json_path)
+    sha = sha or file_sha256(json_path)
+    meta = {
+        "version": CACHE_VERSION,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_sha256": sha,
+        "sections": {}
+    }
+    for section, (inputs, labels, classes) in stream_parse(json_path).items():
+        np.save(os.path.join(staging, f"{section}_inputs.npy"), inputs)
+        np.save(os.path.join(staging, f"{section}_labels.npy"), labels)
+        meta["sections"][section] = {
+            "num_samples": int(inputs.shape[0]),
+            "input_size": int(inputs.shape[1]),
+            "classes": classes
+        }
+    _write_meta(staging, meta)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    return meta
+
+
+# =============================================================================
+# Loading
+# =============================================================================
+def _load_array(path: str, num_samples: int) -> np.ndarray:
+    # Empty arrays cannot be memory-mapped
+    if num_samples == 0:
+        return np.load(path)
+    # Copy-on-write mapping: pages are shared between processes and never written back
+    return np.load(path, mmap_mode='c')
+
+
+def load_section(json_path: str, section: str):
+    """
+    Returns memory-mapped (inputs, labels, section_meta) arrays for "poses" or "gestures".
+    inputs is float32 [N, input_size] and labels is int64 [N].
+    """
+    if section not in SECTIONS:
+        raise ValueError(f"Unknown section {section!r}, expected one of {SECTIONS}")
+    meta = ensure_cache(json_path)
+    directory = cache_dir(json_path)
+    section_meta = meta["sections"][section]
+    num_samples = section_meta["num_samples"]
+    inputs = _load_array(os.path.join(directory, f"{section}_inputs.npy"), num_samples)
+    labels = _load_array(os.path.join(directory, f"{section}_labels.npy"), num_samples)
+    return inputs, labels, section_meta
+
+
+def stratified_split(labels: np.ndarray, val_fraction: float = 0.2, seed: int = 0):
+    """
+    Splits sample indices into (train, validation) so each class keeps the same proportion
+    in both sets. Every class keeps at least one training sample.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(labels.shape[0])
+    # Stable sort by label keeps the random order within each class
+    order = order[np.argsort(labels[order], kind='stable')]
+    classes, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+
+    val_counts = np.minimum(np.round(counts * val_fraction).astype(np.int64), counts - 1)
+    rank = np.arange(order.shape[0]) - np.repeat(starts, counts)
+    is_val = rank < np.repeat(val_counts, counts)
+    return np.sort(order[~is_val]), np.sort(order[is_val])
+
+
+def stratified_folds(labels: np.ndarray, num_folds: int = 5, seed: int = 0) -> np.ndarray:
+    """
+    Assigns every sample to one of num_folds cross-validation folds so each class is spread as
+    evenly as possible over the folds. Returns the fold index of each sample.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(labels.shape[0])
+    order = order[np.argsort(labels[order], kind='stable')]
+    classes, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+
+    rank = np.arange(order.shape[0]) - np.repeat(starts, counts)
+    # A random starting fold per class keeps the leftover samples of each class from all landing in fold 0
+    offsets = rng.integers(0, num_folds, classes.shape[0])
+    folds = np.empty(labels.shape[0], dtype=np.int64)
+    folds[order] = (rank + np.repeat(offsets, counts)) % num_folds
+    return folds
@@ -0,0 +1,84 @@
+import glob
+import hashlib
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from data_cache import cache_dir, ensure_cache
+
+# Knowledge distillation of the larger gesture models into the one shipped to the headset
+#
+# The teacher (one trained model, or an ensemble whose logits are averaged) is run over the
+# dataset once and its logits are stored in the data cache, keyed by the data and the teacher
+# weights, so student epochs never run a teacher forward pass. The student is trained on a
+# mix of the usual cross entropy and the KL divergence to the temperature-softened teacher output.
+
+
+class DistillationLoss(nn.Module):
+    """
+    alpha * T^2 * KL(teacher || student) on temperature T softened outputs plus
+    (1 - alpha) * cross entropy on the labels. Without teacher logits (e.g. validation)
+    it is plain cross entropy.
+    """
+    def __init__(self, temperature: float = 4.0, alpha: float = 0.7):
+        super(DistillationLoss, self).__init__()
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def forward(self, outputs: torch.Tensor, labels: torch.Tensor, teacher_logits: torch.Tensor = None):
+        hard_loss = F.cross_entropy(outputs, labels)
+        if teacher_logits is None:
+            return hard_loss
+        soft_loss = F.kl_div(F.log_softmax(outputs / self.temperature, dim=1),
+                             F.log_softmax(teacher_logits / self.temperature, dim=1),
+                             reduction='batchmean', log_target=True)
+        return self.alpha * self.temperature ** 2 * soft_loss + (1 - self.alpha) * hard_loss
+
+
+def ensemble_logits(teachers, inputs: torch.Tensor, batch_size: int = 4096) -> torch.Tensor:
+    """
+    Mean logits of the teacher models over all inputs.
+    """
+    total = None
+    with torch.no_grad():
+        for teacher in teachers:
+            teacher.eval()
+            logits = torch.cat([teacher(inputs[i:i + batch_size]) for i in range(0, inputs.shape[0], batch_size)])
+            total = logits if total is None else total + logits
+    return total / len(teachers)
+
+
+def teacher_key(json_path: str, teachers) -> str:
+    """
+    Identifies a (dataset, teacher weights) pair.
+    """
+    digest = hashlib.sha256(ensure_cache(json_path)["source_sha256"].encode())
+    for teacher in teachers:
+        for name, tensor in teacher.state_dict().items():
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def cached_teacher_logits(json_path: str, teachers, inputs: torch.Tensor) -> torch.Tensor:
+    """
+    Teacher logits for every row of inputs, computed once per (data, teacher weights) pair and
+    stored next to the binary data cache, which drops them whenever the data changes.
+    """
+    directory = cache_dir(json_path)
+    path = os.path.join(directory, f"teacher_logits_{teacher_key(json_path, teachers)}.npy")
+    if os.path.exists(path):
+        logits = np.load(path)
+        if logits.shape[0] == inputs.shape[0]:
+            return torch.from_numpy(logits)
+
+    logits = ensemble_logits(teachers, inputs.float()).cpu().numpy().astype(np.float32)
+    # Logits of earlier teachers are never read again
+    for stale in glob.glob(os.path.join(directory, "teacher_logits_*.npy")):
+        os.remove(stale)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, logits)
+    os.replace(tmp_path, path)
+    print(f"Teacher logits cached to {path}")
+    return torch.from_numpy(logits)
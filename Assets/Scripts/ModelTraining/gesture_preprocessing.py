@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import numpy as np
+
+# Vectorised NumPy port of HandGestureCalculations.cs
+#
+# Every function works on a batch of N trajectory buffers at once: positions are [N, T, 3]
+# and head rotations are Unity quaternions [N, 4] in (x, y, z, w) order. Arithmetic is done
+# in float32 like Unity so results match the on-device pipeline to float precision.
+# Single buffers ([T, 3] with a [4] rotation) are accepted and returned unbatched.
+#
+# fixtures/hand_gesture_calculations.json holds raw buffers and head rotations with the output
+# of the C# runAllTransformations for them; `python gesture_preprocessing.py` checks the port
+# against it.
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "hand_gesture_calculations.json")
+
+
+def _as_batch(buffers) -> (np.ndarray, bool):
+    buffers = np.asarray(buffers, dtype=np.float32)
+    if buffers.ndim == 2:
+        return buffers[None], True
+    if buffers.ndim != 3 or buffers.shape[2] != 3:
+        raise ValueError(f"Expected buffers of shape [N, T, 3] or [T, 3], got {buffers.shape}")
+    return buffers, False
+
+
+def quaternion_to_matrix(quaternions) -> np.ndarray:
+    """
+    Rotation matrices [N, 3, 3] for Unity quaternions [N, 4] (x, y, z, w),
+    using the same expansion as Unity's Quaternion * Vector3 operator.
+    """
+    q = np.asarray(quaternions, dtype=np.float32).reshape(-1, 4)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    x2, y2, z2 = x * 2, y * 2, z * 2
+    xx, yy, zz = x * x2, y * y2, z * z2
+    xy, xz, yz = x * y2, x * z2, y * z2
+    wx, wy, wz = w * x2, w * y2, w * z2
+    return np.stack([
+        np.stack([1 - (yy + zz), xy - wz, xz + wy], axis=-1),
+        np.stack([xy + wz, 1 - (xx + zz), yz - wx], axis=-1),
+        np.stack([xz - wy, yz + wx, 1 - (xx + yy)], axis=-1)
+    ], axis=1)
+
+
+def quaternion_inverse(quaternions) -> np.ndarray:
+    """
+    Quaternion.Inverse for unit quaternions: the conjugate.
+    """
+    q = np.array(quaternions, dtype=np.float32).reshape(-1, 4)
+    q[:, :3] *= -1
+    return q
+
+
+# =============================================================================
+# Pipeline Stages
+# =============================================================================
+def translate_normalization(buffers: np.ndarray) -> np.ndarray:
+    """
+    Translates every buffer so its first point is at the origin.
+    """
+    return buffers - buffers[:, :1, :]
+
+
+def rotate_buffers(buffers: np.ndarray, rotation_anchors) -> np.ndarray:
+    """
+    Rotates every point by the inverse of its buffer's head (center eye anchor) rotation.
+    """
+    matrices = quaternion_to_matrix(quaternion_inverse(rotation_anchors))
+    if matrices.shape[0] == 1 and buffers.shape[0] > 1:
+        matrices = np.broadcast_to(matrices, (buffers.shape[0], 3, 3))
+    return np.einsum('nij,ntj->nti', matrices, buffers)
+
+
+def find_bounding_widths(buffers: np.ndarray) -> np.ndarray:
+    """
+    Largest extent along x, y or z of each buffer's points, shape [N].
+    """
+    return (buffers.max(axis=1) - buffers.min(axis=1)).max(axis=1)
+
+
+def normalize_buffers(buffers: np.ndarray, bounding_widths: np.ndarray, bounding_cube_size: float) -> np.ndarray:
+    """
+    Scales each buffer so its bounding width matches the bounding cube size.
+    Like the C# version, a buffer with zero width produces NaN/inf values.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return buffers / bounding_widths[:, None, None] * np.float32(bounding_cube_size)
+
+
+def flatten_buffers(buffers: np.ndarray) -> np.ndarray:
+    """
+    Flattens [N, T, 3] buffers into [N, T * 3] rows of x, y, z triples.
+    """
+    return buffers.reshape(buffers.shape[0], -1)
+
+
+def run_all_transformations(buffers, rotation_anchors, bounding_cube_size: float = 1.0) -> np.ndarray:
+    """
+    Batched equivalent of HandGestureCalculations.runAllTransformations.
+    As on the device, the bounding width is measured on the translated (not yet rotated) buffer.
+    """
+    buffers, single = _as_batch(buffers)
+    translated = translate_normalization(buffers)
+    rotated = rotate_buffers(translated, rotation_anchors)
+    bounding_widths = find_bounding_widths(translated)
+    normalized = normalize_buffers(rotated, bounding_widths, bounding_cube_size)
+    flattened = flatten_buffers(normalized).astype(np.float32, copy=False)
+    return flattened[0] if single else flattened
+
+
+# =============================================================================
+# Per-Frame Input of the Streaming Temporal Model
+# =============================================================================
+def frame_deltas(buffers, rotation_anchors) -> np.ndarray:
+    """
+    Movement of the hand since the previous frame, rotated by the inverse of the head rotation at
+    the frame: [N, T, 3] buffers give [N, T - 1, 3] deltas. Rotations are [N, T, 4], one per frame,
+    or [N, 4] for one head rotation per buffer. A delta only needs the current and previous frame,
+    so the headset can compute it as each frame arrives; there is no window-wide scaling since
+    temporal_model.TemporalNet is invariant to the scale of its input. With a single head rotation
+    the deltas are those of run_all_transformations' output up to that scale.
+    """
+    buffers, single = _as_batch(buffers)
+    rotations = np.asarray(rotation_anchors, dtype=np.float32)
+    if single:
+        rotations = rotations[None]
+    deltas = buffers[:, 1:] - buffers[:, :-1]
+    if rotations.ndim == 2:
+        rotations = np.broadcast_to(rotations[:, None], (buffers.shape[0], deltas.shape[1], 4))
+    else:
+        rotations = rotations[:, 1:]
+    matrices = quaternion_to_matrix(quaternion_inverse(rotations.reshape(-1, 4))).reshape(*deltas.shape[:2], 3, 3)
+    rotated = np.einsum('ntij,ntj->nti', matrices, deltas)
+    return rotated[0] if single else rotated
+
+
+# =============================================================================
+# Offline Reprocessing and Parity Checks
+# =============================================================================
+def reprocess_archive(npz_path: str, bounding_cube_size: float = 1.0) -> (np.ndarray, np.ndarray):
+    """
+    Re-normalises a raw trajectory archive in one batched pass.
+    The archive holds "positions" [N, T, 3], "rotations" [N, 4] and optionally "labels" [N].
+    Returns (features [N, T * 3], labels or None).
+    """
+    with np.load(npz_path) as archive:
+        features = run_all_transformations(archive["positions"], archive["rotations"], bounding_cube_size)
+        labels = archive["labels"] if "labels" in archive else None
+    return features, labels
+
+
+def verify_fixtures(fixture_path: str = FIXTURE_PATH, atol: float = 1e-5) -> float:
+    """
+    Checks the port against fixtures captured from the C# pipeline. The fixture file is JSON:
+    {"boundingCubeSize": 1.0, "cases": [{"buffer": [[x, y, z], ...], "rotation": [x, y, z, w],
+    "expected": [...]}, ...]} where expected is the output of runAllTransformations.
+    Raises AssertionError on mismatch and returns the largest absolute difference.
+    """
+    with open(fixture_path, 'r') as f:
+        fixtures = json.load(f)
+    cases = fixtures["cases"]
+    buffers = np.array([case["buffer"] for case in cases], dtype=np.float32)
+    rotations = np.array([case["rotation"] for case in cases], dtype=np.float32)
+    expected = np.array([case["expected"] for case in cases], dtype=np.float32)
+
+    actual = run_all_transformations(buffers, rotations, fixtures.get("boundingCubeSize", 1.0))
+    max_diff = float(np.nanmax(np.abs(actual - expected))) if expected.size else 0.0
+    if not np.allclose(actual, expected, atol=atol, equal_nan=True):
+        raise AssertionError(f"Python preprocessing differs from C# fixtures by up to {max_diff:.3e}")
+    print(f"{len(cases)} fixture cases match (max |diff| {max_diff:.3e})")
+    return max_diff
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Check the NumPy gesture preprocessing against C# fixtures")
+    parser.add_argument("--fixtures", default=FIXTURE_PATH)
+    parser.add_argument("--atol", type=float, default=1e-5, help="Largest allowed absolute difference")
+    args = parser.parse_args()
+    try:
+        verify_fixtures(args.fixtures, args.atol)
+    except AssertionError as error:
+        raise SystemExit(str(error))
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,40 @@
-import json
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
 from pull_push_data import sync_data
+from data_cache import ensure_cache, load_section
+from trainer import fit, select_device
+from onnx_export import embed_weights, export_variants
+from augmentation import AugmentedStream, GestureAugmenter
+from warm_start import checkpoint_path, load_checkpoint, prepare, save_checkpoint
+from distillation import DistillationLoss, cached_teacher_logits
+from instrumentation import TrainingMonitor
+from curation import sample_weights
+from temporal_model import TemporalNet, export_streaming, streaming_path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 import os
-
-# Set device
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
+import time
 
 # =============================================================================
 # Data Loading and Preprocessing
 # =============================================================================
-def load_data(json_path: str, batch_size: int, shuffle: bool = True) -> (DataLoader, int, int):
+def load_data(json_path: str):
     """
-    Loads gesture data from a JSON file, preprocesses it into inputs and labels,
-    wraps it in a DataLoader, and returns that loader along with input feature size
-    and number of classes.
+    Loads gesture data from the memory-mapped cache of the JSON file and returns the
+    inputs and labels tensors along with input feature size and number of classes.
     """
-    with open(json_path, 'r') as f:
-        json_data = json.load(f)
-
-    # Extract features and labels from JSON
-    data = []
-    for gesture_name, gesture_data in json_data["gestures"].items():
-        label = gesture_data["poseGestureIndex"]
-        for gesture in gesture_data["poseGestureData"]:
-            data.append(gesture + [label])
-
-    # Separate inputs and labels
-    inputs = [row[:-1] for row in data]
-    labels = [row[-1] for row in data]
-
-    # Convert to tensors
-    inputs_tensor = torch.tensor(inputs, dtype=torch.float32)
-    labels_tensor = torch.tensor(labels, dtype=torch.int64)
+    inputs, labels, _ = load_section(json_path, "gestures")
 
-    # Build dataset and loader
-    dataset = TensorDataset(inputs_tensor, labels_tensor)
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
+    # Zero-copy views over the cached arrays
+    inputs_tensor = torch.from_numpy(inputs)
+    labels_tensor = torch.from_numpy(labels)
 
     input_size = inputs_tensor.shape[1]
     num_classes = labels_tensor.unique().numel()
     print(f"Input size: {input_size}, Number of classes: {num_classes}")
 
-    return dataloader, input_size, num_classes
+    return inputs_tensor, labels_tensor, input_size, num_classes
 
 # =============================================================================
 # Model Architectures
@@ -54,11 +43,11 @@ class LowNet(nn.Module):
     """
     A low complexity model: a single hidden layer network.
     """
-    def __init__(self, input_size: int, num_classes: int):
+    def __init__(self, input_size: int, num_classes: int, hidden_sizes=(64,)):
         super(LowNet, self).__init__()
-        self.fc1 = nn.Linear(input_size, 64)
+        self.fc1 = nn.Linear(input_size, hidden_sizes[0])
         self.act = nn.ReLU()
-        self.fc2 = nn.Linear(64, num_classes)
+        self.fc2 = nn.Linear(hidden_sizes[0], num_classes)
     
     def forward(self, x):
         x = self.act(self.fc1(x))
@@ -69,19 +58,20 @@ class MediumNet(nn.Module):
     """
     A medium complexity model: two hidden layers with batch normalization and dropout.
     """
-    def __init__(self, input_size: int, num_classes: int):
+    def __init__(self, input_size: int, num_classes: int, hidden_sizes=(256, 128)):
         super(MediumNet, self).__init__()
-        self.fc1 = nn.Linear(input_size, 256)
-        self.bn1 = nn.BatchNorm1d(256)
+        h1, h2 = hidden_sizes
+        self.fc1 = nn.Linear(input_size, h1)
+        self.bn1 = nn.BatchNorm1d(h1)
         self.act1 = nn.ReLU()
         self.dropout1 = nn.Dropout(0.5)
         
-        self.fc2 = nn.Linear(256, 128)
-        self.bn2 = nn.BatchNorm1d(128)
+        self.fc2 = nn.Linear(h1, h2)
+        self.bn2 = nn.BatchNorm1d(h2)
         self.act2 = nn.ReLU()
         self.dropout2 = nn.Dropout(0.5)
         
-        self.fc3 = nn.Linear(128, num_classes)
+        self.fc3 = nn.Linear(h2, num_classes)
     
     def forward(self, x):
         x = self.dropout1(self.act1(self.bn1(self.fc1(x))))
@@ -94,24 +84,25 @@ class HighNet(nn.Module):
     A high complexity model: three hidden layers with increased number of neurons,
     batch normalization, and dropout.
     """
-    def __init__(self, input_size: int, num_classes: int):
+    def __init__(self, input_size: int, num_classes: int, hidden_sizes=(512, 256, 128)):
         super(HighNet, self).__init__()
-        self.fc1 = nn.Linear(input_size, 512)
-        self.bn1 = nn.BatchNorm1d(512)
+        h1, h2, h3 = hidden_sizes
+        self.fc1 = nn.Linear(input_size, h1)
+        self.bn1 = nn.BatchNorm1d(h1)
         self.act1 = nn.ReLU()
         self.dropout1 = nn.Dropout(0.5)
         
-        self.fc2 = nn.Linear(512, 256)
-        self.bn2 = nn.BatchNorm1d(256)
+        self.fc2 = nn.Linear(h1, h2)
+        self.bn2 = nn.BatchNorm1d(h2)
         self.act2 = nn.ReLU()
         self.dropout2 = nn.Dropout(0.5)
         
-        self.fc3 = nn.Linear(256, 128)
-        self.bn3 = nn.BatchNorm1d(128)
+        self.fc3 = nn.Linear(h2, h3)
+        self.bn3 = nn.BatchNorm1d(h3)
         self.act3 = nn.ReLU()
         self.dropout3 = nn.Dropout(0.5)
         
-        self.fc4 = nn.Linear(128, num_classes)
+        self.fc4 = nn.Linear(h3, num_classes)
     
     def forward(self, x):
         x = self.dropout1(self.act1(self.bn1(self.fc1(x))))
@@ -119,41 +110,20 @@ class HighNet(nn.Module):
         x = self.dropout3(self.act3(self.bn3(self.fc3(x))))
         return self.fc4(x)
 
+
+MODEL_CLASSES = {
+    "low": LowNet,
+    "medium": MediumNet,
+    "high": HighNet,
+    "temporal": TemporalNet  # Causal convolutions, also exported as a one-frame streaming graph
+}
+
 # =============================================================================
 # Training and Export Functions
 # =============================================================================
-def train_model(model: nn.Module, dataloader: DataLoader, criterion, optimizer, device, num_epochs: int = 200):
-    """
-    Trains the given model using the provided DataLoader, loss criterion, and optimizer.
-    """
-    model.to(device)
-    for epoch in range(num_epochs):
-        model.train()
-        running_loss = 0.0
-        correct = 0
-        total = 0
-        for inputs_batch, labels_batch in dataloader:
-            inputs_batch, labels_batch = inputs_batch.to(device), labels_batch.to(device)
-            
-            optimizer.zero_grad()
-            outputs = model(inputs_batch)
-            loss = criterion(outputs, labels_batch)
-            loss.backward()
-            optimizer.step()
-            
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs, 1)
-            total += labels_batch.size(0)
-            correct += (predicted == labels_batch).sum().item()
-        if (epoch + 1) % 10 == 0 or epoch == 0:
-            accuracy = 100 * correct / total
-            print(f'Epoch [{epoch + 1}/{num_epochs}] Loss: {running_loss / len(dataloader):.4f} Accuracy: {accuracy:.2f}%')
-    print('Finished Training')
-    return model
-
-def export_to_onnx(model: nn.Module, input_size: int, device, export_path: str):
+def export_to_onnx(model: nn.Module, input_size: int, device, export_path: str, dynamic_batch: bool = False):
     """
-    Exports the given model to ONNX format.
+    Exports the given model to ONNX format, optionally with a dynamic batch axis.
     """
     model.eval()
     dummy_input = torch.randn(1, input_size, device=device)
@@ -163,45 +133,287 @@ def export_to_onnx(model: nn.Module, input_size: int, device, export_path: str):
         export_path,
         input_names=["input"],
         output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}} if dynamic_batch else None,
         verbose=False
     )
+    embed_weights(export_path)
     print(f"Model exported to {export_path}")
 
+
+def load_teacher(path: str, input_size: int, num_classes: int) -> nn.Module:
+    """
+    Rebuilds a trained gesture model from its checkpoint.
+    """
+    checkpoint = load_checkpoint(path)
+    if checkpoint is None:
+        raise FileNotFoundError(f"Teacher checkpoint {path} not found, train the teacher models first")
+    model_class = {model_class.__name__: model_class for model_class in MODEL_CLASSES.values()}[checkpoint["model_class"]]
+    model = model_class(input_size, num_classes)
+    model.load_state_dict(checkpoint["state_dict"])
+    return model.eval()
+
+
+def load_teachers(paths, fingerprint: dict) -> list:
+    """
+    The teacher models whose checkpoints exist and were trained on the current classes (same
+    names and indices, same input size). The others are skipped with a warning.
+    """
+    current = [(info["name"], info["index"]) for info in fingerprint["classes"]]
+    teachers = []
+    for path in paths:
+        checkpoint = load_checkpoint(path)
+        if checkpoint is None:
+            print(f"Warning: teacher checkpoint {path} not found, skipping it")
+            continue
+        saved = checkpoint["fingerprint"]
+        if saved["input_size"] != fingerprint["input_size"] or \
+                [(info["name"], info["index"]) for info in saved["classes"]] != current:
+            print(f"Warning: teacher {path} was trained on other classes than the current data, skipping it")
+            continue
+        teachers.append(load_teacher(path, fingerprint["input_size"], len(current)))
+    return teachers
+
+
+def train_and_export(complexity: str, inputs: torch.Tensor, labels: torch.Tensor, input_size: int, num_classes: int,
+                     json_path: str, export_path: str, device, train_options: dict) -> nn.Module:
+    """
+    Trains one architecture, saves its checkpoint next to the ONNX file and exports it.
+    train_options holds val_fraction, export_options, optionally augment_options (GestureAugmenter
+    arguments), warm_start_options, distill_options, monitor_options (TrainingMonitor arguments) and
+    curation_options (curation.sample_weights arguments), plus keyword arguments for trainer.fit
+    (num_epochs, patience, ...). With warm_start_options the model resumes from the previous run's
+    checkpoint and is fine-tuned on the new rows for a short schedule. With distill_options
+    ({"teacher_checkpoints": [...], "temperature", "alpha"}) it learns from the cached logits of the
+    teacher models as well as the labels; augmentation is skipped since the logits are per recorded sample.
+    Teachers that are missing or trained on other classes are skipped, without any the model trains on
+    the labels only.
+    """
+    train_options = dict(train_options)
+    val_fraction = train_options.pop("val_fraction")
+    export_options = train_options.pop("export_options")
+    augment_options = train_options.pop("augment_options", None)
+    warm_start_options = train_options.pop("warm_start_options", None)
+    distill_options = train_options.pop("distill_options", None)
+    monitor_options = train_options.pop("monitor_options", None)
+    curation_options = train_options.pop("curation_options", None)
+
+    model = MODEL_CLASSES[complexity](input_size, num_classes)
+    warm, train_idx, val_idx, fingerprint = prepare(
+        model, export_path, json_path, "gestures", labels, val_fraction,
+        warm_start_options["replay_per_class"] if warm_start_options else 0, resume=warm_start_options is not None)
+    if warm:
+        train_options.update(num_epochs=warm_start_options["epochs"], patience=warm_start_options["patience"])
+    if curation_options is not None:
+        train_options["sample_weights"] = sample_weights(json_path, "gestures", **curation_options)[train_idx]
+    train_idx, val_idx = torch.from_numpy(train_idx), torch.from_numpy(val_idx)
+    train_data, val_data = (inputs[train_idx], labels[train_idx]), (inputs[val_idx], labels[val_idx])
+
+    # With unchanged data the resumed model is exported as is
+    if train_idx.numel():
+        criterion, aux = nn.CrossEntropyLoss(), None
+        teachers = load_teachers(distill_options["teacher_checkpoints"], fingerprint) \
+            if distill_options is not None else []
+        if teachers:
+            criterion = DistillationLoss(distill_options["temperature"], distill_options["alpha"])
+            aux, augment_options = cached_teacher_logits(json_path, teachers, inputs)[train_idx], None
+        optimizer = optim.SGD(model.parameters(), lr=0.001)
+        augment = AugmentedStream(train_data[0], GestureAugmenter(**augment_options)) \
+            if augment_options is not None else None
+        try:
+            model, summary = fit(model, *train_data, criterion, optimizer, device, val_data=val_data,
+                                 run_name=f"gestures_{complexity}" + ("_distilled" if aux is not None else ""),
+                                 augment=augment, aux=aux,
+                                 monitor=TrainingMonitor(**monitor_options) if monitor_options is not None else None,
+                                 **train_options)
+        finally:
+            if augment is not None:
+                augment.close()
+        save_checkpoint(model, checkpoint_path(export_path), fingerprint, summary)
+
+    export_to_onnx(model, input_size, device, export_path, export_options["dynamic_batch"])
+    if isinstance(model, TemporalNet):
+        export_streaming(model, streaming_path(export_path), device)
+    if export_options["variants"]:
+        export_variants(model, export_path, inputs, labels, export_options["fp16"])
+    return model
+
+def export_checkpoints(json_path: str, models_dir: str, base_model_name: str, complexities,
+                       export_options: dict, device=torch.device('cpu')) -> list:
+    """
+    Re-exports the ONNX files (and variants) of already trained models from their checkpoints,
+    without training. Returns the exported paths.
+    """
+    inputs, labels, _, _ = load_data(json_path)
+    exported = []
+    for complexity in complexities:
+        export_path = os.path.join(models_dir, f"{base_model_name}_{complexity}.onnx")
+        checkpoint = load_checkpoint(checkpoint_path(export_path))
+        if checkpoint is None:
+            print(f"No checkpoint for the {complexity} complexity model, skipping")
+            continue
+        fingerprint = checkpoint["fingerprint"]
+        model = load_teacher(checkpoint_path(export_path), fingerprint["input_size"], len(fingerprint["classes"]))
+        export_to_onnx(model.to(device), fingerprint["input_size"], device, export_path, export_options["dynamic_batch"])
+        if isinstance(model, TemporalNet):
+            export_streaming(model, streaming_path(export_path), device)
+        if export_options["variants"]:
+            export_variants(model, export_path, inputs, labels, export_options["fp16"])
+        exported.append(export_path)
+    return exported
+
 # =============================================================================
-# Main Function
+# Parallel Training
 # =============================================================================
-def main():
-    # Configurations
-    json_file = 'poseGestureData.json'
-    batch_size = 32
-    num_epochs = 200
-    base_model_name = "model_gestures"
-    link = True  # Set to False if using adb
+def _init_worker(num_threads: int):
+    """
+    Limits torch threading in each worker so the pool doesn't oversubscribe the CPU cores.
+    """
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _train_and_export(complexity: str, json_path: str, export_path: str, train_options: dict):
+    """
+    Worker entry point: trains one architecture on the CPU and exports it straight away.
+    The dataset is memory-mapped from the shared cache, so workers read the same pages.
+    """
+    start = time.perf_counter()
+    inputs, labels, input_size, num_classes = load_data(json_path)
+    train_and_export(complexity, inputs, labels, input_size, num_classes, json_path, export_path,
+                     torch.device('cpu'), train_options)
+    return complexity, export_path, time.perf_counter() - start
+
+
+def train_parallel(json_path: str, complexities, models_dir: str, base_model_name: str, train_options: dict,
+                   max_workers: int = None):
+    """
+    Trains the given architectures at the same time in a process pool, one architecture per worker.
+    Each ONNX file is written by its worker as soon as that model finishes training.
+    train_options is passed on to train_and_export.
+    """
+    # Build the cache once up front so workers only ever memory-map it
+    ensure_cache(json_path)
+    os.makedirs(models_dir, exist_ok=True)
+
+    cpu_count = os.cpu_count() or 1
+    num_workers = max(1, min(len(complexities), max_workers or cpu_count, cpu_count))
+    threads_per_worker = max(1, cpu_count // num_workers)
+    print(f"Training {len(complexities)} models with {num_workers} workers, {threads_per_worker} threads each")
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = [
+            pool.submit(_train_and_export, complexity, json_path,
+                        os.path.join(models_dir, f"{base_model_name}_{complexity}.onnx"), dict(train_options))
+            for complexity in complexities
+        ]
+        for future in as_completed(futures):
+            complexity, onnx_path, seconds = future.result()
+            print(f"{complexity} complexity model finished in {seconds:.1f}s -> {onnx_path}")
+    print(f"All models trained in {time.perf_counter() - start:.1f}s")
+
+# =============================================================================
+# Configuration and Main Function
+# =============================================================================
+def default_config() -> dict:
+    """
+    Configuration of a gesture training run, overridable from the CLI (flags or a config file).
+    """
+    return {
+        "json_file": 'poseGestureData.json',
+        "batch_size": 32,
+        "num_epochs": 200,  # Upper bound, early stopping usually ends training sooner
+        "val_fraction": 0.2,
+        "patience": 20,
+        "base_model_name": "model_gestures",
+        "models_dir": "models",
+        "complexities": ["low", "medium", "high"],  # Add "temporal" for the streaming model
+        "log_path": os.path.join(".logs", "training_runs.jsonl"),
+        "sync": True,  # Pull the latest recordings from the HMD before training
+        "link": True,  # Set to False if using adb
+        "device": None,  # None picks CUDA when available
+        "parallel": True,  # Train all architectures at once on the CPU
+        "export_options": {
+            "dynamic_batch": False,  # Barracuda in MLClassifier runs a fixed batch of 1
+            "variants": True,  # Also write optimized/int8 variants and an accuracy report
+            "fp16": False
+        },
+        # On-the-fly augmentation of the training split (GestureAugmenter arguments), None trains on the
+        # recorded data only. e.g. {"max_yaw_degrees": 15.0, "max_pitch_degrees": 10.0, "max_time_warp": 0.2,
+        # "min_scale": 0.8, "noise_std": 0.01}
+        "augment_options": None,
+        # Resume from the previous run's checkpoints and fine-tune on new recordings for a short schedule,
+        # set to None to always train from scratch
+        "warm_start_options": {
+            "epochs": 20,
+            "patience": 5,
+            "replay_per_class": 32  # Previously seen samples per class mixed in so old gestures aren't forgotten
+        },
+        # Distil the teachers (logits averaged if several, alpha weighs their soft targets against the
+        # labels) into the student model shipped to the headset, None trains every model on the labels only.
+        # e.g. {"student": "low", "teachers": ["high"], "temperature": 4.0, "alpha": 0.7}
+        "distill_options": None,
+        # Per-epoch phase timings, throughput and memory written to .logs/instrumentation, None to disable.
+        # e.g. {"formats": ["jsonl", "csv"], "profile_epochs": [2]} also records a torch.profiler trace of epoch 2
+        "monitor_options": None,
+        # Draw training batches class-balanced and without near-duplicates (see curation.py), None to shuffle
+        # the recorded rows uniformly. e.g. {"radius": 0.02, "drop_mislabelled": True}
+        "curation_options": None
+    }
+
+
+def run(config: dict):
+    """
+    Trains and exports the configured gesture models (see default_config).
+    """
+    json_file, models_dir, base_model_name = config["json_file"], config["models_dir"], config["base_model_name"]
+    distill_options = config["distill_options"]
+    device = select_device(config["device"])
+    print(f"Using device: {device}")
 
     # Sync data from HMD
-    sync_data(pull=True, push=False, link=link)
-    
+    if config["sync"]:
+        sync_data(pull=True, push=False, link=config["link"])
+
+    train_options = {key: config[key] for key in ("num_epochs", "batch_size", "val_fraction", "patience", "log_path",
+                                                  "export_options", "augment_options", "warm_start_options",
+                                                  "monitor_options", "curation_options")}
+    # The student is trained after the other models since it needs the teachers' checkpoints
+    complexities, student, student_options = list(config["complexities"]), None, None
+    if distill_options is not None and distill_options["student"] in complexities:
+        student = distill_options["student"]
+        complexities.remove(student)
+        teacher_checkpoints = [checkpoint_path(os.path.join(models_dir, f"{base_model_name}_{teacher}.onnx"))
+                               for teacher in distill_options["teachers"]]
+        student_options = dict(train_options, distill_options={
+            "teacher_checkpoints": teacher_checkpoints,
+            "temperature": distill_options["temperature"],
+            "alpha": distill_options["alpha"]
+        })
+
+    if config["parallel"] and device.type == 'cpu':
+        if complexities:
+            train_parallel(json_file, complexities, models_dir, base_model_name, train_options)
+        if student is not None:
+            train_parallel(json_file, [student], models_dir, base_model_name, student_options)
+        return
+
     # Load data
-    dataloader, input_size, num_classes = load_data(json_file)
-    
-    # Define models with different complexities
-    models = {
-        "low": LowNet(input_size, num_classes),
-        "medium": MediumNet(input_size, num_classes),
-        "high": HighNet(input_size, num_classes)
-    }
-    
-    criterion = nn.CrossEntropyLoss()
-    
+    inputs, labels, input_size, num_classes = load_data(json_file)
+    os.makedirs(models_dir, exist_ok=True)
+
     # Train and export each model
-    for complexity, model in models.items():
+    for complexity in complexities + ([student] if student is not None else []):
         print(f"\nTraining {complexity} complexity model:")
-        optimizer = optim.SGD(model.parameters(), lr=0.001)
-        trained_model = train_model(model, dataloader, criterion, optimizer, device, num_epochs)
-        models_dir = "models"
-        os.makedirs(models_dir, exist_ok=True)
         onnx_path = os.path.join(models_dir, f"{base_model_name}_{complexity}.onnx")
-        export_to_onnx(trained_model, input_size, device, onnx_path)
+        train_and_export(complexity, inputs, labels, input_size, num_classes, json_file, onnx_path, device,
+                         student_options if complexity == student else train_options)
+
+
+def main():
+    run(default_config())
 
 if __name__ == '__main__':
     main()
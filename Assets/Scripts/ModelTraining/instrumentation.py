@@ -0,0 +1,176 @@
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+import torch
+
+# Opt-in instrumentation of trainer.fit
+#
+# A TrainingMonitor passed to fit() times every phase of the training loop (data preparation,
+# forward, backward, optimizer step, validation) per epoch, and records throughput and memory.
+# One row per epoch is appended to JSON lines and/or CSV files. Selected epochs can also be
+# recorded with torch.profiler, writing a Chrome trace and an operator summary table. Without a
+# monitor fit() uses NullMonitor, whose hooks do nothing.
+
+PHASES = ("data", "forward", "backward", "optimizer", "validation")
+
+
+def resident_memory_bytes():
+    """
+    Current resident set size of this process, or None when it can't be measured.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_memory_bytes():
+    """
+    Peak resident set size of this process, or None when it can't be measured.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class NullMonitor:
+    """
+    Monitor that records nothing, used when fit() is not instrumented.
+    """
+    _null_context = contextlib.nullcontext()
+
+    def on_train_start(self, run_name, model, device, num_samples, batch_size):
+        pass
+
+    def on_epoch_start(self, epoch):
+        pass
+
+    def phase(self, name):
+        return self._null_context
+
+    def on_epoch_end(self, epoch, samples, loss, correct, val_loss=None, val_correct=None, val_samples=None):
+        pass
+
+    def on_train_end(self, summary):
+        pass
+
+
+class TrainingMonitor(NullMonitor):
+    """
+    Records per-epoch phase timings, throughput and memory of a fit() run.
+    output_dir receives epochs.jsonl / epochs.csv (as selected by formats) and the profiler traces
+    of the epochs listed in profile_epochs (1-based). On CUDA the device is synchronised at phase
+    boundaries so GPU work is attributed to the phase that queued it.
+    """
+    def __init__(self, output_dir: str = os.path.join(".logs", "instrumentation"), formats=("jsonl", "csv"),
+                 profile_epochs=(), sync_cuda: bool = True):
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.profile_epochs = set(profile_epochs)
+        self.sync_cuda = sync_cuda
+        self.records = []
+        self._profiler = None
+
+    def on_train_start(self, run_name, model, device, num_samples, batch_size):
+        self.records = []
+        self.run_name = run_name or "run"
+        self.device = torch.device(device)
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.parameters = sum(p.numel() for p in model.parameters())
+        self._sync = self.sync_cuda and self.device.type == "cuda"
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def on_epoch_start(self, epoch):
+        self._phase_seconds = dict.fromkeys(PHASES, 0.0)
+        if epoch + 1 in self.profile_epochs:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._profiler.__enter__()
+        self._epoch_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        label = torch.profiler.record_function(name) if self._profiler is not None else contextlib.nullcontext()
+        start = time.perf_counter()
+        with label:
+            yield
+            if self._sync:
+                torch.cuda.synchronize(self.device)
+        self._phase_seconds[name] += time.perf_counter() - start
+
+    def on_epoch_end(self, epoch, samples, loss, correct, val_loss=None, val_correct=None, val_samples=None):
+        seconds = time.perf_counter() - self._epoch_start
+        if self._profiler is not None:
+            self._profiler.__exit__(None, None, None)
+            trace_root = os.path.join(self.output_dir, f"{self.run_name}_epoch{epoch + 1}")
+            self._profiler.export_chrome_trace(trace_root + ".trace.json")
+            with open(trace_root + ".ops.txt", 'w') as f:
+                f.write(self._profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=30))
+            self._profiler = None
+
+        record = {
+            "run": self.run_name,
+            "epoch": epoch + 1,
+            "samples": samples,
+            "seconds": seconds,
+            "samples_per_s": samples / seconds if seconds > 0 else None
+        }
+        for name in PHASES:
+            record[f"{name}_s"] = self._phase_seconds[name]
+        record["other_s"] = seconds - sum(self._phase_seconds.values())
+        record.update({
+            "loss": float(loss),
+            "accuracy": float(correct) / samples if samples else None,
+            "val_loss": float(val_loss) if val_loss is not None else None,
+            "val_accuracy": float(val_correct) / val_samples if val_correct is not None and val_samples else None,
+            "rss_bytes": resident_memory_bytes(),
+            "peak_rss_bytes": peak_memory_bytes(),
+            "cuda_peak_bytes": torch.cuda.max_memory_allocated(self.device) if self.device.type == "cuda" else None,
+            "parameters": self.parameters,
+            "batch_size": self.batch_size
+        })
+        self.records.append(record)
+        self._write(record)
+
+    def _write(self, record: dict):
+        if "jsonl" in self.formats:
+            with open(os.path.join(self.output_dir, "epochs.jsonl"), 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        if "csv" in self.formats:
+            path = os.path.join(self.output_dir, "epochs.csv")
+            new_file = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(record))
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(record)
+
+    def on_train_end(self, summary):
+        if not self.records:
+            return
+        totals = {name: sum(r[f"{name}_s"] for r in self.records) for name in PHASES}
+        total = sum(r["seconds"] for r in self.records)
+        breakdown = ", ".join(f"{name} {100 * seconds / total:.0f}%" for name, seconds in totals.items() if total)
+        throughput = sum(r["samples"] for r in self.records) / total if total else 0.0
+        summary["samples_per_s"] = throughput
+        summary["phase_seconds"] = totals
+        print(f"[{self.run_name}] {throughput:.0f} samples/s, {breakdown}, "
+              f"peak RSS {(self.records[-1]['peak_rss_bytes'] or 0) / 2 ** 20:.0f} MiB")
@@ -0,0 +1,332 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import time
+import numpy as np
+from gesture_preprocessing import run_all_transformations
+from onnx_export import onnx_logits
+from bench_onnx import benchmark_model
+
+# Offline replay of GestureDetector.ProcessHandGestureWithInterpolation
+#
+# Recorded hand streams are replayed tick by tick (one tick per HandBuffer frame) and every
+# interpolated sub-buffer the detector would build is produced for all ticks at once. Each
+# distinct window length is run through the ONNX model in one batched pass, after which any
+# combination of interval strategy, interpolation interval, minimum interval and confidence
+# threshold can be scored cheaply for detection latency, false positives and inference cost.
+#
+# A stream is an .npz file holding
+#   positions [T, 3]  hand start bone positions sampled at the buffer frame rate
+#   rotations [T, 4]  center eye anchor rotations (x, y, z, w) at the same ticks
+#   tracked   [T]     optional, False where the hand was not tracked
+#   events    [E, 3]  optional ground truth rows of (poseGestureIndex, start frame, end frame)
+
+STRATEGIES = ("BEST", "SMALLEST", "LARGEST", "NONE")
+
+
+# =============================================================================
+# HandBuffer Emulation
+# =============================================================================
+def load_stream(npz_path: str) -> dict:
+    with np.load(npz_path) as archive:
+        positions = archive["positions"].astype(np.float32)
+        stream = {
+            "name": os.path.basename(npz_path),
+            "positions": positions,
+            "rotations": archive["rotations"].astype(np.float32),
+            "tracked": archive["tracked"].astype(bool) if "tracked" in archive else np.ones(len(positions), bool),
+            "events": archive["events"].astype(np.int64).reshape(-1, 3) if "events" in archive
+            else np.zeros((0, 3), np.int64)
+        }
+    # Untracked frames enter the buffer as zero vectors
+    stream["positions"][~stream["tracked"]] = 0
+    return stream
+
+
+def interval_times(interval: float, min_interval: float, strategy: str, buffer_time: float = 3.0) -> list:
+    """
+    Sub-buffer lengths in seconds in the order HandBuffer.getInterpolatedBuffers returns them,
+    with None standing for the full buffer. The loops accumulate in float32 like the C# code.
+    """
+    if strategy == "NONE":
+        return [None]
+    step, lower, end = np.float32(interval), np.float32(max(interval, min_interval)), np.float32(buffer_time)
+    times = []
+    if strategy == "LARGEST":
+        times.append(None)
+        current = np.float32(end - step)
+        while current >= lower:
+            times.append(float(current))
+            current = np.float32(current - step)
+    else:
+        current = lower
+        while current <= end:
+            times.append(float(current))
+            current = np.float32(current + step)
+        times.append(None)
+    return times
+
+
+def sub_frames(seconds, fps: int, buffer_frames: int) -> int:
+    """
+    Frames taken from the end of the buffer for a sub-buffer of the given length (Mathf.RoundToInt
+    rounds half to even, as does np.rint). The full buffer is returned as buffer_frames.
+    """
+    if seconds is None:
+        return buffer_frames
+    return int(np.clip(np.rint(np.float32(seconds) * np.float32(fps)), 1, buffer_frames))
+
+
+def valid_ticks(stream: dict, buffer_frames: int) -> np.ndarray:
+    """
+    Ticks at which getBufferWithDeadzone can return a buffer: the buffer is full and the hand
+    has been tracked for the whole buffer length.
+    """
+    untracked = np.concatenate([[0], np.cumsum(~stream["tracked"])])
+    ticks = np.arange(buffer_frames - 1, len(stream["tracked"]))
+    return ticks[untracked[ticks + 1] - untracked[ticks + 1 - buffer_frames] == 0]
+
+
+def build_windows(positions: np.ndarray, ticks: np.ndarray, frames: int, buffer_frames: int) -> np.ndarray:
+    """
+    interpolateBuffer for every tick at once: the last `frames` points of each buffer lerped
+    to buffer_frames points, shape [len(ticks), buffer_frames, 3].
+    """
+    if frames == buffer_frames:
+        offsets = np.arange(buffer_frames)
+        return positions[ticks[:, None] - buffer_frames + 1 + offsets[None, :]]
+    t = np.arange(buffer_frames, dtype=np.float32) / np.float32(buffer_frames - 1)
+    sub_index = t * np.float32(frames - 1)
+    index0 = np.floor(sub_index).astype(np.int64)
+    index1 = np.minimum(index0 + 1, frames - 1)
+    weight = (sub_index - index0).astype(np.float32)[None, :, None]
+    start = ticks[:, None] - frames + 1
+    point0, point1 = positions[start + index0[None, :]], positions[start + index1[None, :]]
+    return point0 + (point1 - point0) * weight
+
+
+def path_lengths(windows: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(np.diff(windows, axis=1), axis=2).sum(axis=1, dtype=np.float32)
+
+
+def rounded_softmax(logits: np.ndarray) -> np.ndarray:
+    """
+    Softmax followed by rounding to 2 decimals, as in GestureDetector.processBuffer.
+    """
+    exp = np.exp(logits.astype(np.float32))
+    probabilities = exp / exp.sum(axis=-1, keepdims=True)
+    return np.rint(probabilities * np.float32(100)) / np.float32(100)
+
+
+# =============================================================================
+# Batched Inference
+# =============================================================================
+def window_outputs(stream: dict, onnx_path: str, frame_counts, fps: int = 10, buffer_frames: int = 30,
+                   deadzone: float = 0.1, bounding_cube_size: float = 1.0) -> dict:
+    """
+    Runs the model once over every window length needed by the configurations being compared.
+    Returns the valid ticks and, per window length, the rounded probabilities [ticks, C] and
+    whether each window passes the deadzone.
+    """
+    ticks = valid_ticks(stream, buffer_frames)
+    outputs = {"ticks": ticks, "probabilities": {}, "passes": {}}
+    for frames in sorted(set(frame_counts)):
+        windows = build_windows(stream["positions"], ticks, frames, buffer_frames)
+        outputs["passes"][frames] = path_lengths(windows) >= np.float32(deadzone)
+        if len(ticks) == 0:
+            outputs["probabilities"][frames] = np.zeros((0, 0), np.float32)
+            continue
+        features = run_all_transformations(windows, stream["rotations"][ticks], bounding_cube_size)
+        outputs["probabilities"][frames] = rounded_softmax(onnx_logits(onnx_path, features))
+    return outputs
+
+
+# =============================================================================
+# Detection and Scoring
+# =============================================================================
+def detect(outputs: dict, frames_order: list, strategy: str, threshold: float, lockout_frames: int,
+           best_uses_window_index: bool = True) -> (list, int):
+    """
+    Replays the detector's decision for one configuration.
+    Returns the triggers as (tick, label) and the number of model inferences the device would run.
+
+    All windows are inferred whenever getInterpolatedBuffers returns a list, that is when every window
+    passes the deadzone. BEST and SMALLEST both trigger on the first window with a value above the
+    threshold; GestureDetector labels BEST detections with that window's index rather than the class,
+    which is reproduced unless best_uses_window_index is False. NONE is the non-interpolated path,
+    which ignores class 0.
+    """
+    ticks = outputs["ticks"]
+    if len(ticks) == 0:
+        return [], 0
+    passes = np.logical_and.reduce([outputs["passes"][frames] for frames in frames_order])
+    probabilities = np.stack([outputs["probabilities"][frames] for frames in frames_order], axis=1)
+
+    if strategy == "NONE":
+        labels = probabilities[:, 0].argmax(axis=1)
+        fires = passes & (labels != 0) & (probabilities[:, 0].max(axis=1) > threshold)
+    else:
+        above = probabilities > np.float32(threshold)
+        window_fires = above.any(axis=2)
+        fires = passes & window_fires.any(axis=1)
+        first_window = window_fires.argmax(axis=1)
+        labels = above[np.arange(len(ticks)), first_window].argmax(axis=1)
+        if strategy == "BEST" and best_uses_window_index:
+            labels = first_window
+
+    triggers, inferences = [], 0
+    locked_until = -1
+    for i in np.flatnonzero(passes):
+        tick = ticks[i]
+        if tick < locked_until:
+            continue
+        inferences += len(frames_order)
+        if fires[i]:
+            triggers.append((int(tick), int(labels[i])))
+            locked_until = tick + lockout_frames
+    return triggers, inferences
+
+
+def score_triggers(triggers: list, events: np.ndarray, tolerance_frames: int) -> dict:
+    """
+    Matches triggers to ground truth events. The first trigger with the right label between an event's
+    start and tolerance_frames after its end is a detection; every other trigger is a false positive.
+    """
+    detected = np.zeros(len(events), bool)
+    latencies, false_positives = [], 0
+    for tick, label in triggers:
+        matches = np.flatnonzero((events[:, 0] == label) & (events[:, 1] <= tick) &
+                                 (tick <= events[:, 2] + tolerance_frames) & ~detected)
+        if len(matches) == 0:
+            false_positives += 1
+            continue
+        detected[matches[0]] = True
+        latencies.append(tick - events[matches[0], 1])
+    return {"events": int(len(events)), "detected": int(detected.sum()), "false_positives": false_positives,
+            "latencies": latencies}
+
+
+def simulate(stream_paths, onnx_path: str, strategies=STRATEGIES, intervals=(0.5,), min_intervals=(1.0,),
+             thresholds=(0.9,), fps: int = 10, buffer_time: float = 3.0, deadzone: float = 0.1,
+             lockout_seconds: float = 1.0, tolerance_seconds: float = 1.0, bounding_cube_size: float = 1.0,
+             best_uses_window_index: bool = True) -> list:
+    """
+    Scores every configuration over all streams and returns one result per configuration with
+    recall, false positives per minute, latency and the model compute it costs.
+    """
+    buffer_frames = int(round(buffer_time * fps))
+    lockout_frames = int(round(lockout_seconds * fps))
+    tolerance_frames = int(round(tolerance_seconds * fps))
+    configs = []
+    for strategy, interval, min_interval in itertools.product(strategies, intervals, min_intervals):
+        if strategy == "NONE" and (interval, min_interval) != (intervals[0], min_intervals[0]):
+            continue
+        order = [sub_frames(s, fps, buffer_frames) for s in interval_times(interval, min_interval, strategy, buffer_time)]
+        configs.append((strategy, interval, min_interval, order))
+    frame_counts = {frames for config in configs for frames in config[3]}
+
+    totals = {}
+    duration = 0.0
+    for path in stream_paths:
+        stream = load_stream(path)
+        duration += len(stream["positions"]) / fps
+        start = time.perf_counter()
+        outputs = window_outputs(stream, onnx_path, frame_counts, fps, buffer_frames, deadzone, bounding_cube_size)
+        print(f"{stream['name']}: {len(outputs['ticks'])} valid ticks, {len(frame_counts)} window lengths "
+              f"in {time.perf_counter() - start:.1f}s")
+        for strategy, interval, min_interval, order in configs:
+            for threshold in thresholds:
+                triggers, inferences = detect(outputs, order, strategy, threshold, lockout_frames,
+                                              best_uses_window_index)
+                score = score_triggers(triggers, stream["events"], tolerance_frames)
+                key = (strategy, interval, min_interval, threshold)
+                total = totals.setdefault(key, {"windows": len(order), "events": 0, "detected": 0,
+                                                "false_positives": 0, "latencies": [], "inferences": 0})
+                for field in ("events", "detected", "false_positives", "latencies"):
+                    total[field] += score[field]
+                total["inferences"] += inferences
+
+    # Per-window cost of a batch-1 inference, as the device runs them
+    if stream_paths and frame_counts:
+        sample = run_all_transformations(np.zeros((buffer_frames, 3), np.float32) +
+                                         np.linspace(0, 1, buffer_frames, dtype=np.float32)[:, None],
+                                         np.array([0, 0, 0, 1], np.float32), bounding_cube_size)[None, :]
+        inference_us = float(benchmark_model(onnx_path, sample, warmup=20, runs=200)["p50_us"])
+    else:
+        inference_us = 0.0
+
+    results = []
+    minutes = max(duration / 60, 1e-9)
+    for (strategy, interval, min_interval, threshold), total in totals.items():
+        latencies = np.array(total.pop("latencies"), dtype=np.float64)
+        total.update({
+            "strategy": strategy,
+            "interval": interval,
+            "min_interval": min_interval,
+            "threshold": threshold,
+            "recall": total["detected"] / total["events"] if total["events"] else None,
+            "false_positives_per_minute": total["false_positives"] / minutes,
+            "median_latency_frames": float(np.median(latencies)) if len(latencies) else None,
+            "mean_latency_seconds": float(latencies.mean() / fps) if len(latencies) else None,
+            "inferences_per_second": total["inferences"] / max(duration, 1e-9),
+            "inference_ms_per_second": total["inferences"] * inference_us / 1e3 / max(duration, 1e-9)
+        })
+        results.append(total)
+    return results
+
+
+def cheapest_configuration(results: list, min_recall: float, max_false_positives_per_minute: float):
+    """
+    The configuration with the lowest inference cost that meets the recall and false positive targets.
+    """
+    passing = [r for r in results if r["recall"] is not None and r["recall"] >= min_recall and
+               r["false_positives_per_minute"] <= max_false_positives_per_minute]
+    return min(passing, key=lambda r: (r["inferences_per_second"], r["median_latency_frames"])) if passing else None
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded hand streams through the gesture detector")
+    parser.add_argument("--model", default=os.path.join("models", "model_gestures_low.onnx"))
+    parser.add_argument("--streams", default=os.path.join("streams", "*.npz"), help="Glob for recorded streams")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--intervals", type=float, nargs="+", default=[0.25, 0.5, 1.0])
+    parser.add_argument("--min-intervals", type=float, nargs="+", default=[0.5, 1.0, 1.5])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9, 0.95])
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--max-fp-per-minute", type=float, default=1.0)
+    parser.add_argument("--fix-best-label", action="store_true",
+                        help="Label BEST detections with the class instead of the window index")
+    parser.add_argument("--output", default=os.path.join(".logs", "interval_sim.jsonl"))
+    args = parser.parse_args()
+
+    stream_paths = sorted(glob.glob(args.streams))
+    if not stream_paths:
+        print(f"No streams match {args.streams}")
+        return
+    results = simulate(stream_paths, args.model, args.strategies, args.intervals, args.min_intervals,
+                       args.thresholds, best_uses_window_index=not args.fix_best_label)
+
+    results.sort(key=lambda r: (r["strategy"], r["interval"], r["min_interval"], r["threshold"]))
+    for r in results:
+        recall = f"{100 * r['recall']:.1f}%" if r["recall"] is not None else "n/a"
+        latency = f"{r['median_latency_frames']:.0f}" if r["median_latency_frames"] is not None else "n/a"
+        print(f"{r['strategy']:<8} interval={r['interval']:<5} min={r['min_interval']:<5} thr={r['threshold']:<5} "
+              f"windows={r['windows']:<2} recall={recall:>6} fp/min={r['false_positives_per_minute']:.2f} "
+              f"latency={latency} frames inferences/s={r['inferences_per_second']:.1f}")
+
+    best = cheapest_configuration(results, args.min_recall, args.max_fp_per_minute)
+    print(f"Cheapest configuration meeting targets: {json.dumps(best) if best else 'none'}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'a') as f:
+        for r in results:
+            f.write(json.dumps({"model": os.path.basename(args.model), **r}) + "\n")
+    print(f"Results appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
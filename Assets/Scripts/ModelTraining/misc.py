@@ -1,50 +1,339 @@
-import numpy as np
-import matplotlib.pyplot as plt
+import argparse
 import json
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from data_cache import SECTIONS, ensure_cache, load_section
+
+# Dataset statistics and figures for checking the recorded poses and gestures
+#
+# Per-class statistics of both sections are computed in one vectorised pass over the binary data
+# cache, a chunk of rows at a time so memory stays bounded on large datasets. Gesture rows are
+# flattened 3D trajectories, so they additionally get path lengths and mean trajectories. Figures
+# are rendered headless (Agg) to PNG files in a process pool, so the report runs unattended.
+
+_CHUNK_ROWS = 1 << 16
 
-# Miscellaneous functions for gesture data analysis
+
+def trajectories(rows: np.ndarray) -> np.ndarray:
+    """
+    Reshapes flattened gesture rows [N, T*3] into [N, T, 3] points.
+    """
+    return rows.reshape(rows.shape[0], -1, 3)
 
 
-def find_gesture_distance(json_data, gesture_name):
+def path_lengths(rows: np.ndarray) -> np.ndarray:
     """
-    Calculate the distance of a gesture by averaging the pose data and summing the distances between points.
+    Total distance travelled along each flattened gesture trajectory.
     """
-    data_arrays = np.array(json_data["gestures"][gesture_name]["poseGestureData"])
-    data = np.mean(data_arrays, axis=0)
-    points = data.reshape((-1, 3))
-    print(points)
-    distances = np.linalg.norm(np.diff(points, axis=0), axis=1)
-    print(np.sum(distances))
+    points = trajectories(rows)
+    return np.linalg.norm(np.diff(points, axis=1), axis=2).sum(axis=1)
 
-def plot_gesture(json_data, gesture_names):
+
+# =============================================================================
+# Statistics
+# =============================================================================
+def section_statistics(inputs: np.ndarray, labels: np.ndarray, class_info: list, trajectory: bool = False) -> dict:
+    """
+    Per-class sample counts, feature means and variances, and pairwise distances between the
+    class centroids. With trajectory set the rows are read as 3D trajectories and per-sample
+    path lengths are computed too. Classes are ordered by their index.
     """
-    Plot the gesture data in 3D space for the given gesture names.
+    class_info = sorted(class_info, key=lambda info: info["index"])
+    indices = np.array([info["index"] for info in class_info], dtype=np.int64)
+    num_classes, num_features = indices.shape[0], inputs.shape[1]
+
+    counts = np.zeros(num_classes, dtype=np.int64)
+    sums = np.zeros((num_classes, num_features))
+    squares = np.zeros((num_classes, num_features))
+    lengths = np.empty(inputs.shape[0], dtype=np.float32) if trajectory else None
+    for start in range(0, inputs.shape[0], _CHUNK_ROWS):
+        rows = np.asarray(inputs[start:start + _CHUNK_ROWS], dtype=np.float64)
+        classes = np.searchsorted(indices, labels[start:start + _CHUNK_ROWS])
+        one_hot = np.zeros((rows.shape[0], num_classes))
+        one_hot[np.arange(rows.shape[0]), classes] = 1.0
+        counts += one_hot.sum(axis=0).astype(np.int64)
+        sums += one_hot.T @ rows
+        squares += one_hot.T @ (rows * rows)
+        if trajectory:
+            lengths[start:start + rows.shape[0]] = path_lengths(rows)
+
+    safe_counts = np.maximum(counts, 1)[:, None]
+    means = sums / safe_counts
+    variances = np.maximum(squares / safe_counts - means * means, 0.0)
+    means[counts == 0] = np.nan
+    variances[counts == 0] = np.nan
+    centroid_distances = np.linalg.norm(means[:, None, :] - means[None, :, :], axis=2)
+
+    stats = {
+        "names": [info["name"] for info in class_info],
+        "indices": indices,
+        "counts": counts,
+        "means": means,
+        "variances": variances,
+        "centroid_distances": centroid_distances
+    }
+    if trajectory:
+        classes = np.searchsorted(indices, labels)
+        stats["path_lengths"] = lengths
+        stats["path_length_classes"] = classes
+        stats["path_length_mean"] = np.bincount(classes, lengths, num_classes) / safe_counts[:, 0]
+        stats["path_length_std"] = np.sqrt(np.maximum(
+            np.bincount(classes, lengths.astype(np.float64) ** 2, num_classes) / safe_counts[:, 0]
+            - stats["path_length_mean"] ** 2, 0.0))
+        # Length of the averaged trajectory, shorter than the mean length when samples disagree
+        stats["mean_trajectory_length"] = path_lengths(np.nan_to_num(means))
+    return stats
+
+
+def dataset_statistics(json_path: str) -> dict:
     """
-    
-    fig = plt.figure()
+    Statistics of every non-empty section of the dataset, keyed by section.
+    """
+    statistics = {}
+    for section in SECTIONS:
+        inputs, labels, section_meta = load_section(json_path, section)
+        if section_meta["num_samples"] == 0:
+            continue
+        statistics[section] = section_statistics(inputs, labels, section_meta["classes"],
+                                                 trajectory=section == "gestures")
+    return statistics
+
+
+def summarise(statistics: dict) -> dict:
+    """
+    JSON-friendly per-class summary: counts, spread, nearest other class and gesture path lengths.
+    """
+    summary = {}
+    for section, stats in statistics.items():
+        distances = stats["centroid_distances"].copy()
+        np.fill_diagonal(distances, np.inf)
+        classes = []
+        for i, name in enumerate(stats["names"]):
+            entry = {
+                "name": name,
+                "index": int(stats["indices"][i]),
+                "count": int(stats["counts"][i]),
+                "mean_variance": float(np.mean(stats["variances"][i]))
+            }
+            if len(stats["names"]) > 1:
+                nearest = int(np.argmin(distances[i]))
+                entry["nearest_class"] = stats["names"][nearest]
+                entry["nearest_centroid_distance"] = float(distances[i, nearest])
+            if "path_lengths" in stats:
+                entry["path_length_mean"] = float(stats["path_length_mean"][i])
+                entry["path_length_std"] = float(stats["path_length_std"][i])
+                entry["mean_trajectory_length"] = float(stats["mean_trajectory_length"][i])
+            classes.append(entry)
+        summary[section] = {
+            "num_samples": int(stats["counts"].sum()),
+            "classes": classes,
+            "centroid_distances": np.round(stats["centroid_distances"], 6).tolist()
+        }
+    return summary
+
+
+# =============================================================================
+# Figures
+# =============================================================================
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _plot_counts(path: str, section: str, names: list, counts: np.ndarray):
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(max(6, 0.5 * len(names)), 4))
+    ax.bar(names, counts)
+    ax.set_title(f"Samples per class ({section})")
+    ax.set_ylabel("Samples")
+    ax.tick_params(axis='x', rotation=60)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def _plot_centroid_distances(path: str, section: str, names: list, distances: np.ndarray):
+    plt = _pyplot()
+    size = max(5, 0.45 * len(names))
+    fig, ax = plt.subplots(figsize=(size + 1, size))
+    image = ax.imshow(distances, cmap="viridis")
+    ax.set_xticks(np.arange(len(names)))
+    ax.set_xticklabels(names, rotation=90)
+    ax.set_yticks(np.arange(len(names)))
+    ax.set_yticklabels(names)
+    ax.set_title(f"Distance between class centroids ({section})")
+    fig.colorbar(image, ax=ax)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def _plot_feature_spread(path: str, section: str, names: list, means: np.ndarray, variances: np.ndarray):
+    plt = _pyplot()
+    fig, axes = plt.subplots(1, 2, figsize=(12, max(4, 0.35 * len(names))))
+    for ax, values, title in ((axes[0], means, "Mean"), (axes[1], np.sqrt(variances), "Standard deviation")):
+        image = ax.imshow(values, aspect="auto", cmap="coolwarm" if title == "Mean" else "viridis")
+        ax.set_yticks(np.arange(len(names)))
+        ax.set_yticklabels(names)
+        ax.set_xlabel("Feature")
+        ax.set_title(f"{title} per feature ({section})")
+        fig.colorbar(image, ax=ax)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def _plot_path_lengths(path: str, names: list, lengths: np.ndarray, classes: np.ndarray):
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(max(6, 0.5 * len(names)), 4))
+    groups = [lengths[classes == i] for i in range(len(names))]
+    ax.boxplot([group if group.size else [np.nan] for group in groups])
+    ax.set_xticks(np.arange(1, len(names) + 1))
+    ax.set_xticklabels(names, rotation=60)
+    ax.set_title("Gesture path length")
+    ax.set_ylabel("Path length")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def _plot_trajectories(path: str, names: list, means: np.ndarray, samples: list = None):
+    """
+    Mean trajectories of the given gestures in one 3D plot, with a few recorded samples each.
+    """
+    plt = _pyplot()
+    fig = plt.figure(figsize=(7, 7))
     ax = fig.add_subplot(111, projection='3d')
-    
-    for g_name in gesture_names:
-        data = np.array(json_data["gestures"][g_name]["poseGestureData"][0])
-        points = data.reshape((-1, 3))
-        ax.plot(points[:, 0], points[:, 1], points[:, 2], marker='o', label=g_name)
-    
-    ax.set_title('3D Plot for Gestures')
-    ax.set_xlim(-1, 1)
-    ax.set_xticks(np.arange(-1, 1.1, 0.1))
-    ax.set_ylim(-1, 1)
-    ax.set_yticks(np.arange(-1, 1.1, 0.1))
-    ax.set_zlim(-1, 1)
-    ax.set_zticks(np.arange(-1, 1.1, 0.1))
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
+    for i, name in enumerate(names):
+        points = means[i].reshape(-1, 3)
+        line, = ax.plot(points[:, 0], points[:, 1], points[:, 2], marker='o', markersize=3, label=name)
+        if samples is not None:
+            for sample in trajectories(samples[i]):
+                ax.plot(sample[:, 0], sample[:, 1], sample[:, 2], color=line.get_color(), alpha=0.2, linewidth=0.8)
+    ax.set_title("Mean gesture trajectories" if len(names) > 1 else f"Gesture: {names[0]}")
+    for axis in "xyz":
+        getattr(ax, f"set_{axis}lim")(-1, 1)
+        getattr(ax, f"set_{axis}label")(axis.upper())
     ax.legend()
-    plt.show()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+_FIGURES = {
+    "counts": _plot_counts,
+    "centroid_distances": _plot_centroid_distances,
+    "feature_spread": _plot_feature_spread,
+    "path_lengths": _plot_path_lengths,
+    "trajectories": _plot_trajectories
+}
+
+
+def _render(kind: str, path: str, args: tuple) -> str:
+    _FIGURES[kind](path, *args)
+    return path
+
+
+def figure_jobs(json_path: str, statistics: dict, figures_dir: str, samples_per_gesture: int = 10) -> list:
+    """
+    (kind, path, args) for every figure of the report. Each job carries only the small arrays
+    its figure needs, so workers never load the dataset.
+    """
+    jobs = []
+    for section, stats in statistics.items():
+        names = stats["names"]
+        jobs.append(("counts", os.path.join(figures_dir, f"{section}_counts.png"), (section, names, stats["counts"])))
+        if len(names) > 1:
+            jobs.append(("centroid_distances", os.path.join(figures_dir, f"{section}_centroid_distances.png"),
+                         (section, names, stats["centroid_distances"])))
+        if section != "gestures":
+            jobs.append(("feature_spread", os.path.join(figures_dir, f"{section}_feature_spread.png"),
+                         (section, names, stats["means"], stats["variances"])))
+            continue
+
+        jobs.append(("path_lengths", os.path.join(figures_dir, "gestures_path_lengths.png"),
+                     (names, stats["path_lengths"], stats["path_length_classes"])))
+        jobs.append(("trajectories", os.path.join(figures_dir, "gestures_mean_trajectories.png"),
+                     (names, stats["means"])))
+        inputs, _, section_meta = load_section(json_path, section)
+        starts = {info["index"]: info["start"] for info in section_meta["classes"]}
+        for i, name in enumerate(names):
+            start = starts[int(stats["indices"][i])]
+            sample = np.array(inputs[start:start + min(samples_per_gesture, int(stats["counts"][i]))])
+            jobs.append(("trajectories", os.path.join(figures_dir, f"gesture_{name}.png"),
+                         ([name], stats["means"][i:i + 1], [sample])))
+    return jobs
+
+
+def render_figures(jobs: list, max_workers: int = None) -> list:
+    """
+    Renders the figure jobs in a process pool and returns the written paths.
+    """
+    if not jobs:
+        return []
+    num_workers = max(1, min(len(jobs), max_workers or os.cpu_count() or 1))
+    if num_workers == 1:
+        return [_render(*job) for job in jobs]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as pool:
+        return list(pool.map(_render, *zip(*jobs)))
+
+
+# =============================================================================
+# Report
+# =============================================================================
+def write_report(json_path: str, output_dir: str, figures: bool = True, max_workers: int = None,
+                 samples_per_gesture: int = 10) -> dict:
+    """
+    Writes stats.json (per-class summary), stats.npz (full per-class arrays) and, with figures
+    set, the PNG figures to output_dir. Returns the summary.
+    """
+    ensure_cache(json_path)
+    os.makedirs(output_dir, exist_ok=True)
+    statistics = dataset_statistics(json_path)
+    summary = summarise(statistics)
+
+    with open(os.path.join(output_dir, "stats.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+    arrays = {f"{section}_{key}": value for section, stats in statistics.items()
+              for key, value in stats.items() if key not in ("names", "path_lengths", "path_length_classes")}
+    np.savez(os.path.join(output_dir, "stats.npz"), **arrays)
+
+    for section, section_summary in summary.items():
+        print(f"{section}: {section_summary['num_samples']} samples in {len(section_summary['classes'])} classes")
+        for entry in section_summary["classes"]:
+            line = f"  {entry['name']:<16} n={entry['count']:<6} var={entry['mean_variance']:.4f}"
+            if "nearest_class" in entry:
+                line += f" nearest={entry['nearest_class']} ({entry['nearest_centroid_distance']:.3f})"
+            if "path_length_mean" in entry:
+                line += f" path={entry['path_length_mean']:.3f}±{entry['path_length_std']:.3f}"
+            print(line)
+
+    if figures:
+        figures_dir = os.path.join(output_dir, "figures")
+        os.makedirs(figures_dir, exist_ok=True)
+        paths = render_figures(figure_jobs(json_path, statistics, figures_dir, samples_per_gesture), max_workers)
+        print(f"{len(paths)} figures written to {figures_dir}")
+    print(f"Report written to {output_dir}")
+    return summary
 
 
-with open("PoseGestureData.json", "r") as f:
-    json_data = json.load(f)
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Per-class statistics and figures of the recorded poses and gestures")
+    parser.add_argument("--data", default="PoseGestureData.json")
+    parser.add_argument("--output", default=os.path.join(".logs", "report"))
+    parser.add_argument("--workers", type=int, default=None, help="Processes rendering figures (default: CPU count)")
+    parser.add_argument("--samples", type=int, default=10, help="Recorded samples drawn in each gesture figure")
+    parser.add_argument("--no-figures", action="store_true", help="Only write the statistics")
+    args = parser.parse_args()
 
-find_gesture_distance(json_data, "punch")
+    write_report(args.data, args.output, not args.no_figures, args.workers, args.samples)
 
-plot_gesture(json_data, ["right", "left", "up", "down"])
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import copy
+import math
+import os
+import time
+import numpy as np
+import onnxruntime as ort
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from pull_push_data import sync_data
+from data_cache import load_section, stratified_split
+from trainer import fit, log_run, select_device
+from warm_start import save_checkpoint
+from instrumentation import NullMonitor, TrainingMonitor
+from onnx_export import embed_weights
+from gesture_training import LowNet
+from pose_training import Net
+
+# Multi-task model serving poses and gestures from one ONNX graph
+#
+# The headset otherwise runs the pose model and a gesture model as two inference calls per hand
+# per frame. Here both tasks share the hidden layers of one network: each task has its own input
+# layer (the feature vectors differ in size) and its own output layer. The exported graph takes
+# "pose_input" and "gesture_input" and returns "pose_output" and "gesture_output", so each hand
+# needs one session and one call. The standalone Net and LowNet are trained on the same splits
+# as baselines for the per-head accuracy.
+
+
+def load_task(json_path: str, section: str, val_fraction: float, seed: int = 0):
+    """
+    Returns ((train_inputs, train_labels), (val_inputs, val_labels), num_classes) of one section.
+    """
+    inputs, labels, _ = load_section(json_path, section)
+    inputs, labels = torch.from_numpy(inputs), torch.from_numpy(labels)
+    train_idx, val_idx = stratified_split(labels.numpy(), val_fraction, seed)
+    train_idx, val_idx = torch.from_numpy(train_idx), torch.from_numpy(val_idx)
+    num_classes = labels.unique().numel()
+    print(f"Loaded {section}: input_size={inputs.shape[1]}, classes={num_classes}, "
+          f"{train_idx.numel()} training / {val_idx.numel()} validation samples")
+    return (inputs[train_idx], labels[train_idx]), (inputs[val_idx], labels[val_idx]), num_classes
+
+# =============================================================================
+# Model Architecture
+# =============================================================================
+class MultiTaskNet(nn.Module):
+    """
+    Pose and gesture classifier sharing its hidden layers: a task specific input layer feeds the
+    shared trunk, followed by a task specific output layer. The default sizes match Net.
+    """
+    def __init__(self, pose_input_size: int, gesture_input_size: int, num_poses: int, num_gestures: int,
+                 hidden_sizes=(64, 32)):
+        super(MultiTaskNet, self).__init__()
+        h1, h2 = hidden_sizes
+        self.pose_in = nn.Linear(pose_input_size, h1)
+        self.gesture_in = nn.Linear(gesture_input_size, h1)
+        self.trunk = nn.Sequential(nn.ReLU(), nn.Linear(h1, h2), nn.ReLU())
+        self.pose_head = nn.Linear(h2, num_poses)
+        self.gesture_head = nn.Linear(h2, num_gestures)
+
+    def pose_logits(self, x):
+        return self.pose_head(self.trunk(self.pose_in(x)))
+
+    def gesture_logits(self, x):
+        return self.gesture_head(self.trunk(self.gesture_in(x)))
+
+    def forward(self, pose_input, gesture_input):
+        return self.pose_logits(pose_input), self.gesture_logits(gesture_input)
+
+# =============================================================================
+# Training
+# =============================================================================
+def _epoch_order(num_samples: int, length: int, device) -> torch.Tensor:
+    # Enough shuffled passes over the samples to fill `length` slots, so the smaller task cycles
+    passes = [torch.randperm(num_samples, device=device) for _ in range((length + num_samples - 1) // num_samples)]
+    return torch.cat(passes)[:length]
+
+
+def evaluate_heads(model: MultiTaskNet, pose_data, gesture_data, criterion):
+    """
+    Returns [(loss, number of correct predictions)] of the pose and gesture heads as device tensors.
+    """
+    model.eval()
+    results = []
+    with torch.no_grad():
+        for logits, (inputs, labels) in ((model.pose_logits, pose_data), (model.gesture_logits, gesture_data)):
+            outputs = logits(inputs)
+            results.append((criterion(outputs, labels), (outputs.argmax(dim=1) == labels).sum()))
+    return results
+
+
+def fit_multitask(model: MultiTaskNet, pose_data, gesture_data, optimizer, device, num_epochs: int = 200,
+                  batch_size: int = 32, loss_weights=(1.0, 1.0), log_every: int = 10, val_data=None,
+                  patience: int = None, min_delta: float = 0.0, run_name: str = "multitask", log_path: str = None,
+                  monitor=None):
+    """
+    Trains both heads together. Every step takes a batch from each task and minimises
+    loss_weights[0] * pose loss + loss_weights[1] * gesture loss; an epoch is one pass over the
+    larger task with the smaller one cycled. With val_data=(pose_val, gesture_val) early stopping
+    follows the weighted validation loss and the best weights are restored; an empty validation set
+    for either task is treated as none. With monitor (an
+    instrumentation.TrainingMonitor) every epoch is recorded as in trainer.fit, with the weighted
+    loss and the accuracy over both tasks' samples.
+    Returns the model and a summary with the per-head validation accuracy.
+    """
+    start_time = time.perf_counter()
+    criterion = nn.CrossEntropyLoss()
+    model.to(device)
+    tasks = [(inputs.to(device), labels.to(device)) for inputs, labels in (pose_data, gesture_data)]
+    if val_data is not None and any(labels.shape[0] == 0 for _, labels in val_data):
+        print("A validation set is empty, training without validation or early stopping")
+        val_data = None
+    if val_data is not None:
+        val_tasks = [(inputs.to(device), labels.to(device)) for inputs, labels in val_data]
+    weights = torch.tensor(loss_weights, dtype=torch.float32, device=device)
+    num_batches = max(math.ceil(inputs.shape[0] / batch_size) for inputs, _ in tasks)
+    heads = (model.pose_logits, model.gesture_logits)
+    seen = num_batches * batch_size
+    monitor = monitor or NullMonitor()
+    monitor.on_train_start(run_name, model, device, 2 * seen, batch_size)
+
+    best_val_loss, best_epoch, best_state, epochs_run = float('inf'), 0, None, 0
+    for epoch in range(num_epochs):
+        monitor.on_epoch_start(epoch)
+        model.train()
+        with monitor.phase("data"):
+            orders = [_epoch_order(inputs.shape[0], seen, device) for inputs, _ in tasks]
+        running_loss = torch.zeros(2, device=device)
+        correct = torch.zeros(2, dtype=torch.int64, device=device)
+        for start in range(0, seen, batch_size):
+            with monitor.phase("forward"):
+                losses = []
+                for t, (head, (inputs, labels)) in enumerate(zip(heads, tasks)):
+                    batch = orders[t][start:start + batch_size]
+                    outputs = head(inputs[batch])
+                    losses.append(criterion(outputs, labels[batch]))
+                    correct[t] += (outputs.argmax(dim=1) == labels[batch]).sum()
+                losses = torch.stack(losses)
+            with monitor.phase("backward"):
+                (weights * losses).sum().backward()
+            with monitor.phase("optimizer"):
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+            running_loss += losses.detach()
+        epochs_run = epoch + 1
+        should_log = log_every and ((epoch + 1) % log_every == 0 or epoch == 0)
+
+        if val_data is not None:
+            with monitor.phase("validation"):
+                (pose_loss, pose_correct), (gesture_loss, gesture_correct) = \
+                    evaluate_heads(model, *val_tasks, criterion)
+                # Single host sync per epoch
+                stats = torch.stack([*(running_loss / num_batches), *correct.to(torch.float32), pose_loss,
+                                     gesture_loss, pose_correct.to(torch.float32),
+                                     gesture_correct.to(torch.float32)]).tolist()
+                val_loss = loss_weights[0] * stats[4] + loss_weights[1] * stats[5]
+                if val_loss < best_val_loss - min_delta:
+                    best_val_loss, best_epoch = val_loss, epoch + 1
+                    best_state = copy.deepcopy(model.state_dict())
+            monitor.on_epoch_end(epoch, 2 * seen, loss_weights[0] * stats[0] + loss_weights[1] * stats[1],
+                                 stats[2] + stats[3], val_loss, stats[6] + stats[7],
+                                 val_tasks[0][1].shape[0] + val_tasks[1][1].shape[0])
+            if should_log:
+                print(f'Epoch [{epoch + 1}/{num_epochs}] Pose Loss: {stats[0]:.4f} Gesture Loss: {stats[1]:.4f} '
+                      f'Val Pose Accuracy: {100 * stats[6] / val_tasks[0][1].shape[0]:.2f}% '
+                      f'Val Gesture Accuracy: {100 * stats[7] / val_tasks[1][1].shape[0]:.2f}%')
+            if patience is not None and epoch + 1 - best_epoch >= patience:
+                print(f'Early stopping at epoch {epoch + 1}, no improvement since epoch {best_epoch}')
+                break
+        else:
+            monitor.on_epoch_end(epoch, 2 * seen, (weights * running_loss).sum() / num_batches, correct.sum())
+            if should_log:
+                stats = torch.cat([running_loss / num_batches, correct.to(torch.float32)]).tolist()
+                print(f'Epoch [{epoch + 1}/{num_epochs}] Pose Loss: {stats[0]:.4f} Accuracy: {100 * stats[2] / seen:.2f}% '
+                      f'Gesture Loss: {stats[1]:.4f} Accuracy: {100 * stats[3] / seen:.2f}%')
+
+    summary = {
+        "run": run_name,
+        "max_epochs": num_epochs,
+        "epochs_run": epochs_run,
+        "loss_weights": list(loss_weights),
+        "seconds": time.perf_counter() - start_time
+    }
+    summary["seconds_per_epoch"] = summary["seconds"] / max(epochs_run, 1)
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        (_, pose_correct), (_, gesture_correct) = evaluate_heads(model, *val_tasks, criterion)
+        summary.update({
+            "best_epoch": best_epoch,
+            "best_val_loss": best_val_loss,
+            "pose_val_accuracy": pose_correct.item() / val_tasks[0][1].shape[0],
+            "gesture_val_accuracy": gesture_correct.item() / val_tasks[1][1].shape[0]
+        })
+        print(f'Restored best weights from epoch {best_epoch} '
+              f'(Val Pose Accuracy: {100 * summary["pose_val_accuracy"]:.2f}% '
+              f'Val Gesture Accuracy: {100 * summary["gesture_val_accuracy"]:.2f}%)')
+    monitor.on_train_end(summary)
+    print(f'Finished Training: {epochs_run}/{num_epochs} epochs in {summary["seconds"]:.1f}s')
+    if log_path:
+        log_run(log_path, summary)
+    return model, summary
+
+
+def train_baselines(pose_split, gesture_split, num_poses: int, num_gestures: int, device, lr: float,
+                    train_options: dict, monitor_options: dict = None) -> dict:
+    """
+    Trains the standalone pose Net and gesture LowNet on the same splits as the multi-task model.
+    Returns {"poses": summary, "gestures": summary}.
+    """
+    summaries = {}
+    for section, model_class, num_classes, (train_data, val_data) in (
+            ("poses", Net, num_poses, pose_split), ("gestures", LowNet, num_gestures, gesture_split)):
+        print(f"\nTraining baseline {model_class.__name__} on {section}:")
+        model = model_class(train_data[0].shape[1], num_classes)
+        summaries[section] = fit(model, *train_data, nn.CrossEntropyLoss(), optim.SGD(model.parameters(), lr=lr),
+                                 device, val_data=val_data, run_name=f"multitask_baseline_{section}",
+                                 monitor=TrainingMonitor(**monitor_options) if monitor_options is not None else None,
+                                 **train_options)[1]
+    return summaries
+
+# =============================================================================
+# Export
+# =============================================================================
+def export_to_onnx(model: MultiTaskNet, pose_input_size: int, gesture_input_size: int, device, path: str,
+                   dynamic_batch: bool = False):
+    """
+    Exports the model as one graph with two inputs and two outputs. With dynamic_batch the two
+    inputs get independent batch axes.
+    """
+    model.eval()
+    dummy = (torch.randn(1, pose_input_size, device=device), torch.randn(1, gesture_input_size, device=device))
+    torch.onnx.export(
+        model, dummy, path,
+        input_names=["pose_input", "gesture_input"], output_names=["pose_output", "gesture_output"],
+        dynamic_axes={"pose_input": {0: "pose_batch"}, "gesture_input": {0: "gesture_batch"},
+                      "pose_output": {0: "pose_batch"}, "gesture_output": {0: "gesture_batch"}}
+        if dynamic_batch else None,
+        verbose=False
+    )
+    embed_weights(path)
+    print(f"Exported ONNX to {path}")
+
+
+def check_export(onnx_path: str, model: MultiTaskNet, pose_inputs: torch.Tensor, gesture_inputs: torch.Tensor,
+                 max_samples: int = 256) -> dict:
+    """
+    Runs the exported graph one (pose, gesture) pair per call, as on the headset, and compares
+    both outputs with the PyTorch model.
+    """
+    count = min(max_samples, pose_inputs.shape[0], gesture_inputs.shape[0])
+    pose_inputs, gesture_inputs = pose_inputs[:count].cpu(), gesture_inputs[:count].cpu()
+    model = model.cpu().eval()
+    with torch.no_grad():
+        reference = [outputs.numpy() for outputs in model(pose_inputs, gesture_inputs)]
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    outputs = [session.run(None, {"pose_input": pose_inputs[i:i + 1].numpy(),
+                                  "gesture_input": gesture_inputs[i:i + 1].numpy()}) for i in range(count)]
+    report = {"samples": count}
+    for i, (head, expected) in enumerate(zip(("pose", "gesture"), reference)):
+        logits = np.concatenate([output[i] for output in outputs])
+        report[f"{head}_max_abs_diff"] = float(np.abs(logits - expected).max())
+        report[f"{head}_agreement"] = float((logits.argmax(axis=1) == expected.argmax(axis=1)).mean())
+    print(f"ONNX check over {count} calls: pose max diff {report['pose_max_abs_diff']:.2e}, "
+          f"gesture max diff {report['gesture_max_abs_diff']:.2e}")
+    return report
+
+# =============================================================================
+# Configuration and Main Function
+# =============================================================================
+def default_config() -> dict:
+    """
+    Configuration of a multi-task training run, overridable from the CLI (flags or a config file).
+    """
+    return {
+        "json_file": "poseGestureData.json",
+        "batch_size": 32,
+        "num_epochs": 200,  # Upper bound, early stopping usually ends training sooner
+        "val_fraction": 0.2,
+        "patience": 20,
+        "lr": 0.001,
+        "pose_weight": 1.0,  # Weights of the two losses in the shared objective
+        "gesture_weight": 1.0,
+        "hidden_sizes": [64, 32],
+        "onnx_path": "models/model_multitask.onnx",
+        "dynamic_batch": False,  # Barracuda in MLClassifier runs a fixed batch of 1
+        "baselines": True,  # Also train the standalone Net and LowNet and compare the per-head accuracy
+        "log_path": os.path.join(".logs", "training_runs.jsonl"),
+        "sync": True,  # Pull the latest recordings from the HMD before training
+        "link": True,  # Set to False for adb
+        "device": None,  # None picks CUDA when available
+        "seed": 0,
+        # Per-epoch phase timings, throughput and memory written to .logs/instrumentation, None to disable
+        "monitor_options": None
+    }
+
+
+def run(config: dict) -> dict:
+    """
+    Trains and exports the multi-task model (see default_config) and returns the summaries of it
+    and of the baselines.
+    """
+    json_file, onnx_path, monitor_options = config["json_file"], config["onnx_path"], config["monitor_options"]
+    device = select_device(config["device"])
+    print(f"Using device: {device}")
+
+    # Sync data from HMD
+    if config["sync"]:
+        sync_data(pull=True, push=False, link=config["link"])
+
+    pose_train, pose_val, num_poses = load_task(json_file, "poses", config["val_fraction"], config["seed"])
+    gesture_train, gesture_val, num_gestures = load_task(json_file, "gestures", config["val_fraction"], config["seed"])
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+
+    torch.manual_seed(config["seed"])
+    model = MultiTaskNet(pose_train[0].shape[1], gesture_train[0].shape[1], num_poses, num_gestures,
+                         tuple(config["hidden_sizes"]))
+    optimizer = optim.SGD(model.parameters(), lr=config["lr"])
+    model, summary = fit_multitask(model, pose_train, gesture_train, optimizer, device, config["num_epochs"],
+                                   config["batch_size"], (config["pose_weight"], config["gesture_weight"]),
+                                   val_data=(pose_val, gesture_val), patience=config["patience"],
+                                   log_path=config["log_path"], monitor=TrainingMonitor(**monitor_options)
+                                   if monitor_options is not None else None)
+    save_checkpoint(model, os.path.splitext(onnx_path)[0] + ".pt", {
+        "pose_input_size": pose_train[0].shape[1],
+        "gesture_input_size": gesture_train[0].shape[1],
+        "num_poses": num_poses,
+        "num_gestures": num_gestures,
+        "hidden_sizes": list(config["hidden_sizes"])
+    }, summary)
+    export_to_onnx(model, pose_train[0].shape[1], gesture_train[0].shape[1], device, onnx_path, config["dynamic_batch"])
+    # Any rows do for the parity check, the validation ones when there are some
+    summary["onnx_check"] = check_export(onnx_path, model, pose_val[0] if pose_val[1].numel() else pose_train[0],
+                                         gesture_val[0] if gesture_val[1].numel() else gesture_train[0])
+
+    results = {"multitask": summary}
+    if config["baselines"]:
+        torch.manual_seed(config["seed"])
+        results["baselines"] = train_baselines(
+            (pose_train, pose_val), (gesture_train, gesture_val), num_poses, num_gestures, device, config["lr"],
+            {"num_epochs": config["num_epochs"], "batch_size": config["batch_size"], "patience": config["patience"],
+             "log_path": config["log_path"]}, monitor_options)
+    if config["baselines"] and "pose_val_accuracy" in summary:
+        print("\nValidation accuracy   multi-task   standalone")
+        for section, key in (("poses", "pose_val_accuracy"), ("gestures", "gesture_val_accuracy")):
+            print(f"{section:<20}{100 * summary[key]:>11.2f}%{100 * results['baselines'][section]['val_accuracy']:>12.2f}%")
+    return results
+
+
+def main():
+    run(default_config())
+
+if __name__ == "__main__":
+    main()
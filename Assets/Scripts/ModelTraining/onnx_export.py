@@ -0,0 +1,200 @@
+import json
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import onnx
+import onnxruntime as ort
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+# Optimized and quantized variants of an exported ONNX model
+#
+# Starting from the fp32 graph written by export_to_onnx, this produces:
+#   <name>.opt.onnx   constant-folded graph (onnxruntime basic level, standard ops only)
+#   <name>.int8.onnx  dynamic int8 weight quantization
+#   <name>.fp16.onnx  fp16 weights with fp32 inputs/outputs (needs onnxconverter-common)
+# All of them are single files with the weights inline, as is the fp32 graph after embed_weights.
+# Every variant is checked against the PyTorch model on the dataset and a size and accuracy
+# report is written next to the models.
+
+
+def variant_path(onnx_path: str, variant: str) -> str:
+    root, ext = os.path.splitext(onnx_path)
+    return f"{root}.{variant}{ext}"
+
+
+def _tensors(graph):
+    # Initializers and tensor attributes of the graph and its subgraphs
+    yield from graph.initializer
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.HasField("t"):
+                yield attribute.t
+            yield from attribute.tensors
+            if attribute.HasField("g"):
+                yield from _tensors(attribute.g)
+            for subgraph in attribute.graphs:
+                yield from _tensors(subgraph)
+
+
+def external_data_files(onnx_path: str) -> list:
+    """
+    Paths of every external data file the model references.
+    """
+    model = onnx.load(onnx_path, load_external_data=False)
+    directory = os.path.dirname(onnx_path)
+    locations = {entry.value for tensor in _tensors(model.graph)
+                 if tensor.data_location == onnx.TensorProto.EXTERNAL
+                 for entry in tensor.external_data if entry.key == "location"}
+    return sorted(os.path.join(directory, location) for location in locations)
+
+
+def model_size(onnx_path: str) -> int:
+    """
+    Size on disk of the model, including every external data file it references.
+    """
+    return os.path.getsize(onnx_path) + sum(os.path.getsize(path) for path in external_data_files(onnx_path)
+                                            if os.path.exists(path))
+
+
+def embed_weights(onnx_path: str) -> str:
+    """
+    Rewrites the model as a single file with its initializers inline. The torch.onnx (dynamo)
+    exporter stores them in <model>.onnx.data, which Barracuda and the other variants would
+    otherwise need next to the graph. The data file is removed afterwards.
+    """
+    external = external_data_files(onnx_path)
+    if not external:
+        return onnx_path
+    model = onnx.load(onnx_path)
+    onnx.save(model, onnx_path, save_as_external_data=False)
+    for path in external:
+        if os.path.exists(path):
+            os.remove(path)
+    return onnx_path
+
+
+# =============================================================================
+# Variant Generation
+# =============================================================================
+def optimize_graph(onnx_path: str, output_path: str) -> str:
+    """
+    Runs onnxruntime's basic graph optimizations (constant folding, redundant node elimination)
+    offline and saves the result. The basic level keeps to standard ONNX ops, so the optimized
+    graph stays loadable outside onnxruntime (e.g. Barracuda).
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    options.optimized_model_filepath = output_path
+    ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    # onnxruntime keeps pointing at the source's external data, save the weights inline so the
+    # variant loads on its own
+    onnx.save(onnx.load(output_path), output_path, save_as_external_data=False)
+    return output_path
+
+
+def quantize_int8(onnx_path: str, output_path: str) -> str:
+    """
+    Dynamic int8 quantization: weights are stored as int8, activations are quantized at run time.
+    """
+    # Some exporters record value_info for the weights, which goes stale once the quantizer
+    # transposes them and makes its shape inference fail, so quantize a copy without it
+    model = onnx.load(onnx_path)
+    initializers = {initializer.name for initializer in model.graph.initializer}
+    stale = [info for info in model.graph.value_info if info.name in initializers]
+    for info in stale:
+        model.graph.value_info.remove(info)
+    staging_path = output_path + ".tmp"
+    onnx.save(model, staging_path)
+    try:
+        quantize_dynamic(staging_path, output_path, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(staging_path)
+    return output_path
+
+
+def convert_fp16(onnx_path: str, output_path: str):
+    """
+    Converts weights to fp16 while keeping fp32 inputs and outputs.
+    Returns None when onnxconverter-common is not installed.
+    """
+    try:
+        from onnxconverter_common import float16
+    except ImportError:
+        print("onnxconverter-common not installed, skipping fp16 variant")
+        return None
+    model = float16.convert_float_to_float16(onnx.load(onnx_path), keep_io_types=True)
+    onnx.save(model, output_path)
+    return output_path
+
+
+# =============================================================================
+# Accuracy Checks
+# =============================================================================
+def onnx_logits(onnx_path: str, inputs: np.ndarray, batch_size: int = 1024) -> np.ndarray:
+    """
+    Runs the ONNX model over all inputs, batched when the graph has a dynamic batch axis
+    and one sample at a time otherwise.
+    """
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    step = batch_size if not isinstance(model_input.shape[0], int) else model_input.shape[0]
+    outputs = [session.run(None, {model_input.name: inputs[i:i + step]})[0] for i in range(0, inputs.shape[0], step)]
+    return np.concatenate(outputs, axis=0)
+
+
+def check_variant(onnx_path: str, inputs: np.ndarray, labels: np.ndarray, reference_logits: np.ndarray) -> dict:
+    """
+    Compares a variant's predictions with the labels and with the PyTorch model's logits.
+    """
+    logits = onnx_logits(onnx_path, inputs)
+    predictions = logits.argmax(axis=1)
+    return {
+        "path": onnx_path,
+        "size_bytes": model_size(onnx_path),
+        "accuracy": float((predictions == labels).mean()),
+        "agreement": float((predictions == reference_logits.argmax(axis=1)).mean()),
+        "max_abs_diff": float(np.abs(logits - reference_logits).max())
+    }
+
+
+def export_variants(model: nn.Module, onnx_path: str, inputs: torch.Tensor, labels: torch.Tensor,
+                    fp16: bool = False, tolerance: float = 0.01, report_path: str = None) -> dict:
+    """
+    Builds the optimized variants of an already exported fp32 model, checks each against
+    the PyTorch model on (inputs, labels) and writes a size and accuracy report.
+    A variant is within tolerance when its accuracy is at most `tolerance` below PyTorch's.
+    """
+    model = model.cpu().eval()
+    inputs_np = inputs.cpu().numpy().astype(np.float32)
+    labels_np = labels.cpu().numpy()
+    with torch.no_grad():
+        reference_logits = model(inputs.cpu().float()).numpy()
+    torch_accuracy = float((reference_logits.argmax(axis=1) == labels_np).mean())
+
+    variants = {"fp32": onnx_path}
+    variants["opt"] = optimize_graph(onnx_path, variant_path(onnx_path, "opt"))
+    variants["int8"] = quantize_int8(onnx_path, variant_path(onnx_path, "int8"))
+    if fp16:
+        fp16_path = convert_fp16(onnx_path, variant_path(onnx_path, "fp16"))
+        if fp16_path:
+            variants["fp16"] = fp16_path
+
+    report = {"torch_accuracy": torch_accuracy, "tolerance": tolerance, "num_samples": int(labels_np.shape[0]),
+              "variants": {}}
+    for name, path in variants.items():
+        result = check_variant(path, inputs_np, labels_np, reference_logits)
+        result["within_tolerance"] = torch_accuracy - result["accuracy"] <= tolerance
+        report["variants"][name] = result
+        print(f"{name:>5}: {result['size_bytes'] / 1024:8.1f} KiB  accuracy {100 * result['accuracy']:.2f}%  "
+              f"agreement {100 * result['agreement']:.2f}%  max |diff| {result['max_abs_diff']:.2e}")
+
+    passing = [name for name, result in report["variants"].items() if result["within_tolerance"]]
+    report["smallest_within_tolerance"] = min(passing, key=lambda n: report["variants"][n]["size_bytes"]) \
+        if passing else None
+
+    report_path = report_path or os.path.splitext(onnx_path)[0] + ".export_report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Export report written to {report_path}")
+    return report
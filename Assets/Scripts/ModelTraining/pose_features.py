@@ -0,0 +1,199 @@
+import argparse
+import glob
+import os
+import time
+import numpy as np
+from recording_store import write_sections
+
+# Batched re-featurization of raw hand skeletons into the pose features
+#
+# HandPoseCalculations.getPose turns the OVRSkeleton bone positions of one frame into the 22 pose
+# features of HandPoseData: 10 joint angles, 5 knuckle angles and 7 joint distances. The same
+# features are computed here for N frames of bone positions [N, 24, 3] at once. Features live in
+# a registry: angles and distances are declared by the bones they use and evaluated together in
+# one gather per kind, other features are functions of the whole bone array. A feature set is a
+# list of registered names, so new features can be tried on an archive of raw skeletons without
+# re-recording the poses.
+
+_CHUNK_ROWS = 1 << 16
+
+# OVRSkeleton.BoneId of the hand skeleton (24 bones)
+BONES = {
+    "WristRoot": 0, "ForearmStub": 1,
+    "Thumb0": 2, "Thumb1": 3, "Thumb2": 4, "Thumb3": 5,
+    "Index1": 6, "Index2": 7, "Index3": 8,
+    "Middle1": 9, "Middle2": 10, "Middle3": 11,
+    "Ring1": 12, "Ring2": 13, "Ring3": 14,
+    "Pinky0": 15, "Pinky1": 16, "Pinky2": 17, "Pinky3": 18,
+    "ThumbTip": 19, "IndexTip": 20, "MiddleTip": 21, "RingTip": 22, "PinkyTip": 23
+}
+NUM_BONES = 24
+
+# Below this product of squared magnitudes Vector3.Angle returns 0
+_EPSILON_NORMAL_SQRT = 1e-15
+
+# name -> ("angle", bone ids) | ("distance", bone ids) | ("function", callable)
+REGISTRY = {}
+
+
+def _bone(bone) -> int:
+    return BONES[bone] if isinstance(bone, str) else int(bone)
+
+
+def register_angle(name: str, bone1, bone2, bone3):
+    """
+    Vector3.Angle(p2 - p1, p3 - p2) in degrees, as HandPoseCalculations.CalculateAngle.
+    Bones are BONES names or BoneId values.
+    """
+    REGISTRY[name] = ("angle", (_bone(bone1), _bone(bone2), _bone(bone3)))
+
+
+def register_distance(name: str, bone1, bone2):
+    """
+    Vector3.Distance between two bones, as HandPoseCalculations.CalculateDistance.
+    """
+    REGISTRY[name] = ("distance", (_bone(bone1), _bone(bone2)))
+
+
+def register_function(name: str, function):
+    """
+    Registers a feature computed by function(bones [n, 24, 3] float64) -> values [n].
+    """
+    REGISTRY[name] = ("function", function)
+
+
+def _register_hand_pose_features() -> list:
+    names = []
+    for finger in ("Thumb", "Index", "Middle", "Ring", "Pinky"):
+        prefix = finger.lower()
+        register_angle(f"{prefix}Angle1", f"{finger}1", f"{finger}2", f"{finger}3")
+        register_angle(f"{prefix}Angle2", f"{finger}2", f"{finger}3", f"{finger}Tip")
+        names += [f"{prefix}Angle1", f"{prefix}Angle2"]
+    for finger in ("Thumb", "Index", "Middle", "Ring", "Pinky"):
+        register_angle(f"{finger.lower()}KnuckleAngle", "WristRoot", f"{finger}1", f"{finger}2")
+        names.append(f"{finger.lower()}KnuckleAngle")
+    for name, bone1, bone2 in (("thumbToIndexDistance", "ThumbTip", "IndexTip"),
+                               ("thumbToPinkyDistance", "ThumbTip", "PinkyTip"),
+                               ("wristToIndexDistance", "WristRoot", "IndexTip"),
+                               ("indexToMiddleDistance", "IndexTip", "MiddleTip"),
+                               ("middleToRingDistance", "MiddleTip", "RingTip"),
+                               ("ringToPinkyDistance", "RingTip", "PinkyTip"),
+                               ("wristToPinkyDistance", "WristRoot", "PinkyTip")):
+        register_distance(name, bone1, bone2)
+        names.append(name)
+    return names
+
+
+# The features of HandPoseData in the order getPose writes them
+POSE_FEATURES = _register_hand_pose_features()
+
+# =============================================================================
+# Vectorised Feature Computation
+# =============================================================================
+def angles(bones: np.ndarray, triples: np.ndarray) -> np.ndarray:
+    """
+    Vector3.Angle(p2 - p1, p3 - p2) in degrees for every frame and bone triple: [n, len(triples)].
+    """
+    points = bones[:, triples]
+    first, second = points[:, :, 1] - points[:, :, 0], points[:, :, 2] - points[:, :, 1]
+    dot = np.einsum('nfk,nfk->nf', first, second)
+    denominator = np.sqrt(np.einsum('nfk,nfk->nf', first, first) * np.einsum('nfk,nfk->nf', second, second))
+    valid = denominator >= _EPSILON_NORMAL_SQRT
+    cosine = np.divide(dot, denominator, out=np.ones_like(dot), where=valid)
+    return np.where(valid, np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0))), 0.0)
+
+
+def distances(bones: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """
+    Vector3.Distance for every frame and bone pair: [n, len(pairs)].
+    """
+    points = bones[:, pairs]
+    return np.linalg.norm(points[:, :, 1] - points[:, :, 0], axis=2)
+
+
+def featurize(bones, features=None, dtype=np.float32) -> np.ndarray:
+    """
+    Computes the named features (POSE_FEATURES by default) for bone positions [N, 24, 3].
+    Returns [N, len(features)] rows in the layout of the poses section of PoseGestureData.json.
+    Frames are processed a chunk at a time in float64, so memory-mapped archives of any size work.
+    """
+    features = list(POSE_FEATURES if features is None else features)
+    unknown = [name for name in features if name not in REGISTRY]
+    if unknown:
+        raise KeyError(f"Unregistered features {unknown}, known: {list(REGISTRY)}")
+    if bones.ndim != 3 or bones.shape[1] < NUM_BONES or bones.shape[2] != 3:
+        raise ValueError(f"Expected bone positions [N, {NUM_BONES}, 3], got {list(bones.shape)}")
+
+    groups = {"angle": ([], []), "distance": ([], [])}
+    functions = []
+    for column, name in enumerate(features):
+        kind, spec = REGISTRY[name]
+        if kind == "function":
+            functions.append((column, spec))
+        else:
+            groups[kind][0].append(column)
+            groups[kind][1].append(spec)
+    kernels = {"angle": angles, "distance": distances}
+
+    output = np.empty((bones.shape[0], len(features)), dtype=dtype)
+    for start in range(0, bones.shape[0], _CHUNK_ROWS):
+        chunk = np.asarray(bones[start:start + _CHUNK_ROWS], dtype=np.float64)
+        rows = output[start:start + chunk.shape[0]]
+        for kind, (columns, specs) in groups.items():
+            if columns:
+                rows[:, columns] = kernels[kind](chunk, np.array(specs, dtype=np.int64))
+        for column, function in functions:
+            rows[:, column] = function(chunk)
+    return output
+
+# =============================================================================
+# Archives and Training Data
+# =============================================================================
+def load_bone_archive(path: str) -> dict:
+    """
+    Reads {class name: bone positions [N, 24, 3]} from an .npz file or a directory of
+    <class name>.npy files (memory-mapped), in file order.
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, "*.npy")))
+        return {os.path.splitext(os.path.basename(f))[0]: np.load(f, mmap_mode='r') for f in files}
+    with np.load(path) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+def refeaturize(archive_path: str, output_path: str, features=None, section: str = "poses") -> dict:
+    """
+    Featurizes every class of a bone archive and writes the rows as the section of output_path
+    (a .json data file or a recording store). Returns {class name: number of frames}.
+    """
+    features = list(POSE_FEATURES if features is None else features)
+    start = time.perf_counter()
+    class_rows = {name: featurize(bones, features) for name, bones in load_bone_archive(archive_path).items()}
+    seconds = time.perf_counter() - start
+    num_frames = sum(rows.shape[0] for rows in class_rows.values())
+    print(f"Computed {len(features)} features for {num_frames} frames of {len(class_rows)} classes in {seconds:.2f}s")
+    write_sections({section: {name: (index, rows) for index, (name, rows) in enumerate(class_rows.items())}},
+                   output_path)
+    print(f"Wrote the {section} section of {output_path}")
+    return {name: rows.shape[0] for name, rows in class_rows.items()}
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the pose features from recorded hand skeletons")
+    parser.add_argument("archive", nargs="?", help=".npz file or directory of <class>.npy bone positions [N, 24, 3]")
+    parser.add_argument("output", nargs="?", help="PoseGestureData.json or a recording store directory")
+    parser.add_argument("--features", nargs="+", help="Registered feature names (default: the 22 HandPoseData features)")
+    parser.add_argument("--list", action="store_true", help="List the registered features")
+    args = parser.parse_args()
+
+    if args.list or args.archive is None or args.output is None:
+        for name, (kind, spec) in REGISTRY.items():
+            print(f"{name:<24} {kind:<9} {spec if kind != 'function' else spec.__name__}")
+        return
+    refeaturize(args.archive, args.output, args.features)
+
+if __name__ == "__main__":
+    main()
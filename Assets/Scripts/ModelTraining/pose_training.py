@@ -1,49 +1,40 @@
-import json
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
 from pull_push_data import sync_data
+from data_cache import load_section
+from trainer import fit, select_device
+from onnx_export import embed_weights, export_variants
+from warm_start import checkpoint_path, load_checkpoint, prepare, save_checkpoint
+from instrumentation import TrainingMonitor
+from curation import sample_weights
 import os
 
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
-
-def load_pose_data(json_path: str, batch_size: int) -> (DataLoader, int, int):
+def load_pose_data(json_path: str):
     """
-    Loads gesture data from a JSON file, preprocesses it into inputs and labels,
-    wraps it in a DataLoader, and returns that loader along with input feature size
-    and number of classes.
+    Loads pose data from the memory-mapped cache of the JSON file and returns the
+    inputs and labels tensors along with input feature size and number of classes.
     """
-    with open(json_path, 'r') as f:
-        js = json.load(f)
-
-    data = []
-    for pose in js["poses"].values():
-        label = pose["poseGestureIndex"]
-        for feat in pose["poseGestureData"]:
-            data.append(feat + [label])
+    feats, labs, _ = load_section(json_path, "poses")
 
-    inputs = torch.tensor([d[:-1] for d in data], dtype=torch.float32)
-    labels = torch.tensor([d[-1] for d in data], dtype=torch.int64)
-    
-    dataset = TensorDataset(inputs, labels)
+    inputs = torch.from_numpy(feats)
+    labels = torch.from_numpy(labs)
     input_size = inputs.size(1)
     num_classes = labels.unique().numel()
-    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
     
     print(f"Loaded poses: input_size={input_size}, classes={num_classes}")
-    return loader, input_size, num_classes
+    return inputs, labels, input_size, num_classes
 
 # =============================================================================
 # Model Architecture
 # =============================================================================
 class Net(nn.Module):
-    def __init__(self, input_size: int, num_classes: int):
+    def __init__(self, input_size: int, num_classes: int, hidden_sizes=(64, 32)):
         super(Net, self).__init__()
-        self.fc1 = nn.Linear(input_size, 64)
-        self.fc2 = nn.Linear(64, 32)
-        self.fc3 = nn.Linear(32, num_classes)
+        h1, h2 = hidden_sizes
+        self.fc1 = nn.Linear(input_size, h1)
+        self.fc2 = nn.Linear(h1, h2)
+        self.fc3 = nn.Linear(h2, num_classes)
         self.relu = nn.ReLU()
 
     def forward(self, x):
@@ -54,60 +45,112 @@ class Net(nn.Module):
 # =============================================================================
 # Training and Export Functions
 # =============================================================================
-def train_model(model, dataloader, criterion, optimizer, device, epochs=100):
-    model.to(device)
-    for ep in range(epochs):
-        model.train()
-        running_loss, correct, total = 0.0, 0, 0
-        for xb, yb in dataloader:
-            xb, yb = xb.to(device), yb.to(device)
-            optimizer.zero_grad()
-            out = model(xb)
-            loss = criterion(out, yb)
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item()
-            preds = out.argmax(dim=1)
-            total += yb.size(0)
-            correct += (preds == yb).sum().item()
-        if ep == 0 or (ep + 1) % 10 == 0:
-            acc = 100 * correct / total
-            print(f"Epoch[{ep+1}/{epochs}] Loss:{running_loss/len(dataloader):.4f} Acc:{acc:.2f}%")
-    print("Training complete")
-    return model
-
-def export_to_onnx(model, input_size, device, path):
+def export_to_onnx(model, input_size, device, path, dynamic_batch=False):
     model.eval()
     dummy = torch.randn(1, input_size, device=device)
     torch.onnx.export(
         model, dummy, path,
-        input_names=["input"], output_names=["output"], verbose=False
+        input_names=["input"], output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}} if dynamic_batch else None,
+        verbose=False
     )
+    embed_weights(path)
     print(f"Exported ONNX to {path}")
 
+def export_checkpoint(json_path: str, onnx_path: str, dynamic_batch: bool = False, variants: bool = True,
+                      device=torch.device('cpu')) -> bool:
+    """
+    Re-exports the pose model (and its variants) from its checkpoint without training.
+    Returns False when there is no checkpoint.
+    """
+    checkpoint = load_checkpoint(checkpoint_path(onnx_path))
+    if checkpoint is None:
+        print(f"No checkpoint at {checkpoint_path(onnx_path)}, train the pose model first")
+        return False
+    fingerprint = checkpoint["fingerprint"]
+    net = Net(fingerprint["input_size"], len(fingerprint["classes"]))
+    net.load_state_dict(checkpoint["state_dict"])
+    export_to_onnx(net.to(device), fingerprint["input_size"], device, onnx_path, dynamic_batch)
+    if variants:
+        inputs, labels, _, _ = load_pose_data(json_path)
+        export_variants(net, onnx_path, inputs, labels)
+    return True
+
 # =============================================================================
-# Main Function
+# Configuration and Main Function
 # =============================================================================
-def main():
-    # Configurations
-    json_file = "poseGestureData.json"
-    batch_size = 32
-    epochs = 100
-    link = True  # Set to False for adb
-    
+def default_config() -> dict:
+    """
+    Configuration of a pose training run, overridable from the CLI (flags or a config file).
+    """
+    return {
+        "json_file": "poseGestureData.json",
+        "batch_size": 32,
+        "epochs": 100,  # Upper bound, early stopping usually ends training sooner
+        "val_fraction": 0.2,
+        "patience": 10,
+        "log_path": os.path.join(".logs", "training_runs.jsonl"),
+        "onnx_path": "models/model_poses.onnx",
+        "dynamic_batch": False,  # Barracuda in MLClassifier runs a fixed batch of 1
+        "export_variants": True,  # Also write optimized/int8 variants and an accuracy report
+        "sync": True,  # Pull the latest recordings from the HMD before training
+        "link": True,  # Set to False for adb
+        "device": None,  # None picks CUDA when available
+        # Resume from the previous run's checkpoint and fine-tune on new recordings, None to train from scratch
+        "warm_start_options": {"epochs": 15, "patience": 5, "replay_per_class": 32},
+        # Per-epoch phase timings, throughput and memory written to .logs/instrumentation, None to disable
+        "monitor_options": None,
+        # Draw training batches class-balanced and without near-duplicates (see curation.py), None to shuffle
+        # the recorded rows uniformly
+        "curation_options": None
+    }
+
+
+def run(config: dict):
+    """
+    Trains and exports the pose model (see default_config).
+    """
+    json_file, onnx_path = config["json_file"], config["onnx_path"]
+    epochs, patience = config["epochs"], config["patience"]
+    warm_start_options, monitor_options = config["warm_start_options"], config["monitor_options"]
+    device = select_device(config["device"])
+    print(f"Using device: {device}")
+
     # Sync data from HMD
-    sync_data(pull=True, push=False, link=link)
+    if config["sync"]:
+        sync_data(pull=True, push=False, link=config["link"])
 
     # Load data
-    dataloader, input_size, num_classes = load_pose_data(json_file, batch_size)
+    inputs, labels, input_size, num_classes = load_pose_data(json_file)
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
 
     net = Net(input_size, num_classes)
+    warm, train_idx, val_idx, fingerprint = prepare(
+        net, onnx_path, json_file, "poses", labels, config["val_fraction"],
+        warm_start_options["replay_per_class"] if warm_start_options else 0, resume=warm_start_options is not None)
+    if warm:
+        epochs, patience = warm_start_options["epochs"], warm_start_options["patience"]
+    weights = sample_weights(json_file, "poses", **config["curation_options"])[train_idx] \
+        if config["curation_options"] is not None else None
+    train_idx, val_idx = torch.from_numpy(train_idx), torch.from_numpy(val_idx)
     crit = nn.CrossEntropyLoss()
     opt = optim.SGD(net.parameters(), lr=0.001)
 
-    trained = train_model(net, dataloader, crit, opt, device, epochs)
-    os.makedirs("models", exist_ok=True)
-    export_to_onnx(trained, input_size, device, "models/model_poses.onnx")
+    # With unchanged data the resumed model is exported as is
+    trained = net
+    if train_idx.numel():
+        trained, summary = fit(net, inputs[train_idx], labels[train_idx], crit, opt, device, epochs,
+                               config["batch_size"], val_data=(inputs[val_idx], labels[val_idx]), patience=patience,
+                               run_name="poses", log_path=config["log_path"], sample_weights=weights,
+                               monitor=TrainingMonitor(**monitor_options) if monitor_options is not None else None)
+        save_checkpoint(trained, checkpoint_path(onnx_path), fingerprint, summary)
+    export_to_onnx(trained, input_size, device, onnx_path, config["dynamic_batch"])
+    if config["export_variants"]:
+        export_variants(trained, onnx_path, inputs, labels)
+
+
+def main():
+    run(default_config())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
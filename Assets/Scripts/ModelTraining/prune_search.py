@@ -0,0 +1,244 @@
+import json
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from data_cache import ensure_cache, stratified_split
+from trainer import evaluate, fit
+from bench_onnx import benchmark_model
+from warm_start import checkpoint_path, checkpoint_split, data_fingerprint, load_checkpoint
+import gesture_training
+
+# Latency/accuracy Pareto search over structurally pruned gesture models
+#
+# Each trained gesture model is turned into a plain Linear + ReLU network by folding its
+# BatchNorm layers into the preceding Linear layers (dropout is a no-op at inference). Whole
+# hidden units are then removed step by step, lowest importance first, with a short fine-tune
+# after every step. Every candidate is exported and timed with onnxruntime at batch size 1,
+# and the candidates that no other candidate beats on both latency and validation accuracy
+# are kept as ONNX files. Candidates are scored on the validation rows recorded in their source
+# model's checkpoint, which neither the source nor the fine-tunes train on; fine-tuning stops
+# early on a separate slice of the training rows.
+
+# Fraction of each source model's hidden units kept at every pruning step
+KEEP_RATIOS = [1.0, 0.75, 0.5, 0.35, 0.25, 0.15, 0.1]
+
+
+class PrunedNet(nn.Module):
+    """
+    Plain MLP of Linear layers with ReLU between them, the inference form of the gesture models.
+    """
+    def __init__(self, layer_sizes):
+        super(PrunedNet, self).__init__()
+        layers = []
+        for i in range(len(layer_sizes) - 1):
+            layers.append(nn.Linear(layer_sizes[i], layer_sizes[i + 1]))
+            if i < len(layer_sizes) - 2:
+                layers.append(nn.ReLU())
+        self.layers = nn.Sequential(*layers)
+
+    @property
+    def linears(self) -> list:
+        return [layer for layer in self.layers if isinstance(layer, nn.Linear)]
+
+    @property
+    def hidden_sizes(self) -> list:
+        return [layer.out_features for layer in self.linears[:-1]]
+
+    def forward(self, x):
+        return self.layers(x)
+
+
+# =============================================================================
+# Folding and Pruning
+# =============================================================================
+def fold_batch_norm(model: nn.Module) -> PrunedNet:
+    """
+    Converts a trained LowNet/MediumNet/HighNet into an equivalent PrunedNet (in eval mode) by
+    folding every BatchNorm into the Linear layer in front of it.
+    """
+    weights, biases = [], []
+    with torch.no_grad():
+        for module in model.children():
+            if isinstance(module, nn.Linear):
+                weights.append(module.weight.clone())
+                biases.append(module.bias.clone())
+            elif isinstance(module, nn.modules.batchnorm._BatchNorm):
+                scale = module.weight / torch.sqrt(module.running_var + module.eps)
+                weights[-1] = weights[-1] * scale[:, None]
+                biases[-1] = (biases[-1] - module.running_mean) * scale + module.bias
+
+        folded = PrunedNet([weights[0].shape[1]] + [w.shape[0] for w in weights])
+        for linear, weight, bias in zip(folded.linears, weights, biases):
+            linear.weight.copy_(weight)
+            linear.bias.copy_(bias)
+    return folded.eval()
+
+
+def unit_importance(model: PrunedNet, inputs: torch.Tensor) -> (list, list):
+    """
+    Per hidden layer, the importance of each unit (mean activation magnitude times the norm of
+    its outgoing weights) and its mean activation.
+    """
+    importances, means = [], []
+    linears = model.linears
+    with torch.no_grad():
+        x = inputs
+        for i, linear in enumerate(linears[:-1]):
+            x = torch.relu(linear(x))
+            mean = x.mean(dim=0)
+            importances.append(mean * linears[i + 1].weight.norm(dim=0))
+            means.append(mean)
+    return importances, means
+
+
+def prune_units(model: PrunedNet, widths, inputs: torch.Tensor) -> PrunedNet:
+    """
+    Returns a copy of the model with each hidden layer cut down to the given width, keeping the
+    most important units. The average contribution of removed units is folded into the next bias.
+    """
+    importances, means = unit_importance(model, inputs)
+    linears = model.linears
+    keep = [torch.sort(torch.topk(importance, min(width, importance.numel())).indices).values
+            for importance, width in zip(importances, widths)]
+
+    pruned = PrunedNet([linears[0].in_features] + [k.numel() for k in keep] + [linears[-1].out_features])
+    with torch.no_grad():
+        for i, (source, target) in enumerate(zip(linears, pruned.linears)):
+            weight, bias = source.weight, source.bias.clone()
+            if i > 0:
+                removed = torch.ones(weight.shape[1], dtype=torch.bool)
+                removed[keep[i - 1]] = False
+                bias += weight[:, removed] @ means[i - 1][removed]
+                weight = weight[:, keep[i - 1]]
+            if i < len(keep):
+                weight, bias = weight[keep[i]], bias[keep[i]]
+            target.weight.copy_(weight)
+            target.bias.copy_(bias)
+    return pruned
+
+
+# =============================================================================
+# Search
+# =============================================================================
+def pareto_front(candidates: list) -> list:
+    """
+    Candidates not beaten on both latency and accuracy by another one, fastest first.
+    """
+    front, best_accuracy = [], -1.0
+    for candidate in sorted(candidates, key=lambda c: (c["p50_us"], -c["val_accuracy"])):
+        if candidate["val_accuracy"] > best_accuracy:
+            front.append(candidate)
+            best_accuracy = candidate["val_accuracy"]
+    return front
+
+
+def fastest_meeting(candidates: list, target_accuracy: float):
+    passing = [c for c in candidates if c["val_accuracy"] >= target_accuracy]
+    return min(passing, key=lambda c: c["p50_us"]) if passing else None
+
+
+def _measure(model: PrunedNet, name: str, source: str, val_data, criterion, search_dir: str, runs: int) -> dict:
+    input_size = model.linears[0].in_features
+    onnx_path = os.path.join(search_dir, f"{name}.onnx")
+    gesture_training.export_to_onnx(model, input_size, torch.device('cpu'), onnx_path)
+    val_loss, val_correct = evaluate(model, *val_data, criterion)
+    timing = benchmark_model(onnx_path, val_data[0].numpy(), warmup=50, runs=runs)
+    return {
+        "name": name,
+        "source": source,
+        "hidden_sizes": model.hidden_sizes,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "val_loss": val_loss.item(),
+        "val_accuracy": val_correct.item() / val_data[1].shape[0],
+        "p50_us": timing["p50_us"],
+        "p95_us": timing["p95_us"],
+        "size_bytes": timing["size_bytes"],
+        "path": onnx_path
+    }
+
+
+def run_search(json_path: str, models_dir: str, search_dir: str, sources=("low", "medium", "high"),
+               base_model_name: str = "model_gestures", keep_ratios=KEEP_RATIOS, fine_tune_epochs: int = 20,
+               val_fraction: float = 0.2, runs: int = 500) -> list:
+    """
+    Prunes each trained source model through keep_ratios, fine-tuning after every step, and
+    writes the Pareto front to search_dir as ONNX files plus pareto.json. val_fraction splits
+    rows the source checkpoints haven't seen and sets aside the fine-tunes' early stopping rows.
+    """
+    ensure_cache(json_path)
+    os.makedirs(search_dir, exist_ok=True)
+    inputs, labels, input_size, num_classes = gesture_training.load_data(json_path)
+    fingerprint = data_fingerprint(json_path, "gestures")
+    criterion = nn.CrossEntropyLoss()
+
+    candidates = []
+    for source in sources:
+        path = checkpoint_path(os.path.join(models_dir, f"{base_model_name}_{source}.onnx"))
+        checkpoint = load_checkpoint(path)
+        if checkpoint is None:
+            print(f"No checkpoint at {path}, train the {source} model first")
+            continue
+        model = fold_batch_norm(gesture_training.load_teacher(path, input_size, num_classes))
+        # Held-out rows of this source, and training rows split again for the fine-tunes' early stopping
+        train_idx, val_idx, _ = checkpoint_split(checkpoint, json_path, fingerprint, labels.numpy(), val_fraction)
+        tune_idx, stop_idx = stratified_split(labels.numpy()[train_idx], val_fraction)
+        tune_idx, stop_idx, val_idx = (torch.from_numpy(idx)
+                                       for idx in (train_idx[tune_idx], train_idx[stop_idx], val_idx))
+        train_data, stop_data = (inputs[tune_idx], labels[tune_idx]), (inputs[stop_idx], labels[stop_idx])
+        val_data = (inputs[val_idx], labels[val_idx])
+        original = model.hidden_sizes
+        for ratio in keep_ratios:
+            widths = [max(2, int(round(width * ratio))) for width in original]
+            if widths != model.hidden_sizes:
+                model = prune_units(model, widths, train_data[0])
+                optimizer = optim.Adam(model.parameters(), lr=1e-3)
+                model, _ = fit(model, *train_data, criterion, optimizer, torch.device('cpu'), fine_tune_epochs,
+                               val_data=stop_data, patience=5, log_every=0)
+            name = f"{source}_" + "x".join(str(width) for width in model.hidden_sizes)
+            candidate = _measure(model.eval(), name, source, val_data, criterion, search_dir, runs)
+            candidates.append(candidate)
+            print(f"{name:<24} params={candidate['parameters']:<7} accuracy={100 * candidate['val_accuracy']:.2f}% "
+                  f"p50={candidate['p50_us']:.1f}us")
+
+    front = pareto_front(candidates)
+    front_names = {candidate["name"] for candidate in front}
+    for candidate in candidates:
+        candidate["pareto"] = candidate["name"] in front_names
+        if not candidate["pareto"]:
+            for path in (candidate["path"], candidate["path"] + ".data"):
+                if os.path.exists(path):
+                    os.remove(path)
+            candidate["path"] = None
+
+    with open(os.path.join(search_dir, "pareto.json"), 'w') as f:
+        json.dump({"candidates": candidates, "front": [candidate["name"] for candidate in front]}, f, indent=2)
+    print("Pareto front (fastest first):")
+    for candidate in front:
+        print(f"  {candidate['name']:<24} accuracy={100 * candidate['val_accuracy']:.2f}% "
+              f"p50={candidate['p50_us']:.1f}us -> {candidate['path']}")
+    return candidates
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    # Configurations
+    json_file = "PoseGestureData.json"
+    models_dir = "models"
+    search_dir = os.path.join(".sweeps", "prune")
+    target_accuracy = 0.95
+    fine_tune_epochs = 20
+
+    candidates = run_search(json_file, models_dir, search_dir, fine_tune_epochs=fine_tune_epochs)
+    choice = fastest_meeting(candidates, target_accuracy)
+    if choice is None:
+        print(f"No candidate reaches {100 * target_accuracy:.0f}% validation accuracy")
+    else:
+        print(f"Fastest model with at least {100 * target_accuracy:.0f}% accuracy: {choice['name']} "
+              f"({choice['p50_us']:.1f}us) -> {choice['path']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
+import gzip
+import json
+import os
+import shlex
 import shutil
 import subprocess
+from data_cache import file_sha256
 
 # Utility script to copy the data file from the HMD and copy it back to the HMD
+#
+# Transfers are incremental: the size and modification time of both copies are compared with
+# what was recorded at the last sync (.sync_state.json next to the local file), and content
+# hashes are only computed when those differ. Unchanged files are skipped, adb transfers are
+# gzip-compressed, and every copy is checked against the source hash before it replaces the
+# destination.
 
 pull = False
 push = True
@@ -13,26 +24,228 @@ link_location = r"C:\Users\Taha\AppData\LocalLow\DefaultCompany\VR Hand Tracking
 # Define the location where the data file is stored when using adb on the device
 adb_location = "/sdcard/Android/data/com.DefaultCompany.VRHandTrackingtest/files/PoseGestureData.json"
 
-def sync_data(pull, push, link, link_location=link_location, adb_location=adb_location):
+local_file = "PoseGestureData.json"
+state_file = ".sync_state.json"
+
+
+# =============================================================================
+# Transports
+# =============================================================================
+class LocalTransport:
+    """
+    Files reachable through the local filesystem: the Quest Link data folder, or any
+    directory standing in for the headset.
+    """
+    name = "Quest Link"
+
+    def stat(self, remote_path: str):
+        """
+        (size, mtime) of the remote file, or None when it doesn't exist.
+        """
+        try:
+            info = os.stat(remote_path)
+        except FileNotFoundError:
+            return None
+        return info.st_size, int(info.st_mtime)
+
+    def sha256(self, remote_path: str) -> str:
+        return file_sha256(remote_path)
+
+    def pull(self, remote_path: str, local_path: str):
+        shutil.copyfile(remote_path, local_path)
+
+    def push(self, local_path: str, remote_path: str):
+        staging_path = remote_path + ".tmp"
+        shutil.copyfile(local_path, staging_path)
+        os.replace(staging_path, remote_path)
+
+
+class AdbTransport:
+    """
+    Files on the headset over adb. Payloads are streamed through gzip on the device, falling
+    back to plain adb pull/push when the device has no gzip.
+    """
+    name = "adb"
+
+    def __init__(self, adb: str = "adb", serial: str = None, compress: bool = True):
+        self.command = [adb] + (["-s", serial] if serial else [])
+        self.compress = compress
+
+    def _shell(self, command: str) -> subprocess.CompletedProcess:
+        return subprocess.run(self.command + ["shell", command], capture_output=True, text=True)
+
+    def stat(self, remote_path: str):
+        result = self._shell(f"stat -c '%s %Y' {shlex.quote(remote_path)}")
+        if result.returncode != 0:
+            return None
+        size, mtime = result.stdout.split()
+        return int(size), int(mtime)
+
+    def sha256(self, remote_path: str) -> str:
+        result = self._shell(f"sha256sum {shlex.quote(remote_path)}")
+        if result.returncode != 0:
+            raise IOError(f"Could not hash {remote_path} on the device: {result.stderr.strip()}")
+        return result.stdout.split()[0]
+
+    def pull(self, remote_path: str, local_path: str):
+        if self.compress:
+            with subprocess.Popen(self.command + ["exec-out", f"gzip -c {shlex.quote(remote_path)}"],
+                                  stdout=subprocess.PIPE) as process:
+                try:
+                    with gzip.GzipFile(fileobj=process.stdout) as source, open(local_path, 'wb') as f:
+                        shutil.copyfileobj(source, f)
+                except (OSError, EOFError):
+                    process.kill()
+                else:
+                    if process.wait() == 0:
+                        return
+            print("Compressed pull failed, falling back to adb pull")
+        subprocess.run(self.command + ["pull", remote_path, local_path], check=True)
+
+    def push(self, local_path: str, remote_path: str):
+        staging_path = remote_path + ".tmp"
+        if self.compress:
+            compressed_path = local_path + ".gz"
+            with open(local_path, 'rb') as source, gzip.open(compressed_path, 'wb') as f:
+                shutil.copyfileobj(source, f)
+            try:
+                pushed = subprocess.run(self.command + ["push", compressed_path, staging_path + ".gz"]).returncode == 0 \
+                    and self._shell(f"gunzip -f {shlex.quote(staging_path + '.gz')}").returncode == 0
+            finally:
+                os.remove(compressed_path)
+            if not pushed:
+                print("Compressed push failed, falling back to adb push")
+                subprocess.run(self.command + ["push", local_path, staging_path], check=True)
+        else:
+            subprocess.run(self.command + ["push", local_path, staging_path], check=True)
+        result = self._shell(f"mv -f {shlex.quote(staging_path)} {shlex.quote(remote_path)}")
+        if result.returncode != 0:
+            raise IOError(f"Could not move {staging_path} into place: {result.stderr.strip()}")
+
+
+# =============================================================================
+# Sync State
+# =============================================================================
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_state(path: str, state: dict):
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def _local_stat(local_path: str):
+    try:
+        info = os.stat(local_path)
+    except FileNotFoundError:
+        return None
+    return info.st_size, info.st_mtime_ns
+
+
+def _record(state: dict, key: str, remote_stat, local_path: str, sha: str):
+    state[key] = {"remote": list(remote_stat), "local": list(_local_stat(local_path)), "sha256": sha}
+
+
+def _in_sync(transport, remote_path: str, local_path: str, entry) -> (bool, str):
+    """
+    Checks whether both copies hold the same content, hashing only when the recorded sizes and
+    modification times no longer match. Returns (in sync, local hash if it was computed).
+    """
+    remote_stat, local_stat = transport.stat(remote_path), _local_stat(local_path)
+    if remote_stat is None or local_stat is None:
+        return False, None
+    if entry and list(remote_stat) == entry["remote"] and list(local_stat) == entry["local"]:
+        return True, entry["sha256"]
+    if remote_stat[0] != local_stat[0]:
+        return False, None
+    local_sha = file_sha256(local_path)
+    return transport.sha256(remote_path) == local_sha, local_sha
+
+
+# =============================================================================
+# Sync
+# =============================================================================
+def pull_file(transport, remote_path: str, local_path: str, state_path: str = None) -> bool:
+    """
+    Copies the remote file over the local one unless they already match.
+    Returns True when a transfer happened.
+    """
+    state_path = state_path or os.path.join(os.path.dirname(os.path.abspath(local_path)), state_file)
+    state = _load_state(state_path)
+    key = f"{transport.name}:{remote_path}"
+    remote_stat = transport.stat(remote_path)
+    if remote_stat is None:
+        raise FileNotFoundError(f"{remote_path} not found via {transport.name}")
+
+    in_sync, sha = _in_sync(transport, remote_path, local_path, state.get(key))
+    if not in_sync:
+        remote_sha = transport.sha256(remote_path)
+        staging_path = local_path + ".part"
+        try:
+            transport.pull(remote_path, staging_path)
+            sha = file_sha256(staging_path)
+            if sha != remote_sha:
+                raise IOError(f"Integrity check failed pulling {remote_path}: {sha} != {remote_sha}")
+            os.replace(staging_path, local_path)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+    _record(state, key, remote_stat if in_sync else transport.stat(remote_path), local_path, sha)
+    _save_state(state_path, state)
+    return not in_sync
+
+
+def push_file(transport, local_path: str, remote_path: str, state_path: str = None) -> bool:
+    """
+    Copies the local file over the remote one unless they already match.
+    Returns True when a transfer happened.
+    """
+    state_path = state_path or os.path.join(os.path.dirname(os.path.abspath(local_path)), state_file)
+    state = _load_state(state_path)
+    key = f"{transport.name}:{remote_path}"
+
+    in_sync, sha = _in_sync(transport, remote_path, local_path, state.get(key))
+    if not in_sync:
+        sha = sha or file_sha256(local_path)
+        transport.push(local_path, remote_path)
+        remote_sha = transport.sha256(remote_path)
+        if remote_sha != sha:
+            raise IOError(f"Integrity check failed pushing to {remote_path}: {remote_sha} != {sha}")
+    _record(state, key, transport.stat(remote_path), local_path, sha)
+    _save_state(state_path, state)
+    return not in_sync
+
+
+def sync_data(pull, push, link, link_location=link_location, adb_location=adb_location, transport=None,
+              local_path=local_file):
     """
     pull: bool whether to pull the file from the HMD/Quest Link
     push: bool whether to push the file back to the HMD/Quest Link
     link: bool True for Quest Link (PC path), False for adb (device path)
+    transport: optional transport overriding the one chosen by link (e.g. a LocalTransport for a test directory)
+    Unchanged files are skipped.
     """
-    if link:
-        if pull:
-            print("Pulling file from HMD via Quest Link")
-            shutil.copy(link_location, "PoseGestureData.json")
-        if push:
-            print("Pushing file to HMD via Quest Link")
-            shutil.copy("PoseGestureData.json", link_location)
-    else:
-        if pull:
-            print("Pulling file from HMD via adb")
-            subprocess.run(["adb", "pull", adb_location])
-        if push:
-            print("Pushing file to HMD via adb")
-            subprocess.run(["adb", "push", "PoseGestureData.json", adb_location])
+    if transport is None:
+        transport = LocalTransport() if link else AdbTransport()
+    remote_path = link_location if link else adb_location
+    if pull:
+        print(f"Pulling file from HMD via {transport.name}")
+        try:
+            if not pull_file(transport, remote_path, local_path):
+                print("Local copy already up to date")
+        except FileNotFoundError:
+            if not os.path.exists(local_path):
+                raise
+            print(f"{remote_path} not found via {transport.name}, using the existing local copy")
+    if push:
+        print(f"Pushing file to HMD via {transport.name}")
+        if not push_file(transport, local_path, remote_path):
+            print("HMD copy already up to date")
 
 # call the function
 
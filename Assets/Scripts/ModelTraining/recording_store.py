@@ -0,0 +1,468 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from data_cache import SECTIONS, stream_parse
+
+# Append-only, chunked store of the pose and gesture recordings
+#
+# PoseGestureData.json has to be rewritten completely for every new recording. The store keeps the
+# same data (sections -> classes -> poseGestureIndex and sample rows) in a directory instead:
+#
+#   store.json              format version, sample dtype and per section the input size and classes
+#                           (stable id, name, poseGestureIndex, first index record still in use)
+#   index.bin               one fixed size record (section, class id, chunk, row offset, row count)
+#                           per append
+#   <section>_<chunk>.bin   raw row-major samples, a new chunk is started once it reaches CHUNK_BYTES
+#
+# Appending writes the new rows to the end of the current chunk and adds one index record, so it
+# costs O(new data). Replacing (retraining) or deleting a class only rewrites the small store.json,
+# the old rows stay on disk until compact() rewrites the store. Rows are read back as memory-mapped
+# slices of the chunks. json_to_store and store_to_json convert to and from the JSON schema.
+
+STORE_VERSION = 1
+CHUNK_BYTES = 16 << 20
+
+INDEX_DTYPE = np.dtype([
+    ("section", "<u1"),
+    ("class_id", "<i4"),
+    ("chunk", "<i4"),
+    ("offset", "<i8"),
+    ("count", "<i8")
+])
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class RecordingStore:
+    """
+    Opens the store at path, creating an empty one with the given sample dtype if it does not exist.
+    The dtype of an existing store is read from its store.json.
+    """
+    def __init__(self, path: str, dtype="float32"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, "store.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get("version") != STORE_VERSION:
+                raise ValueError(f"{path}: unsupported store version {self.manifest.get('version')}")
+        else:
+            self.manifest = {
+                "version": STORE_VERSION,
+                "dtype": np.dtype(dtype).name,
+                "next_id": 0,
+                "sections": {section: {"input_size": None, "classes": []} for section in SECTIONS}
+            }
+            self._save_manifest()
+        self.dtype = np.dtype(self.manifest["dtype"])
+        self._maps = {}
+        self._load_index()
+
+    # =========================================================================
+    # Index
+    # =========================================================================
+    def _load_index(self):
+        index_path = os.path.join(self.path, "index.bin")
+        size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        if size % INDEX_DTYPE.itemsize:
+            # Torn final record of an interrupted append, its rows were never referenced
+            size -= size % INDEX_DTYPE.itemsize
+            with open(index_path, 'r+b') as f:
+                f.truncate(size)
+        records = np.fromfile(index_path, dtype=INDEX_DTYPE) if size else np.empty(0, dtype=INDEX_DTYPE)
+        self._records = np.empty(max(64, 2 * records.shape[0]), dtype=INDEX_DTYPE)
+        self._records[:records.shape[0]] = records
+        self.num_records = records.shape[0]
+
+        # Current chunk of each section and the number of rows in use at its end
+        self._tails = {}
+        for section_id in range(len(SECTIONS)):
+            mine = records[records["section"] == section_id]
+            if mine.shape[0] == 0:
+                self._tails[section_id] = (0, 0)
+                continue
+            chunk = int(mine["chunk"].max())
+            last = mine[mine["chunk"] == chunk]
+            self._tails[section_id] = (chunk, int((last["offset"] + last["count"]).max()))
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._records[:self.num_records]
+
+    def _append_record(self, record: tuple):
+        if self.num_records == self._records.shape[0]:
+            grown = np.empty(2 * self._records.shape[0], dtype=INDEX_DTYPE)
+            grown[:self.num_records] = self.records
+            self._records = grown
+        self._records[self.num_records] = record
+        with open(os.path.join(self.path, "index.bin"), 'ab') as f:
+            f.write(self._records[self.num_records:self.num_records + 1].tobytes())
+        self.num_records += 1
+
+    def _save_manifest(self):
+        _write_json(os.path.join(self.path, "store.json"), self.manifest)
+
+    def _chunk_path(self, section: str, chunk: int) -> str:
+        return os.path.join(self.path, f"{section}_{chunk:04d}.bin")
+
+    # =========================================================================
+    # Classes
+    # =========================================================================
+    def _section(self, section: str) -> dict:
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown section {section!r}, expected one of {SECTIONS}")
+        return self.manifest["sections"][section]
+
+    def _find(self, section: str, name: str):
+        for entry in self._section(section)["classes"]:
+            if entry["name"] == name:
+                return entry
+        return None
+
+    def add_class(self, section: str, name: str, index: int = None) -> dict:
+        """
+        Registers an empty class. Without an index it gets the lowest poseGestureIndex not in use,
+        as DataInterface does for new poses and gestures.
+        """
+        if self._find(section, name) is not None:
+            raise ValueError(f"{section} class {name!r} already exists")
+        classes = self._section(section)["classes"]
+        if index is None:
+            used = {entry["index"] for entry in classes}
+            index = next(i for i in range(len(classes) + 1) if i not in used)
+        entry = {"id": self.manifest["next_id"], "name": name, "index": int(index), "first_record": self.num_records}
+        self.manifest["next_id"] += 1
+        classes.append(entry)
+        self._save_manifest()
+        return entry
+
+    def delete_class(self, section: str, name: str):
+        """
+        Removes a class. Like DataInterface.deletePose, the class with the highest index takes over
+        the index of the removed one so the indices stay contiguous.
+        """
+        entry = self._find(section, name)
+        if entry is None:
+            return
+        classes = self._section(section)["classes"]
+        classes.remove(entry)
+        if classes:
+            highest = max(classes, key=lambda c: c["index"])
+            if highest["index"] > entry["index"]:
+                highest["index"] = entry["index"]
+        self._save_manifest()
+
+    def clear_section(self, section: str):
+        """
+        Removes every class of a section and forgets its input size, e.g. before writing rows of
+        a new feature set. Later appends start a new chunk since the row size may change.
+        """
+        info = self._section(section)
+        info["classes"], info["input_size"] = [], None
+        section_id = SECTIONS.index(section)
+        chunk, end = self._tails[section_id]
+        if end:
+            self._tails[section_id] = (chunk + 1, 0)
+        self._maps = {key: rows for key, rows in self._maps.items() if key[0] != section}
+        self._save_manifest()
+
+    def class_names(self, section: str) -> list:
+        return [entry["name"] for entry in self._section(section)["classes"]]
+
+    # =========================================================================
+    # Writing
+    # =========================================================================
+    def _prepare_rows(self, section: str, rows) -> np.ndarray:
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        info = self._section(section)
+        if info["input_size"] is None and rows.shape[0]:
+            info["input_size"] = int(rows.shape[1])
+            self._save_manifest()
+        elif rows.shape[0] and rows.shape[1] != info["input_size"]:
+            raise ValueError(f"Inconsistent {section} feature size: expected {info['input_size']}, got {rows.shape[1]}")
+        return rows
+
+    def _write_rows(self, section: str, class_id: int, rows: np.ndarray):
+        section_id = SECTIONS.index(section)
+        row_bytes = rows.shape[1] * self.dtype.itemsize
+        chunk, end = self._tails[section_id]
+        if end and (end + rows.shape[0]) * row_bytes > CHUNK_BYTES:
+            chunk, end = chunk + 1, 0
+        path = self._chunk_path(section, chunk)
+        # Rows past the indexed end are left over from an interrupted append and get overwritten
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(end * row_bytes)
+            f.write(rows.tobytes())
+        self._append_record((section_id, class_id, chunk, end, rows.shape[0]))
+        self._tails[section_id] = (chunk, end + rows.shape[0])
+
+    def append(self, section: str, name: str, rows):
+        """
+        Adds samples to a class, creating the class if it is new. Costs O(len(rows)).
+        """
+        rows = self._prepare_rows(section, rows)
+        entry = self._find(section, name) or self.add_class(section, name)
+        if rows.shape[0]:
+            self._write_rows(section, entry["id"], rows)
+
+    def replace(self, section: str, name: str, rows):
+        """
+        Replaces all samples of a class (DataInterface.retrainPose/retrainGesture).
+        The new rows are indexed before the old ones are dropped, so an interrupted replace
+        never loses the class' data.
+        """
+        rows = self._prepare_rows(section, rows)
+        entry = self._find(section, name)
+        if entry is None:
+            self.append(section, name, rows)
+            return
+        first_record = self.num_records
+        if rows.shape[0]:
+            self._write_rows(section, entry["id"], rows)
+        entry["first_record"] = first_record
+        self._save_manifest()
+
+    # =========================================================================
+    # Reading
+    # =========================================================================
+    def _class_records(self, section: str, entry: dict) -> np.ndarray:
+        records = self.records[entry["first_record"]:]
+        return records[(records["section"] == SECTIONS.index(section)) & (records["class_id"] == entry["id"])]
+
+    def _rows(self, section: str, record) -> np.ndarray:
+        input_size = self._section(section)["input_size"]
+        chunk, end = int(record["chunk"]), int(record["offset"] + record["count"])
+        rows = self._maps.get((section, chunk))
+        if rows is None or rows.shape[0] < end:
+            path = self._chunk_path(section, chunk)
+            num_rows = os.path.getsize(path) // (input_size * self.dtype.itemsize)
+            rows = np.memmap(path, dtype=self.dtype, mode='r', shape=(num_rows, input_size))
+            self._maps[(section, chunk)] = rows
+        return rows[int(record["offset"]):end]
+
+    def iter_rows(self, section: str, names=None):
+        """
+        Streams (name, index, rows) of every append, class by class, with rows a read-only
+        memory-mapped slice of its chunk. names restricts the classes read.
+        """
+        for entry in self._section(section)["classes"]:
+            if names is not None and entry["name"] not in names:
+                continue
+            for record in self._class_records(section, entry):
+                yield entry["name"], entry["index"], self._rows(section, record)
+
+    def class_rows(self, section: str, name: str) -> np.ndarray:
+        """
+        All samples of one class as a [count, input_size] array.
+        """
+        entry = self._find(section, name)
+        if entry is None:
+            raise KeyError(f"No {section} class {name!r}")
+        parts = [self._rows(section, record) for record in self._class_records(section, entry)]
+        if len(parts) == 1:
+            return parts[0]
+        input_size = self._section(section)["input_size"] or 0
+        return np.concatenate(parts) if parts else np.empty((0, input_size), dtype=self.dtype)
+
+    def classes(self, section: str) -> list:
+        """
+        [{"name", "index", "count"}] of a section in insertion order.
+        """
+        return [{"name": entry["name"], "index": entry["index"],
+                 "count": int(self._class_records(section, entry)["count"].sum())}
+                for entry in self._section(section)["classes"]]
+
+    def load_section(self, section: str):
+        """
+        Returns (inputs, labels, section_meta) of a section in the layout of data_cache.load_section,
+        with the classes in insertion order.
+        """
+        classes = self.classes(section)
+        input_size = self._section(section)["input_size"] or 0
+        num_samples = sum(entry["count"] for entry in classes)
+        inputs = np.empty((num_samples, input_size), dtype=self.dtype)
+        labels = np.empty(num_samples, dtype=np.int64)
+        start = 0
+        for entry in classes:
+            entry["start"] = start
+            for _, index, rows in self.iter_rows(section, (entry["name"],)):
+                inputs[start:start + rows.shape[0]] = rows
+                labels[start:start + rows.shape[0]] = index
+                start += rows.shape[0]
+        section_meta = {"num_samples": num_samples, "input_size": input_size, "classes": classes}
+        return inputs, labels, section_meta
+
+    def live_rows(self) -> int:
+        return sum(entry["count"] for section in SECTIONS for entry in self.classes(section))
+
+    def stored_rows(self) -> int:
+        return int(self.records["count"].sum())
+
+
+# =============================================================================
+# Maintenance and Conversion
+# =============================================================================
+def _copy_into(target: RecordingStore, source: RecordingStore):
+    for section in SECTIONS:
+        for entry in source.classes(section):
+            target.add_class(section, entry["name"], entry["index"])
+            rows = source.class_rows(section, entry["name"])
+            if rows.shape[0]:
+                target.append(section, entry["name"], rows)
+
+
+def _swap_in(staging: str, path: str):
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+
+
+def compact(store_path: str) -> RecordingStore:
+    """
+    Rewrites the store keeping only the rows still in use, one contiguous run per class.
+    """
+    source = RecordingStore(store_path)
+    staging = store_path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    _copy_into(RecordingStore(staging, source.dtype), source)
+    source._maps.clear()
+    _swap_in(staging, store_path)
+    return RecordingStore(store_path)
+
+
+def json_to_store(json_path: str, store_path: str, dtype="float64") -> RecordingStore:
+    """
+    Converts PoseGestureData.json into a new store, replacing any existing one. Class order,
+    names, poseGestureIndex and sample order are kept. float64 keeps every value of a JSON written
+    from doubles exactly, so converting back reproduces the file; float32 halves the size and
+    matches the floats the headset records, with a warning when that loses precision.
+    """
+    staging = store_path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    store = RecordingStore(staging, dtype)
+    lossy = 0
+    for section, (inputs, _, classes) in stream_parse(json_path, np.float64).items():
+        for entry in classes:
+            store.add_class(section, entry["name"], entry["index"])
+            if entry["count"]:
+                rows = inputs[entry["start"]:entry["start"] + entry["count"]]
+                if store.dtype != np.float64:
+                    lossy += int(np.count_nonzero(rows.astype(store.dtype).astype(np.float64) != rows))
+                store.append(section, entry["name"], rows)
+    if lossy:
+        print(f"Warning: {lossy} values of {json_path} don't fit {store.dtype.name}, "
+              f"converting the store back won't reproduce the file (use float64)")
+    _swap_in(staging, store_path)
+    return RecordingStore(store_path)
+
+
+def _format_rows(rows: np.ndarray) -> str:
+    # str() of a numpy float32 is its shortest round-trip form, float64 rows go through Python floats
+    if rows.dtype == np.float64:
+        return ", ".join("[" + ", ".join(map(repr, row)) + "]" for row in rows.tolist())
+    return ", ".join("[" + ", ".join(map(str, row)) + "]" for row in rows)
+
+
+def store_to_json(store_path: str, json_path: str):
+    """
+    Writes the store in the PoseGestureData.json schema, streaming one append at a time.
+    """
+    store = RecordingStore(store_path)
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("{")
+        for i, section in enumerate(SECTIONS):
+            f.write(f'{", " if i else ""}{json.dumps(section)}: {{')
+            for j, entry in enumerate(store.classes(section)):
+                f.write(f'{", " if j else ""}{json.dumps(entry["name"])}: '
+                        f'{{"poseGestureIndex": {entry["index"]}, "poseGestureData": [')
+                written = False
+                for _, _, rows in store.iter_rows(section, (entry["name"],)):
+                    f.write((", " if written else "") + _format_rows(rows))
+                    written = True
+                f.write("]}")
+            f.write("}")
+        f.write("}")
+    os.replace(tmp_path, json_path)
+
+
+def write_sections(sections: dict, output_path: str, source_path: str = None):
+    """
+    Writes {section: {class name: (poseGestureIndex, rows)}} to a recording store directory or a
+    .json data file, replacing those sections. The other sections are copied from source_path
+    (a .json file or store, by default output_path itself).
+    """
+    source_path = source_path or output_path
+    is_json = output_path.endswith(".json")
+    scratch = tempfile.mkdtemp() if is_json else None
+    try:
+        store_path = os.path.join(scratch, "store") if is_json else output_path
+        if source_path.endswith(".json") and os.path.exists(source_path):
+            # Round trip through a float64 store so the sections not replaced are written back unchanged
+            store = json_to_store(source_path, store_path, "float64")
+        else:
+            if os.path.isdir(source_path) and os.path.abspath(source_path) != os.path.abspath(store_path):
+                shutil.rmtree(store_path, ignore_errors=True)
+                shutil.copytree(source_path, store_path)
+            store = RecordingStore(store_path, "float64" if is_json else "float32")
+        for section, classes in sections.items():
+            store.clear_section(section)
+            for name, (index, rows) in classes.items():
+                store.add_class(section, name, index)
+                store.append(section, name, rows)
+        if is_json:
+            store_to_json(store.path, output_path)
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def print_info(store: RecordingStore):
+    print(f"{store.path}: {store.dtype.name} samples, {store.num_records} appends, "
+          f"{store.live_rows()} of {store.stored_rows()} stored rows in use")
+    for section in SECTIONS:
+        print(f"  {section} (input size {store.manifest['sections'][section]['input_size']}):")
+        for entry in store.classes(section):
+            print(f"    {entry['index']:>3} {entry['name']:<16} {entry['count']:>7} samples")
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Convert and inspect append-only recording stores")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_store = commands.add_parser("to-store", help="Convert PoseGestureData.json into a store")
+    to_store.add_argument("json_file")
+    to_store.add_argument("store")
+    to_store.add_argument("--dtype", choices=["float32", "float64"], default="float64",
+                          help="float64 round-trips the JSON exactly")
+    to_json = commands.add_parser("to-json", help="Write a store as PoseGestureData.json")
+    to_json.add_argument("store")
+    to_json.add_argument("json_file")
+    commands.add_parser("info", help="List the classes of a store").add_argument("store")
+    commands.add_parser("compact", help="Drop replaced and deleted rows").add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "to-store":
+        print_info(json_to_store(args.json_file, args.store, args.dtype))
+    elif args.command == "to-json":
+        store_to_json(args.store, args.json_file)
+        print(f"Wrote {args.json_file}")
+    elif args.command == "info":
+        print_info(RecordingStore(args.store))
+    else:
+        print_info(compact(args.store))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from data_cache import ensure_cache, load_section
+from trainer import evaluate, split_tensors, train_model
+import gesture_training
+import pose_training
+
+# Hyperparameter sweep with asynchronous successive halving (ASHA)
+#
+# Trials sample a learning rate, optimizer, batch size and hidden widths. Every trial starts
+# with a small epoch budget; only the best 1/eta of the trials finishing a rung are promoted
+# to train further. Each finished rung is appended to a results file and checkpointed,
+# so an interrupted sweep resumes where it stopped.
+
+# Architecture name -> (data section, model class, hidden width choices)
+ARCHITECTURES = {
+    "low": ("gestures", gesture_training.LowNet, [(32,), (64,), (128,), (256,)]),
+    "medium": ("gestures", gesture_training.MediumNet, [(128, 64), (256, 128), (512, 256)]),
+    "high": ("gestures", gesture_training.HighNet, [(256, 128, 64), (512, 256, 128), (1024, 512, 256)]),
+    "pose": ("poses", pose_training.Net, [(32, 16), (64, 32), (128, 64), (256, 128)])
+}
+
+SEARCH_SPACE = {
+    "lr": (1e-4, 1e-1),  # sampled log-uniformly
+    "optimizer": ["sgd", "momentum", "adam", "adamw"],
+    "batch_size": [16, 32, 64, 128]
+}
+
+
+# =============================================================================
+# Configuration Sampling
+# =============================================================================
+def sample_config(arch: str, trial_id: int, seed: int = 0) -> dict:
+    """
+    Samples the configuration of a trial. Seeded by the trial id so a resumed sweep
+    regenerates exactly the same configurations.
+    """
+    rng = np.random.default_rng([seed, trial_id])
+    low, high = SEARCH_SPACE["lr"]
+    hidden_choices = ARCHITECTURES[arch][2]
+    return {
+        "lr": float(math.exp(rng.uniform(math.log(low), math.log(high)))),
+        "optimizer": str(rng.choice(SEARCH_SPACE["optimizer"])),
+        "batch_size": int(rng.choice(SEARCH_SPACE["batch_size"])),
+        "hidden_sizes": list(hidden_choices[rng.integers(len(hidden_choices))])
+    }
+
+
+def rung_budgets(min_epochs: int, max_epochs: int, eta: int) -> list:
+    """
+    Epoch budget of each rung: min_epochs * eta^k, capped with a final rung at max_epochs.
+    """
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+
+def build_optimizer(name: str, parameters, lr: float):
+    if name == "sgd":
+        return optim.SGD(parameters, lr=lr)
+    if name == "momentum":
+        return optim.SGD(parameters, lr=lr, momentum=0.9)
+    if name == "adam":
+        return optim.Adam(parameters, lr=lr)
+    if name == "adamw":
+        return optim.AdamW(parameters, lr=lr)
+    raise ValueError(f"Unknown optimizer {name!r}")
+
+
+# =============================================================================
+# Trial Execution (runs in worker processes)
+# =============================================================================
+def _init_worker(num_threads: int):
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _run_trial(arch: str, trial_id: int, config: dict, json_path: str, target_epochs: int,
+               checkpoint_path: str, val_fraction: float, seed: int) -> dict:
+    """
+    Trains a trial up to target_epochs, continuing from its checkpoint if it has one,
+    and returns its validation loss and accuracy.
+    """
+    start = time.perf_counter()
+    section, model_class, _ = ARCHITECTURES[arch]
+    inputs, labels, _ = load_section(json_path, section)
+    inputs, labels = torch.from_numpy(inputs), torch.from_numpy(labels)
+    (train_inputs, train_labels), (val_inputs, val_labels) = split_tensors(inputs, labels, val_fraction, seed)
+    num_classes = int(labels.max()) + 1
+
+    torch.manual_seed(seed + trial_id)
+    model = model_class(inputs.shape[1], num_classes, tuple(config["hidden_sizes"]))
+    optimizer = build_optimizer(config["optimizer"], model.parameters(), config["lr"])
+    epochs_done = 0
+    if os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        epochs_done = checkpoint["epochs"]
+
+    criterion = nn.CrossEntropyLoss()
+    model = train_model(model, train_inputs, train_labels, criterion, optimizer, torch.device('cpu'),
+                        target_epochs - epochs_done, config["batch_size"], log_every=0)
+
+    val_loss, val_correct = evaluate(model, val_inputs, val_labels, criterion)
+    val_loss, val_acc = val_loss.item(), val_correct.item() / val_labels.shape[0]
+
+    torch.save({"model": model.state_dict(), "optimizer": optimizer.state_dict(), "epochs": target_epochs},
+               checkpoint_path)
+    return {
+        "trial": trial_id,
+        "config": config,
+        "epochs": target_epochs,
+        "val_loss": val_loss,
+        "val_acc": val_acc,
+        "seconds": time.perf_counter() - start
+    }
+
+
+# =============================================================================
+# ASHA Scheduler
+# =============================================================================
+class AshaScheduler:
+    """
+    Asynchronous successive halving: a trial finishing rung k is promoted to rung k+1
+    as soon as it ranks in the top 1/eta of all trials that have finished rung k so far.
+    New trials are only started when no promotion is available.
+    """
+    def __init__(self, num_trials: int, budgets: list, eta: int):
+        self.num_trials = num_trials
+        self.budgets = budgets
+        self.eta = eta
+        self.results = [dict() for _ in budgets]  # rung -> {trial: record}
+        self.promoted = [set() for _ in budgets]
+        self.started = set()
+
+    def record(self, rung: int, result: dict):
+        self.results[rung][result["trial"]] = result
+        if rung > 0:
+            self.promoted[rung - 1].add(result["trial"])
+        self.started.add(result["trial"])
+
+    def next_job(self, running: set):
+        """
+        Returns (trial_id, rung) for the next job, or None if nothing can be scheduled right now.
+        """
+        for rung in reversed(range(len(self.budgets) - 1)):
+            finished = sorted(self.results[rung].values(), key=lambda r: r["val_loss"])
+            for result in finished[:len(finished) // self.eta]:
+                trial = result["trial"]
+                if trial not in self.promoted[rung] and trial not in running:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+        # Trials interrupted before finishing rung 0 are restarted here as well
+        for trial in range(self.num_trials):
+            if trial not in self.started:
+                self.started.add(trial)
+                return trial, 0
+        return None
+
+    def best(self):
+        for rung in reversed(range(len(self.budgets))):
+            if self.results[rung]:
+                return min(self.results[rung].values(), key=lambda r: r["val_loss"])
+        return None
+
+
+def _load_results(results_path: str) -> list:
+    if not os.path.exists(results_path):
+        return []
+    records = []
+    with open(results_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def run_sweep(arch: str, json_path: str, sweep_dir: str, num_trials: int = 27, min_epochs: int = 8,
+              max_epochs: int = 200, eta: int = 3, max_workers: int = None, val_fraction: float = 0.2,
+              seed: int = 0) -> dict:
+    """
+    Runs (or resumes) an ASHA sweep for one architecture and returns the best result.
+    Results are appended to <sweep_dir>/results.jsonl, checkpoints are kept in <sweep_dir>/checkpoints.
+    """
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {arch!r}, expected one of {list(ARCHITECTURES)}")
+    ensure_cache(json_path)
+    checkpoint_dir = os.path.join(sweep_dir, "checkpoints")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    results_path = os.path.join(sweep_dir, "results.jsonl")
+
+    budgets = rung_budgets(min_epochs, max_epochs, eta)
+    scheduler = AshaScheduler(num_trials, budgets, eta)
+    previous = _load_results(results_path)
+    for record in previous:
+        if record["arch"] == arch and record["rung"] < len(budgets):
+            scheduler.record(record["rung"], record)
+    if previous:
+        print(f"Resuming sweep with {len(previous)} finished rungs from {results_path}")
+
+    cpu_count = os.cpu_count() or 1
+    num_workers = max(1, min(max_workers or cpu_count, cpu_count))
+    threads_per_worker = max(1, cpu_count // num_workers)
+    print(f"Sweeping {arch}: {num_trials} trials, rungs {budgets}, {num_workers} workers")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(threads_per_worker,)) as pool, \
+            open(results_path, 'a') as results_file:
+        running = {}
+        while True:
+            while len(running) < num_workers:
+                job = scheduler.next_job({trial for trial, _ in running.values()})
+                if job is None:
+                    break
+                trial, rung = job
+                config = sample_config(arch, trial, seed)
+                checkpoint_path = os.path.join(checkpoint_dir, f"{arch}_trial_{trial}.pt")
+                future = pool.submit(_run_trial, arch, trial, config, json_path, budgets[rung],
+                                     checkpoint_path, val_fraction, seed)
+                running[future] = (trial, rung)
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial, rung = running.pop(future)
+                result = future.result()
+                result.update({"arch": arch, "rung": rung})
+                scheduler.record(rung, result)
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+                print(f"Trial {trial} rung {rung} ({result['epochs']} epochs): "
+                      f"val_loss={result['val_loss']:.4f} val_acc={100 * result['val_acc']:.2f}%")
+
+    best = scheduler.best()
+    with open(os.path.join(sweep_dir, "best.json"), 'w') as f:
+        json.dump(best, f, indent=2)
+    print(f"Best {arch} trial {best['trial']}: {best['config']} "
+          f"val_acc={100 * best['val_acc']:.2f}% after {best['epochs']} epochs")
+    return best
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    # Configurations
+    json_file = "PoseGestureData.json"
+    architectures = ["low", "medium", "high", "pose"]
+    num_trials = 27
+    min_epochs = 8
+    max_epochs = 200
+    eta = 3
+
+    for arch in architectures:
+        run_sweep(arch, json_file, os.path.join(".sweeps", arch), num_trials, min_epochs, max_epochs, eta)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import argparse
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from onnx_export import embed_weights
+
+# Causal temporal gesture model with a stateful streaming export
+#
+# The MLP gesture models see the flattened HandBuffer window [T*3] and GestureDetector re-runs
+# them on the whole window every tick. TemporalNet reads the same rows as a sequence of T points,
+# takes the frame-to-frame deltas (so the translation to the first point drops out) and runs a
+# stack of causal dilated 1-D convolutions over them, classifying from the last time step. Its
+# receptive field is kept within the window, so the last output only depends on frames inside it.
+#
+# The recorded rows are scaled by their window's bounding width, which a stream can't know frame
+# by frame. TemporalNet is made invariant to the scale of its input instead: the convolutions have
+# no biases, so the stack scales linearly with the deltas (ReLU(c*x) = c*ReLU(x) for c > 0), and
+# the last output is divided by the RMS delta over the receptive field. On the headset each frame's
+# input is then its raw delta rotated by the head pose at that frame (gesture_preprocessing.
+# frame_deltas), in any fixed unit; for a still head that is the recorded rows' delta up to scale.
+#
+# For the headset the model is also exported as a stateful graph: each call takes one frame delta
+# and the carried state (the last squared delta norms and the last inputs of every convolution) and
+# returns the logits and the next state. Once the stream has seen a full window, its output equals
+# the full-window evaluation of the last T frames. check_streaming verifies this offline on raw,
+# HandBuffer-style position and head rotation streams against both the full-window model and the
+# recorder's preprocessing (python temporal_model.py or cli.py check-streaming), failing above a
+# stated tolerance. At the shipped window (T = 30 at 10 fps) a step isn't cheaper than a full
+# window in onnxruntime, both are a few dozen tiny ops dominated by per-op overhead; the stream
+# saves the per-tick window preprocessing and its cost doesn't grow with the window.
+
+# Added to the mean squared delta before the square root, negligible next to any real movement
+_SCALE_EPS = 1e-12
+# Scale-normalised deltas have an RMS norm of 1, recorded windows scaled by T-1 had about 5, which
+# is where the same SGD settings as the MLPs train it
+_FEATURE_GAIN = 5.0
+
+
+def receptive_field(kernel_size: int, dilations) -> int:
+    """
+    Number of consecutive deltas the last output depends on.
+    """
+    return 1 + (kernel_size - 1) * sum(dilations)
+
+
+class TemporalNet(nn.Module):
+    """
+    A temporal model: causal dilated convolutions with residual connections over the frame deltas,
+    invariant to the scale of the input. Dilations that would look further back than the window
+    are dropped.
+    """
+    def __init__(self, input_size: int, num_classes: int, channels: int = 32, kernel_size: int = 3,
+                 dilations=(1, 2, 4, 7)):
+        super(TemporalNet, self).__init__()
+        if input_size % 3:
+            raise ValueError(f"Expected flattened 3D points, got input size {input_size}")
+        self.window = input_size // 3
+        dilations = list(dilations)
+        while len(dilations) > 1 and receptive_field(kernel_size, dilations) > self.window - 1:
+            dilations.pop()
+        self.kernel_size = kernel_size
+        self.dilations = tuple(dilations)
+        self.receptive_field = receptive_field(kernel_size, self.dilations)
+        # No biases, so the stack is positively homogeneous in its input
+        self.convs = nn.ModuleList([
+            nn.Conv1d(3 if i == 0 else channels, channels, kernel_size, dilation=dilation, bias=False)
+            for i, dilation in enumerate(self.dilations)
+        ])
+        self.act = nn.ReLU()
+        self.fc = nn.Linear(channels, num_classes)
+
+    def _history(self, dilation: int) -> int:
+        return (self.kernel_size - 1) * dilation
+
+    def classify(self, features, squared_norms):
+        """
+        Logits from the last convolution output [N, C] and the squared norms of the deltas in the
+        receptive field [N, receptive_field].
+        """
+        return self.fc(features * (_FEATURE_GAIN / torch.sqrt(squared_norms.mean(dim=1, keepdim=True) + _SCALE_EPS)))
+
+    def forward_deltas(self, deltas):
+        """
+        Logits for frame deltas [N, 3, L] (L >= receptive_field), as the streaming step sees them.
+        """
+        h = deltas
+        for i, (conv, dilation) in enumerate(zip(self.convs, self.dilations)):
+            y = self.act(conv(F.pad(h, (self._history(dilation), 0))))
+            h = y if i == 0 else h + y
+        return self.classify(h[:, :, -1], (deltas[:, :, -self.receptive_field:] ** 2).sum(dim=1))
+
+    def forward(self, x):
+        # [N, T*3] -> deltas [N, 3, T-1]
+        points = x.reshape(x.shape[0], -1, 3).transpose(1, 2)
+        return self.forward_deltas(points[:, :, 1:] - points[:, :, :-1])
+
+
+class StreamingTemporalNet(nn.Module):
+    """
+    One-frame step of a TemporalNet: (frame delta [N, 3], state [N, state_size]) -> (logits, next state).
+    The state is flat: the squared norms of the previous receptive_field - 1 deltas followed by
+    each convolution's input history.
+    """
+    def __init__(self, model: TemporalNet):
+        super(StreamingTemporalNet, self).__init__()
+        self.model = model
+        self.history_sizes = [model._history(d) for d in model.dilations]
+        self.state_sizes = [model.receptive_field - 1] + \
+            [conv.in_channels * size for conv, size in zip(model.convs, self.history_sizes)]
+        self.state_size = sum(self.state_sizes)
+
+    def initial_state(self, batch_size: int = 1) -> torch.Tensor:
+        """
+        State to start a stream from (or restart it when tracking is lost): empty histories.
+        """
+        return torch.zeros(batch_size, self.state_size)
+
+    def forward(self, frame, state):
+        parts = torch.split(state, self.state_sizes, dim=1)
+        squared_norms = torch.cat([parts[0], (frame * frame).sum(dim=1, keepdim=True)], dim=1)
+        h = frame.unsqueeze(2)
+        next_state = [squared_norms[:, 1:]]
+        for i, (conv, history) in enumerate(zip(self.model.convs, parts[1:])):
+            window = torch.cat([history.reshape(frame.shape[0], conv.in_channels, -1), h], dim=2)
+            y = self.model.act(conv(window))
+            next_state.append(window[:, :, 1:].reshape(frame.shape[0], -1))
+            h = y if i == 0 else h + y
+        return self.model.classify(h[:, :, -1], squared_norms), torch.cat(next_state, dim=1)
+
+
+def streaming_path(onnx_path: str) -> str:
+    return onnx_path[:-len(".onnx")] + "_stream.onnx" if onnx_path.endswith(".onnx") else onnx_path + "_stream"
+
+
+def export_streaming(model: TemporalNet, path: str, device=torch.device('cpu')) -> str:
+    """
+    Exports the one-frame step with inputs "frame" [1, 3] (gesture_preprocessing.frame_deltas of
+    the newest frame) and "state" [1, state_size] and outputs "output" (logits) and "next_state".
+    """
+    stream = StreamingTemporalNet(model).to(device).eval()
+    dummy = (torch.zeros(1, 3, device=device), torch.zeros(1, stream.state_size, device=device))
+    torch.onnx.export(
+        stream, dummy, path,
+        input_names=["frame", "state"], output_names=["output", "next_state"],
+        verbose=False
+    )
+    embed_weights(path)
+    print(f"Streaming model exported to {path} (state size {stream.state_size})")
+    return path
+
+# =============================================================================
+# Equivalence Check
+# =============================================================================
+def _yaw_quaternions(yaw: np.ndarray) -> np.ndarray:
+    # Unity quaternions (x, y, z, w) for rotations about the up (y) axis
+    return np.stack([np.zeros_like(yaw), np.sin(yaw / 2), np.zeros_like(yaw), np.cos(yaw / 2)], axis=-1)
+
+
+def raw_streams(rows: np.ndarray, num_streams: int = 4, windows_per_stream: int = 8, widths=(0.2, 0.6),
+                head_turn_degrees: float = 0.0, seed: int = 0) -> (np.ndarray, np.ndarray):
+    """
+    HandBuffer-style raw streams from recorded gesture windows: world positions [S, L, 3] in
+    metres and head rotations [S, L, 4] (x, y, z, w). Each window is scaled to a random bounding
+    width in `widths`, taken from head space into world space by the head rotation at each frame
+    and chained on to the end of the previous window. The head faces a random direction and turns
+    by up to head_turn_degrees about the up axis per frame.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(rows, dtype=np.float64)
+    rows = rows[np.isfinite(rows).all(axis=1)]
+    window = rows.shape[1] // 3
+    picks = rng.integers(0, rows.shape[0], (num_streams, windows_per_stream))
+    points = rows[picks].reshape(num_streams, windows_per_stream, window, 3)
+    scale = rng.uniform(*widths, (num_streams, windows_per_stream, 1, 1))
+    # Head-space movement of every frame, [S, L - 1, 3]
+    deltas = ((points[:, :, 1:] - points[:, :, :-1]) * scale).reshape(num_streams, -1, 3)
+    length = deltas.shape[1] + 1
+
+    turn = np.radians(head_turn_degrees) * rng.uniform(-1, 1, (num_streams, length))
+    yaw = rng.uniform(-np.pi, np.pi, (num_streams, 1)) + np.cumsum(turn, axis=1)
+    cos, sin = np.cos(yaw[:, 1:]), np.sin(yaw[:, 1:])
+    # Unity's yaw rotation: x' = x cos + z sin, z' = -x sin + z cos
+    world = np.stack([deltas[..., 0] * cos + deltas[..., 2] * sin, deltas[..., 1],
+                      -deltas[..., 0] * sin + deltas[..., 2] * cos], axis=-1)
+    start = np.array([0.2, 1.3, 0.3]) + rng.uniform(-0.2, 0.2, (num_streams, 1, 3))
+    positions = np.concatenate([start, start + np.cumsum(world, axis=1)], axis=1)
+    return positions.astype(np.float32), _yaw_quaternions(yaw).astype(np.float32)
+
+
+def check_streaming(model: TemporalNet, positions: np.ndarray, rotations: np.ndarray, onnx_path: str = None,
+                    tolerance: float = 1e-4) -> dict:
+    """
+    Runs raw streams (positions [S, L, 3], head rotations [S, L, 4], see raw_streams) through the
+    per-frame preprocessing (gesture_preprocessing.frame_deltas) and the streaming step frame by
+    frame (PyTorch, and the ONNX graph at onnx_path if given). From the first full window on, each
+    output is compared with the full-window model on the same deltas, and with the full-window
+    model on the recorder's preprocessing of the last T positions (run_all_transformations with
+    the current head rotation, what the model is trained on). Returns the largest differences,
+    the argmax agreement, the per-call latency of both forms and "passed": every logit within
+    tolerance. A turning head legitimately changes the deltas against the recorder's single head
+    rotation, so the recorder comparison only counts towards "passed" when the head keeps still.
+    """
+    from gesture_preprocessing import frame_deltas, run_all_transformations
+
+    model = model.cpu().eval()
+    stream = StreamingTemporalNet(model).eval()
+    num_streams, length, _ = positions.shape
+    window = model.window
+    deltas = torch.from_numpy(frame_deltas(positions, rotations))
+    session = None
+    if onnx_path is not None:
+        import onnxruntime as ort
+        session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+    report = {"streams": num_streams, "frames": length, "window": window, "state_size": stream.state_size,
+              "max_abs_diff": 0.0, "recorded_max_abs_diff": 0.0, "agreement": 0.0, "recorded_agreement": 0.0}
+    if session is not None:
+        report["onnx_max_abs_diff"] = 0.0
+    compared, agreeing, recorded_agreeing, step_seconds = 0, 0, 0, 0.0
+    with torch.no_grad():
+        # Full-window references for every tick with a complete window, [S, length - window + 1, C]
+        delta_windows = deltas.unfold(1, window - 1, 1)
+        reference = model.forward_deltas(delta_windows.reshape(-1, 3, window - 1)).reshape(
+            num_streams, delta_windows.shape[1], -1)
+        raw_windows = np.lib.stride_tricks.sliding_window_view(positions, window, axis=1).transpose(0, 1, 3, 2)
+        recorded = torch.from_numpy(run_all_transformations(
+            raw_windows.reshape(-1, window, 3), rotations[:, window - 1:].reshape(-1, 4)))
+        recorded = model(recorded).reshape(num_streams, raw_windows.shape[1], -1)
+        # Latency of the full-window model at batch size 1, as GestureDetector runs it every tick
+        ticks = torch.from_numpy(run_all_transformations(raw_windows[0, :200], rotations[0, window - 1:window + 199]))
+        window_start = time.perf_counter()
+        for i in range(ticks.shape[0]):
+            model(ticks[i:i + 1])
+        window_seconds = (time.perf_counter() - window_start) / ticks.shape[0]
+
+        for s in range(num_streams):
+            state = stream.initial_state()
+            onnx_state = state.numpy()
+            for t in range(length - 1):
+                frame = deltas[s, t:t + 1]
+                start = time.perf_counter()
+                logits, state = stream(frame, state)
+                step_seconds += time.perf_counter() - start
+                if session is not None:
+                    onnx_logits, onnx_state = session.run(None, {"frame": frame.numpy(), "state": onnx_state})
+                if t < window - 2:
+                    continue
+                expected, from_recorded = reference[s, t - window + 2], recorded[s, t - window + 2]
+                report["max_abs_diff"] = max(report["max_abs_diff"], (logits[0] - expected).abs().max().item())
+                report["recorded_max_abs_diff"] = max(report["recorded_max_abs_diff"],
+                                                      (logits[0] - from_recorded).abs().max().item())
+                if session is not None:
+                    report["onnx_max_abs_diff"] = max(report["onnx_max_abs_diff"],
+                                                      float(np.abs(onnx_logits[0] - expected.numpy()).max()))
+                agreeing += int(logits[0].argmax() == expected.argmax())
+                recorded_agreeing += int(logits[0].argmax() == from_recorded.argmax())
+                compared += 1
+    still_head = bool((rotations == rotations[:, :1]).all())
+    report["agreement"] = agreeing / max(compared, 1)
+    report["recorded_agreement"] = recorded_agreeing / max(compared, 1)
+    report["compared"] = compared
+    report["still_head"] = still_head
+    report["step_ms"] = 1000 * step_seconds / (num_streams * (length - 1))
+    report["window_ms"] = 1000 * window_seconds
+    report["tolerance"] = tolerance
+    checked = [report["max_abs_diff"], report.get("onnx_max_abs_diff", 0.0)] + \
+        ([report["recorded_max_abs_diff"]] if still_head else [])
+    report["passed"] = max(checked) <= tolerance
+    print(f"Streaming vs full-window over {compared} ticks: max abs diff {report['max_abs_diff']:.2e}"
+          + (f" (ONNX {report['onnx_max_abs_diff']:.2e})" if session is not None else "")
+          + f", argmax agreement {100 * report['agreement']:.2f}%")
+    print(f"Streaming vs recorder preprocessing ({'still' if still_head else 'turning'} head): max abs diff "
+          f"{report['recorded_max_abs_diff']:.2e}, argmax agreement {100 * report['recorded_agreement']:.2f}%")
+    print(f"{report['step_ms']:.3f} ms per streaming step vs {report['window_ms']:.3f} ms per full window (PyTorch)")
+    print(f"{'Within' if report['passed'] else 'NOT within'} the tolerance of {tolerance:.0e}")
+    return report
+
+
+def check_checkpoint(json_path: str, onnx_path: str, num_streams: int = 4, windows_per_stream: int = 8,
+                     tolerance: float = 1e-4, head_turn_degrees: float = 0.0) -> dict:
+    """
+    Rebuilds the temporal model from the checkpoint next to onnx_path and runs check_streaming on
+    raw streams built from recorded gesture windows, through the *_stream.onnx graph as well when
+    it exists.
+    """
+    from data_cache import load_section
+    from warm_start import checkpoint_path, load_checkpoint
+
+    checkpoint = load_checkpoint(checkpoint_path(onnx_path))
+    if checkpoint is None:
+        raise FileNotFoundError(f"No checkpoint for {onnx_path}, train the temporal model first")
+    fingerprint = checkpoint["fingerprint"]
+    model = TemporalNet(fingerprint["input_size"], len(fingerprint["classes"]))
+    if set(model.state_dict()) != set(checkpoint["state_dict"]):
+        raise ValueError(f"{checkpoint_path(onnx_path)} is from an earlier TemporalNet, retrain the temporal model")
+    model.load_state_dict(checkpoint["state_dict"])
+    inputs, _, _ = load_section(json_path, "gestures")
+    positions, rotations = raw_streams(inputs, num_streams, windows_per_stream, head_turn_degrees=head_turn_degrees)
+    stream_onnx = streaming_path(onnx_path)
+    return check_streaming(model, positions, rotations, stream_onnx if os.path.exists(stream_onnx) else None,
+                           tolerance)
+
+
+# =============================================================================
+# Main Function
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Check a trained temporal gesture model's streaming export")
+    parser.add_argument("--data", default="PoseGestureData.json")
+    parser.add_argument("--model", default="models/model_gestures_temporal.onnx", help="Full-window ONNX path")
+    parser.add_argument("--streams", type=int, default=4)
+    parser.add_argument("--windows", type=int, default=8, help="Recorded windows chained per stream")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Largest allowed logit difference")
+    parser.add_argument("--head-turn", type=float, default=0.0, help="Largest head turn per frame in degrees")
+    args = parser.parse_args()
+    try:
+        report = check_checkpoint(args.data, args.model, args.streams, args.windows, args.tolerance, args.head_turn)
+    except (FileNotFoundError, ValueError) as error:
+        raise SystemExit(str(error))
+    if not report["passed"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
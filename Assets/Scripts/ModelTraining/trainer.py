@@ -0,0 +1,196 @@
+import copy
+import json
+import os
+import time
+import torch
+import torch.nn as nn
+from data_cache import stratified_split
+from instrumentation import NullMonitor
+
+# Shared training loop for the pose and gesture models
+#
+# The datasets are small fixed-size feature vectors that fit in memory, so the whole dataset
+# is kept as one tensor on the training device. Each epoch shuffles it with a single index
+# permutation, batches are contiguous slices (views, no copies), and loss/accuracy are
+# accumulated on the device and read back at most once per epoch.
+
+
+def select_device(name: str = None) -> torch.device:
+    """
+    The named device, or CUDA when it is available and the CPU otherwise.
+    """
+    return torch.device(name if name else 'cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def _has_batch_norm(model: nn.Module) -> bool:
+    return any(isinstance(m, nn.modules.batchnorm._BatchNorm) for m in model.modules())
+
+
+def split_tensors(inputs: torch.Tensor, labels: torch.Tensor, val_fraction: float = 0.2, seed: int = 0):
+    """
+    Stratified train/validation split by class label (poseGestureIndex).
+    Returns ((train_inputs, train_labels), (val_inputs, val_labels)).
+    """
+    train_idx, val_idx = stratified_split(labels.numpy(), val_fraction, seed)
+    train_idx, val_idx = torch.from_numpy(train_idx), torch.from_numpy(val_idx)
+    return (inputs[train_idx], labels[train_idx]), (inputs[val_idx], labels[val_idx])
+
+
+def evaluate(model: nn.Module, inputs: torch.Tensor, labels: torch.Tensor, criterion):
+    """
+    Returns the (loss, number of correct predictions) of the model as device tensors.
+    """
+    model.eval()
+    with torch.no_grad():
+        outputs = model(inputs)
+        return criterion(outputs, labels), (outputs.argmax(dim=1) == labels).sum()
+
+
+def log_run(log_path: str, summary: dict):
+    """
+    Appends a training run summary to a JSON lines file.
+    """
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(summary) + "\n")
+
+
+def fit(model: nn.Module, inputs: torch.Tensor, labels: torch.Tensor, criterion, optimizer, device,
+        num_epochs: int = 200, batch_size: int = 32, shuffle: bool = True, log_every: int = 10,
+        val_data=None, patience: int = None, min_delta: float = 0.0, run_name: str = None, log_path: str = None,
+        augment=None, aux=None, monitor=None, sample_weights=None):
+    """
+    Trains the given model on in-memory inputs and labels using the provided loss criterion and optimizer.
+
+    With val_data=(val_inputs, val_labels) the validation loss is tracked every epoch, training
+    stops after `patience` epochs without improvement and the best weights are restored. An empty
+    validation set (val_fraction 0, or only classes too small to split) is treated as none.
+    With augment (e.g. an augmentation.AugmentedStream over the same inputs) each epoch trains on
+    augment.next_epoch(), a fresh augmented copy of the inputs whose rows line up with the labels.
+    With aux (per-sample auxiliary targets such as cached teacher logits) the training loss is
+    criterion(outputs, labels, aux); validation still calls criterion(outputs, labels).
+    With monitor (an instrumentation.TrainingMonitor) phase timings, throughput and memory are
+    recorded every epoch.
+    With sample_weights (one non-negative weight per sample, e.g. from curation.sample_weights) each
+    epoch draws num_samples rows with replacement in proportion to the weights instead of a
+    permutation, so classes can be balanced and near-duplicates skipped without rewriting the data.
+    Returns the model and a summary of the run (epochs, best epoch, timings).
+    """
+    start_time = time.perf_counter()
+    model.to(device)
+    inputs = inputs.to(device)
+    labels = labels.to(device)
+    if aux is not None:
+        aux = aux.to(device)
+    if sample_weights is not None:
+        sample_weights = torch.as_tensor(sample_weights, dtype=torch.float32).to(device)
+        if not sample_weights.sum() > 0:
+            print("All sample weights are 0, shuffling uniformly")
+            sample_weights = None
+    num_samples = inputs.shape[0]
+    if val_data is not None and val_data[1].shape[0] == 0:
+        print("Validation set is empty, training without validation or early stopping")
+        val_data = None
+    if val_data is not None:
+        val_inputs, val_labels = val_data[0].to(device), val_data[1].to(device)
+
+    # BatchNorm can't train on a trailing batch of a single sample, so that sample sits the epoch out
+    usable = num_samples - 1 if num_samples % batch_size == 1 and num_samples > 1 and _has_batch_norm(model) \
+        else num_samples
+    num_batches = (usable + batch_size - 1) // batch_size
+    monitor = monitor or NullMonitor()
+    monitor.on_train_start(run_name, model, device, num_samples, batch_size)
+
+    best_val_loss = float('inf')
+    best_epoch = 0
+    best_state = None
+    epochs_run = 0
+    for epoch in range(num_epochs):
+        monitor.on_epoch_start(epoch)
+        model.train()
+        with monitor.phase("data"):
+            if augment is not None:
+                inputs = augment.next_epoch().to(device, non_blocking=True)
+            if shuffle:
+                order = torch.multinomial(sample_weights, num_samples, replacement=True) \
+                    if sample_weights is not None else torch.randperm(num_samples, device=device)
+                epoch_inputs, epoch_labels = inputs[order], labels[order]
+                epoch_aux = aux[order] if aux is not None else None
+            else:
+                epoch_inputs, epoch_labels, epoch_aux = inputs, labels, aux
+
+        running_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.int64, device=device)
+        for start in range(0, usable, batch_size):
+            inputs_batch = epoch_inputs[start:start + batch_size]
+            labels_batch = epoch_labels[start:start + batch_size]
+
+            with monitor.phase("forward"):
+                outputs = model(inputs_batch)
+                if epoch_aux is not None:
+                    loss = criterion(outputs, labels_batch, epoch_aux[start:start + batch_size])
+                else:
+                    loss = criterion(outputs, labels_batch)
+                running_loss += loss.detach()
+                correct += (outputs.argmax(dim=1) == labels_batch).sum()
+            with monitor.phase("backward"):
+                loss.backward()
+            with monitor.phase("optimizer"):
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+        epochs_run = epoch + 1
+        should_log = log_every and ((epoch + 1) % log_every == 0 or epoch == 0)
+
+        if val_data is not None:
+            with monitor.phase("validation"):
+                val_loss, val_correct = evaluate(model, val_inputs, val_labels, criterion)
+                # Single host sync per epoch
+                epoch_loss, epoch_correct, val_loss, val_correct = torch.stack([
+                    running_loss / num_batches, correct.to(running_loss.dtype), val_loss, val_correct.to(val_loss.dtype)
+                ]).tolist()
+                if val_loss < best_val_loss - min_delta:
+                    best_val_loss, best_epoch = val_loss, epoch + 1
+                    best_state = copy.deepcopy(model.state_dict())
+            monitor.on_epoch_end(epoch, usable, epoch_loss, epoch_correct, val_loss, val_correct, val_labels.shape[0])
+            if should_log:
+                print(f'Epoch [{epoch + 1}/{num_epochs}] Loss: {epoch_loss:.4f} Accuracy: {100 * epoch_correct / usable:.2f}% '
+                      f'Val Loss: {val_loss:.4f} Val Accuracy: {100 * val_correct / val_labels.shape[0]:.2f}%')
+            if patience is not None and epoch + 1 - best_epoch >= patience:
+                print(f'Early stopping at epoch {epoch + 1}, no improvement since epoch {best_epoch}')
+                break
+        else:
+            monitor.on_epoch_end(epoch, usable, running_loss / num_batches, correct)
+            if should_log:
+                epoch_loss, epoch_correct = torch.stack([running_loss / num_batches, correct.to(running_loss.dtype)]).tolist()
+                print(f'Epoch [{epoch + 1}/{num_epochs}] Loss: {epoch_loss:.4f} Accuracy: {100 * epoch_correct / usable:.2f}%')
+
+    summary = {
+        "run": run_name,
+        "max_epochs": num_epochs,
+        "epochs_run": epochs_run,
+        "seconds": time.perf_counter() - start_time
+    }
+    summary["seconds_per_epoch"] = summary["seconds"] / max(epochs_run, 1)
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        val_loss, val_correct = evaluate(model, val_inputs, val_labels, criterion)
+        summary.update({
+            "best_epoch": best_epoch,
+            "best_val_loss": best_val_loss,
+            "val_accuracy": val_correct.item() / val_labels.shape[0]
+        })
+        print(f'Restored best weights from epoch {best_epoch} '
+              f'(Val Loss: {best_val_loss:.4f} Val Accuracy: {100 * summary["val_accuracy"]:.2f}%)')
+    monitor.on_train_end(summary)
+    print(f'Finished Training: {epochs_run}/{num_epochs} epochs in {summary["seconds"]:.1f}s')
+    if log_path:
+        log_run(log_path, summary)
+    return model, summary
+
+
+def train_model(model: nn.Module, inputs: torch.Tensor, labels: torch.Tensor, criterion, optimizer, device,
+                num_epochs: int = 200, batch_size: int = 32, **kwargs):
+    """
+    Trains the model and returns it, see fit() for the optional validation and early stopping arguments.
+    """
+    return fit(model, inputs, labels, criterion, optimizer, device, num_epochs, batch_size, **kwargs)[0]
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+from data_cache import load_section, stratified_split
+
+# Incremental retraining from the previous run's checkpoint
+#
+# Every trained model is saved as <model>.pt next to its ONNX export together with a fingerprint
+# of the data it saw: per class its name, index, row range and a hash of its rows. On the next run
+# the fingerprint tells which rows were appended since (DataInterface's "enhance" appends rows to a
+# class, "retrain" replaces them) and which classes were added, removed or renumbered. The model
+# then resumes from the checkpoint, the output layer is remapped by class name, and it is fine-tuned
+# on the new rows plus a replayed sample of the old ones instead of being trained from scratch.
+# The fingerprint also records each class' validation rows, so a warm run keeps validating on rows
+# the model has never trained on.
+
+
+def checkpoint_path(onnx_path: str) -> str:
+    return os.path.splitext(onnx_path)[0] + ".pt"
+
+
+def _rows_sha256(rows: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(rows).tobytes()).hexdigest()
+
+
+def data_fingerprint(json_path: str, section: str) -> dict:
+    """
+    Describes the section's data per class so later runs can tell what changed.
+    """
+    inputs, _, section_meta = load_section(json_path, section)
+    classes = []
+    for info in section_meta["classes"]:
+        rows = inputs[info["start"]:info["start"] + info["count"]]
+        classes.append({"name": info["name"], "index": info["index"], "start": info["start"],
+                        "count": info["count"], "sha256": _rows_sha256(rows)})
+    return {"section": section, "input_size": section_meta["input_size"], "classes": classes}
+
+
+# =============================================================================
+# Checkpoints
+# =============================================================================
+def save_checkpoint(model: nn.Module, path: str, fingerprint: dict, summary: dict = None):
+    torch.save({
+        "model_class": type(model).__name__,
+        "state_dict": {name: tensor.cpu() for name, tensor in model.state_dict().items()},
+        "fingerprint": fingerprint,
+        "summary": summary
+    }, path)
+    print(f"Checkpoint saved to {path}")
+
+
+def load_checkpoint(path: str):
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu", weights_only=True)
+
+
+def _output_layer(model: nn.Module) -> str:
+    """
+    Name of the final Linear layer, whose rows correspond to the classes.
+    """
+    return [name for name, module in model.named_modules() if isinstance(module, nn.Linear)][-1]
+
+
+def resume_model(model: nn.Module, checkpoint: dict, fingerprint: dict) -> bool:
+    """
+    Loads the checkpoint weights into a freshly built model for the current classes.
+    Output rows are copied over by class name; rows of new classes keep their fresh initialisation.
+    Returns False (leaving the model untouched) when the architecture or input size differs.
+    """
+    old_fingerprint = checkpoint["fingerprint"]
+    if checkpoint["model_class"] != type(model).__name__ or \
+            old_fingerprint["input_size"] != fingerprint["input_size"]:
+        return False
+
+    output = _output_layer(model)
+    state = model.state_dict()
+    old_state = checkpoint["state_dict"]
+    if set(state) != set(old_state):
+        return False
+    for name, tensor in state.items():
+        if not name.startswith(output + ".") and tensor.shape != old_state[name].shape:
+            return False
+
+    old_index = {info["name"]: info["index"] for info in old_fingerprint["classes"]}
+    resumed = {name: tensor for name, tensor in old_state.items() if not name.startswith(output + ".")}
+    for name in (f"{output}.weight", f"{output}.bias"):
+        rows = state[name].clone()
+        for info in fingerprint["classes"]:
+            if info["name"] in old_index and old_index[info["name"]] < old_state[name].shape[0]:
+                rows[info["index"]] = old_state[name][old_index[info["name"]]]
+        resumed[name] = rows
+    model.load_state_dict(resumed)
+
+    added = [info["name"] for info in fingerprint["classes"] if info["name"] not in old_index]
+    removed = sorted(set(old_index) - {info["name"] for info in fingerprint["classes"]})
+    print(f"Resumed {type(model).__name__} from checkpoint"
+          + (f", new classes: {added}" if added else "") + (f", removed classes: {removed}" if removed else ""))
+    return True
+
+
+# =============================================================================
+# Fine-tuning Data
+# =============================================================================
+def new_rows(json_path: str, old_fingerprint: dict, fingerprint: dict) -> np.ndarray:
+    """
+    Boolean mask over the section's rows marking rows the checkpoint was not trained on.
+    A class whose earlier rows still hash the same only contributes its appended rows,
+    otherwise (new or re-recorded class) all of its rows are new.
+    """
+    inputs, _, _ = load_section(json_path, fingerprint["section"])
+    old_classes = {info["name"]: info for info in old_fingerprint["classes"]}
+    mask = np.zeros(inputs.shape[0], dtype=bool)
+    for info in fingerprint["classes"]:
+        start, count = info["start"], info["count"]
+        old = old_classes.get(info["name"])
+        if old is not None and old["count"] <= count and \
+                _rows_sha256(inputs[start:start + old["count"]]) == old["sha256"]:
+            mask[start + old["count"]:start + count] = True
+        else:
+            mask[start:start + count] = True
+    return mask
+
+
+def _split_offsets(count: int, val_fraction: float, rng, keep_train: bool) -> np.ndarray:
+    # Validation offsets among count rows of one class, rounded like stratified_split
+    num_val = int(round(count * val_fraction))
+    if keep_train:
+        num_val = min(num_val, count - 1)
+    return np.sort(rng.choice(count, max(num_val, 0), replace=False))
+
+
+def record_split(fingerprint: dict, val_idx: np.ndarray):
+    """
+    Stores the validation rows of every class in the fingerprint (offsets within the class), so
+    later runs keep validating on rows the model was never trained on.
+    """
+    for info in fingerprint["classes"]:
+        start, count = info["start"], info["count"]
+        in_class = val_idx[(val_idx >= start) & (val_idx < start + count)]
+        info["val_rows"] = (in_class - start).tolist()
+
+
+def persistent_split(old_fingerprint: dict, fingerprint: dict, new_mask: np.ndarray, val_fraction: float = 0.2,
+                     seed: int = 0):
+    """
+    Validation split that keeps the checkpoint's: rows seen before stay in the set they were in and
+    only rows new to the model (appended, or in new and re-recorded classes) are split, per class.
+    Returns (train_idx, val_idx), or None when the checkpoint has no recorded split.
+    """
+    old_classes = {info["name"]: info for info in old_fingerprint["classes"]}
+    if any("val_rows" not in info for info in old_classes.values()):
+        return None
+    rng = np.random.default_rng(seed)
+    is_val = np.zeros(new_mask.shape[0], dtype=bool)
+    for info in fingerprint["classes"]:
+        start, count = info["start"], info["count"]
+        old = old_classes.get(info["name"])
+        if old is not None and not new_mask[start:start + old["count"]].any() and old["count"] <= count:
+            is_val[start + np.asarray(old["val_rows"], dtype=np.int64)] = True
+            appended = count - old["count"]
+            is_val[start + old["count"] + _split_offsets(appended, val_fraction, rng, False)] = True
+        else:
+            is_val[start + _split_offsets(count, val_fraction, rng, True)] = True
+    return np.flatnonzero(~is_val), np.flatnonzero(is_val)
+
+
+def checkpoint_split(checkpoint: dict, json_path: str, fingerprint: dict, labels: np.ndarray,
+                     val_fraction: float = 0.2, seed: int = 0):
+    """
+    The validation split of the model in the checkpoint over the current data: its recorded
+    validation rows stay held out and only rows new to it are split (see persistent_split).
+    Checkpoints without a recorded split fall back to a fresh stratified split with a warning.
+    Returns (train_idx, val_idx, new_mask).
+    """
+    mask = new_rows(json_path, checkpoint["fingerprint"], fingerprint)
+    split = persistent_split(checkpoint["fingerprint"], fingerprint, mask, val_fraction, seed)
+    if split is None:
+        # Checkpoints from before the split was recorded: the old rows' assignment is unknown
+        print("Checkpoint has no recorded validation split, validation may include rows it was trained on")
+        split = stratified_split(labels, val_fraction, seed)
+    return split[0], split[1], mask
+
+
+def fine_tune_split(labels: np.ndarray, new_mask: np.ndarray, train_idx: np.ndarray, replay_per_class: int = 32,
+                    seed: int = 0) -> np.ndarray:
+    """
+    Cuts the training indices down to the new rows plus up to replay_per_class previously seen
+    rows of each class, so old classes aren't forgotten.
+    """
+    rng = np.random.default_rng(seed)
+    replay = []
+    old_train = train_idx[~new_mask[train_idx]]
+    for label in np.unique(labels[old_train]):
+        candidates = old_train[labels[old_train] == label]
+        replay.append(rng.choice(candidates, min(replay_per_class, candidates.shape[0]), replace=False))
+    return np.sort(np.concatenate([train_idx[new_mask[train_idx]]] + replay))
+
+
+def prepare(model: nn.Module, onnx_path: str, json_path: str, section: str, labels: torch.Tensor,
+            val_fraction: float = 0.2, replay_per_class: int = 32, seed: int = 0, resume: bool = True):
+    """
+    Resumes the model from the checkpoint next to onnx_path when resume is set and the checkpoint
+    fits the current data. Returns (warm, train_idx, val_idx, fingerprint); for a cold start the
+    indices are the full split. The validation rows are recorded in the fingerprint, and a warm
+    start keeps the checkpoint's validation rows and only splits the new ones.
+    """
+    fingerprint = data_fingerprint(json_path, section)
+    labels = labels.numpy()
+    checkpoint = load_checkpoint(checkpoint_path(onnx_path)) if resume else None
+    if checkpoint is None or not resume_model(model, checkpoint, fingerprint):
+        train_idx, val_idx = stratified_split(labels, val_fraction, seed)
+        record_split(fingerprint, val_idx)
+        return False, train_idx, val_idx, fingerprint
+
+    train_idx, val_idx, mask = checkpoint_split(checkpoint, json_path, fingerprint, labels, val_fraction, seed)
+    record_split(fingerprint, val_idx)
+    if not mask.any():
+        print("Data unchanged since the checkpoint")
+        return True, np.zeros(0, dtype=np.int64), val_idx, fingerprint
+    train_idx = fine_tune_split(labels, mask, train_idx, replay_per_class, seed)
+    print(f"Fine-tuning on {int(mask.sum())} new rows with {train_idx.shape[0]} training samples in total")
+    return True, train_idx, val_idx, fingerprint